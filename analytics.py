@@ -0,0 +1,283 @@
+"""
+📊 季度穩定性分析
+- 由交易紀錄 (回測 trades 或實盤 trade_log 的 EXIT_REAL) 或權益曲線計算
+  最佳參數組合.json 中的指標：獲利季度、獲利一致性、平均勝率、年化收益率、最大回撤、風險調整回報、穩定性評分
+- 季度分組以 numpy 向量化完成 (時間 → 季度序號 → bincount / reduceat)，不逐筆迴圈
+- score_equity_batch 以 (候選數, K線數) 矩陣一次計算所有掃描候選的權益類指標 (分批控制記憶體)
+
+穩定性評分 (滿分 60，三項各 20 分)：
+- 獲利一致性 × 20
+- 風險調整回報 (年化收益率 / 最大回撤) 達 RAR_FULL_SCORE 得滿分
+- 季度報酬平均 / 標準差 達 QUARTER_SHARPE_FULL_SCORE 得滿分
+(最佳參數組合.json 的數值為早期手動整理，公式不同，不能直接比較)
+
+用法: python analytics.py <4小時K線CSV>        (回測後輸出季度指標)
+      python analytics.py --trade-log <JSON>   (實盤 trade_log 列表)
+"""
+
+import json
+import sys
+
+import numpy as np
+
+STABILITY_COMPONENT_MAX = 20.0
+RAR_FULL_SCORE = 5.0  # 年化收益率 / 最大回撤 達此值得滿分
+QUARTER_SHARPE_FULL_SCORE = 2.0  # 季度報酬 平均 / 標準差 達此值得滿分
+BATCH_ROWS = 512  # score_equity_batch 每批處理的候選數
+
+
+def to_datetime64(times):
+    """毫秒整數、datetime、pandas Timestamp 或 ISO 字串 → datetime64[ms] 陣列"""
+    array = np.asarray(times)
+    if array.dtype.kind in "iu":
+        return array.astype("int64").view("datetime64[ms]")
+    if array.dtype.kind == "M":
+        return array.astype("datetime64[ms]")
+    return np.array([np.datetime64(str(t).replace("Z", "")[:23], "ms") for t in array.ravel()]).reshape(array.shape)
+
+
+def quarter_index(times):
+    """季度序號 (1970Q1 = 0)"""
+    months = to_datetime64(times).astype("datetime64[M]").astype("int64")
+    return months // 3
+
+
+def quarter_label(index):
+    return f"{1970 + int(index) // 4}Q{int(index) % 4 + 1}"
+
+
+def trades_from_log(entries):
+    """
+    回測 trades (exit_time / pnl) 或實盤 trade_log (type == EXIT_REAL: time / profit_loss)
+    → (平倉時間 datetime64[ms] 陣列, 損益陣列)
+    """
+    times, pnl = [], []
+    for entry in entries:
+        if "type" in entry and entry["type"] != "EXIT_REAL":
+            continue
+        time_ = entry.get("exit_time", entry.get("time"))
+        value = entry.get("pnl", entry.get("profit_loss"))
+        if time_ is None or value is None:
+            continue
+        times.append(time_)
+        pnl.append(float(value))
+    if not times:
+        return np.empty(0, dtype="datetime64[ms]"), np.empty(0)
+    return to_datetime64(times), np.asarray(pnl, dtype=np.float64)
+
+
+# --- 季度彙總 ---
+class QuarterlyStats:
+    __slots__ = ("first_quarter", "pnl", "returns", "trades", "wins")
+
+    def __init__(self, first_quarter, pnl, returns, trades=None, wins=None):
+        self.first_quarter = first_quarter
+        self.pnl = pnl  # 每季損益
+        self.returns = returns  # 每季報酬率 (相對季初權益)
+        self.trades = trades  # 每季交易次數 (權益曲線來源時為 None)
+        self.wins = wins
+
+    def __len__(self):
+        return len(self.returns)
+
+    @property
+    def labels(self):
+        return [quarter_label(self.first_quarter + i) for i in range(len(self))]
+
+    @property
+    def profitable(self):
+        return int(np.sum(self.pnl > 0))
+
+    @property
+    def consistency(self):
+        return self.profitable / len(self) if len(self) else 0.0
+
+    @property
+    def average_win_rate(self):
+        """有交易的季度各自勝率的平均"""
+        if self.trades is None:
+            return None
+        traded = self.trades > 0
+        if not traded.any():
+            return 0.0
+        return float(np.mean(self.wins[traded] / self.trades[traded]))
+
+    def to_dict(self):
+        rows = []
+        for i, label in enumerate(self.labels):
+            row = {"季度": label, "損益": round(float(self.pnl[i]), 2), "報酬率": f"{self.returns[i] * 100:.2f}%"}
+            if self.trades is not None:
+                row["交易次數"] = int(self.trades[i])
+                row["勝率"] = f"{self.wins[i] / self.trades[i] * 100:.2f}%" if self.trades[i] else "N/A"
+            rows.append(row)
+        return rows
+
+
+def _quarter_range(quarters, start=None, end=None):
+    first = int(quarter_index([start])[0]) if start is not None else int(quarters.min())
+    last = int(quarter_index([end])[0]) if end is not None else int(quarters.max())
+    return first, last - first + 1
+
+
+def quarterly_from_trades(times, pnl, initial_capital, start=None, end=None):
+    """
+    以平倉時間把交易分到季度；start / end 指定分析期間 (沒有交易的季度也計入，損益為 0)
+    """
+    times = to_datetime64(times)
+    pnl = np.asarray(pnl, dtype=np.float64)
+    if len(times) == 0 and (start is None or end is None):
+        return QuarterlyStats(0, np.zeros(0), np.zeros(0), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    quarters = quarter_index(times)
+    first, count = _quarter_range(quarters, start, end)
+    inside = (quarters >= first) & (quarters < first + count)
+    offset = quarters[inside] - first
+    quarter_pnl = np.bincount(offset, weights=pnl[inside], minlength=count)
+    trades = np.bincount(offset, minlength=count)
+    wins = np.bincount(offset, weights=(pnl[inside] > 0).astype(np.float64), minlength=count).astype(np.int64)
+    start_capital = initial_capital + np.concatenate([[0.0], np.cumsum(quarter_pnl)[:-1]])
+    return QuarterlyStats(first, quarter_pnl, quarter_pnl / start_capital, trades, wins)
+
+
+def quarterly_from_equity(times, equity):
+    """權益曲線 (逐根K線) → 每季損益與報酬率 (季初權益為上一季最後一根，第一季為第一根)"""
+    equity = np.asarray(equity, dtype=np.float64)
+    quarters = quarter_index(times)
+    last = np.flatnonzero(np.r_[np.diff(quarters) != 0, True])
+    end_values = equity[last]
+    start_values = np.concatenate([[equity[0]], end_values[:-1]])
+    return QuarterlyStats(int(quarters[0]), end_values - start_values, end_values / start_values - 1)
+
+
+# --- 指標 ---
+def max_drawdown(equity):
+    equity = np.asarray(equity, dtype=np.float64)
+    if len(equity) == 0:
+        return 0.0
+    peaks = np.maximum.accumulate(equity)
+    return float(np.max((peaks - equity) / peaks))
+
+
+def stability_score(consistency, risk_adjusted, quarter_sharpe):
+    """三項指標換算為 0~60 分 (純量或陣列皆可)"""
+    return STABILITY_COMPONENT_MAX * (
+        np.asarray(consistency)
+        + np.clip(np.asarray(risk_adjusted) / RAR_FULL_SCORE, 0, 1)
+        + np.clip(np.asarray(quarter_sharpe) / QUARTER_SHARPE_FULL_SCORE, 0, 1)
+    )
+
+
+def _quarter_sharpe(returns):
+    if len(returns) < 2:
+        return 0.0
+    std = np.std(returns, ddof=1)
+    return float(np.mean(returns) / std) if std > 0 else 0.0
+
+
+def analyze(quarterly, initial_capital, drawdown, trade_count=None):
+    """由季度彙總與最大回撤計算所有指標，回傳與 最佳參數組合.json 相同鍵名的 dict"""
+    total_return = float(np.prod(1 + quarterly.returns) - 1) if len(quarterly) else 0.0
+    years = len(quarterly) / 4
+    annual = (1 + total_return) ** (1 / years) - 1 if years > 0 and total_return > -1 else 0.0
+    risk_adjusted = annual / drawdown if drawdown > 0 else 0.0
+    score = float(stability_score(quarterly.consistency, risk_adjusted, _quarter_sharpe(quarterly.returns)))
+    metrics = {
+        "穩定性評分": round(score, 2),
+        "總獲利": round(float(np.sum(quarterly.pnl)), 2),
+        "獲利率": f"{total_return * 100:.2f}%",
+        "獲利一致性": f"{quarterly.consistency * 100:.2f}%",
+        "獲利季度": f"{quarterly.profitable}/{len(quarterly)}",
+        "年化收益率": f"{annual * 100:.1f}%",
+        "最大回撤": f"{drawdown * 100:.2f}%",
+        "風險調整回報": round(risk_adjusted, 2),
+    }
+    if quarterly.average_win_rate is not None:
+        metrics["平均勝率"] = f"{quarterly.average_win_rate * 100:.2f}%"
+        metrics["總交易次數"] = int(np.sum(quarterly.trades)) if trade_count is None else trade_count
+    return metrics
+
+
+def analyze_trades(entries, initial_capital, start=None, end=None):
+    """交易紀錄 (回測或實盤) → 指標；最大回撤以每筆平倉後的已實現權益計算"""
+    times, pnl = trades_from_log(entries)
+    order = np.argsort(times, kind="stable")
+    times, pnl = times[order], pnl[order]
+    quarterly = quarterly_from_trades(times, pnl, initial_capital, start, end)
+    realized = initial_capital + np.concatenate([[0.0], np.cumsum(pnl)])
+    return analyze(quarterly, initial_capital, max_drawdown(realized))
+
+
+def analyze_backtest(result, times):
+    """
+    回測結果 → 指標；times 為與 result.equity 對應的K線時間 (例如 prepare_buffer(data).times)
+    季度損益以權益曲線計算 (含未平倉盈虧)，勝率與交易次數以交易紀錄計算
+    """
+    times = np.asarray(times)[: len(result.equity)]
+    by_equity = quarterly_from_equity(times, result.equity)
+    by_trades = quarterly_from_trades(*trades_from_log(result.trades), result.initial_capital, times[0], times[-1])
+    by_equity.trades, by_equity.wins = by_trades.trades, by_trades.wins
+    return analyze(by_equity, result.initial_capital, result.max_drawdown, trade_count=len(result.trades))
+
+
+def score_equity_batch(times, equity_matrix, rows_per_batch=BATCH_ROWS):
+    """
+    多個候選的權益曲線 (候選數, K線數；K線時間相同) 一次計算權益類指標
+    回傳 {名稱: 長度為候選數的陣列}：consistency / total_return / annual_return / max_drawdown /
+    risk_adjusted / quarter_sharpe / stability
+    """
+    quarters = quarter_index(times)
+    last = np.flatnonzero(np.r_[np.diff(quarters) != 0, True])
+    years = len(last) / 4
+    parts = []
+    for start in range(0, len(equity_matrix), rows_per_batch):
+        equity = np.asarray(equity_matrix[start : start + rows_per_batch], dtype=np.float64)
+        end_values = equity[:, last]
+        start_values = np.concatenate([equity[:, :1], end_values[:, :-1]], axis=1)
+        returns = end_values / start_values - 1
+        total = equity[:, -1] / equity[:, 0] - 1
+        annual = np.where(total > -1, np.abs(1 + total) ** (1 / years) - 1, -1.0)
+        peaks = np.maximum.accumulate(equity, axis=1)
+        drawdown = np.max((peaks - equity) / peaks, axis=1)
+        std = returns.std(axis=1, ddof=1) if returns.shape[1] > 1 else np.zeros(len(equity))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sharpe = np.where(std > 0, returns.mean(axis=1) / std, 0.0)
+            risk_adjusted = np.where(drawdown > 0, annual / drawdown, 0.0)
+        consistency = np.mean(end_values > start_values, axis=1)
+        parts.append(
+            {
+                "consistency": consistency,
+                "total_return": total,
+                "annual_return": annual,
+                "max_drawdown": drawdown,
+                "risk_adjusted": risk_adjusted,
+                "quarter_sharpe": sharpe,
+                "stability": stability_score(consistency, risk_adjusted, sharpe),
+            }
+        )
+    if not parts:
+        return {}
+    return {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+
+
+def score_sweep(results, times):
+    """run_sweep 的結果 → score_equity_batch 的指標 (依 results 順序)"""
+    n = min(len(r.equity) for r in results)
+    matrix = np.stack([r.equity[:n] for r in results])
+    return score_equity_batch(np.asarray(times)[:n], matrix)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python analytics.py <4小時K線CSV> | --trade-log <JSON>")
+        sys.exit(1)
+    if sys.argv[1] == "--trade-log":
+        with open(sys.argv[2], "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        capital = float(sys.argv[3]) if len(sys.argv) > 3 else 1000.0
+        metrics = analyze_trades(entries, capital)
+    else:
+        from backtest import load_klines_csv, prepare_buffer, run_backtest
+
+        buffer = prepare_buffer(load_klines_csv(sys.argv[1]))
+        metrics = analyze_backtest(run_backtest(buffer), buffer.times)
+    for key, value in metrics.items():
+        print(f"{key}: {value}")
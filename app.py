@@ -1,44 +1,119 @@
 from flask import Flask, request, jsonify
 from pybit.unified_trading import HTTP
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import json
 import os
+import threading
+import time
+
+from logging_config import setup_logging
 
 app = Flask(__name__)
+logger = setup_logging(
+    name="autotrader.webhook",
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    log_file=os.getenv("WEBHOOK_LOG_FILE", "logs/webhook.log"),
+    json_console=os.getenv("LOG_JSON_CONSOLE", "0") == "1",
+)
 
 api_key = os.getenv("BYBIT_API_KEY")
 api_secret = os.getenv("BYBIT_API_SECRET")
 
-session = HTTP(
-    api_key=api_key,
-    api_secret=api_secret,
-    testnet=False  # 若用測試網這邊改成 True
-)
+# 多帳戶設定檔：[{"name": "sub1", "api_key": "...", "api_secret": "...", "qty": 0.05, "rate_per_second": 5}, ...]
+# api_key / api_secret 也可以用 api_key_env / api_secret_env 指定環境變數名稱；檔案不存在時只使用上面的單一帳戶
+ACCOUNTS_FILE = os.getenv("WEBHOOK_ACCOUNTS_FILE", "webhook_accounts.json")
+DEFAULT_QTY = 0.05  # 帳戶未設定 qty 時的下單數量
+DEFAULT_RATE_PER_SECOND = 5  # 每個帳戶每秒最多送出的請求數
+RATE_LIMIT_WAIT_SECONDS = 2  # 超過速率時最多等待的秒數，逾時則改由該帳戶的重試佇列送出
+RATE_LIMIT_MAX_RETRIES = 10  # 重試佇列中每筆訂單最多再等待幾次 (每次 RATE_LIMIT_WAIT_SECONDS)
+FANOUT_WORKERS = int(os.getenv("WEBHOOK_FANOUT_WORKERS", "16"))  # 同時下單的執行緒數
+LATENCY_SAMPLES = 500  # 延遲統計保留的最近筆數
 
-@app.route("/")
-def index():
-    return "Bybit Webhook is running"
 
-@app.route("/webhook", methods=["POST"])
-def webhook():
-    data = request.get_json()
-    print("收到訊號：", data)
+class RateLimiter:
+    """令牌桶：每秒補充 rate 個令牌，最多累積 rate 個 (允許短暫的連續請求)"""
 
-    action = data.get("data", {}).get("action")
-    symbol = data.get("symbol", "ETHUSDT")
-    qty = 0.05
-    side = "Buy" if action in ["buy", "buy_add"] else "Sell"
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, timeout=RATE_LIMIT_WAIT_SECONDS):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
 
+
+class Account:
+    """
+    一個子帳戶：持久的 HTTP session (連線重用)、下單數量與速率限制
+    超過速率的訂單放入單執行緒的重試佇列依序送出；佇列中還有訂單時，新訊號也排在後面，維持下單順序
+    """
+
+    def __init__(self, name, key, secret, qty=DEFAULT_QTY, rate_per_second=DEFAULT_RATE_PER_SECOND, testnet=False):
+        self.name = name
+        self.qty = qty
+        self.session = HTTP(api_key=key, api_secret=secret, testnet=testnet)
+        self.limiter = RateLimiter(rate_per_second)
+        self.retry_queue = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"retry-{name}")
+        self.queued = 0  # 重試佇列中尚未送出的訂單數
+        self.queue_lock = threading.Lock()
+
+
+def load_accounts(path=ACCOUNTS_FILE):
+    if not os.path.exists(path):
+        return [Account("default", api_key, api_secret, testnet=False)]  # 若用測試網這邊改成 True
+    with open(path, "r", encoding="utf-8") as f:
+        configs = json.load(f)
+    accounts = []
+    for i, config in enumerate(configs):
+        accounts.append(
+            Account(
+                config.get("name", f"account_{i}"),
+                config.get("api_key") or os.getenv(config.get("api_key_env", "")),
+                config.get("api_secret") or os.getenv(config.get("api_secret_env", "")),
+                qty=float(config.get("qty", DEFAULT_QTY)),
+                rate_per_second=config.get("rate_per_second", DEFAULT_RATE_PER_SECOND),
+                testnet=config.get("testnet", False),
+            )
+        )
+    return accounts
+
+
+accounts = load_accounts()
+executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS)
+fanout_latencies = deque(maxlen=LATENCY_SAMPLES)  # 整體扇出耗時 (秒)
+account_latencies = {a.name: deque(maxlen=LATENCY_SAMPLES) for a in accounts}  # 各帳戶下單耗時 (秒，含速率限制的等待)
+account_rate_limited = {a.name: 0 for a in accounts}  # 各帳戶因速率限制改由重試佇列送出的次數
+account_dropped = {a.name: 0 for a in accounts}  # 各帳戶重試用完仍未送出的次數
+metrics_lock = threading.Lock()
+
+
+def build_order(action, symbol, qty):
+    """將訊號轉成下單參數，不需要下單時回傳 None"""
     if action in ["buy", "short"]:
-        session.place_order(
+        return dict(
             category="linear",
             symbol=symbol,
-            side=side,
+            side="Buy" if action == "buy" else "Sell",
             order_type="Market",
             qty=qty,
             time_in_force="GoodTillCancel"
         )
-
-    elif action in ["sell", "cover", "sell_add_exit", "cover_add_exit"]:
-        session.place_order(
+    if action in ["sell", "cover", "sell_add_exit", "cover_add_exit"]:
+        return dict(
             category="linear",
             symbol=symbol,
             side="Sell" if action.startswith("sell") else "Buy",
@@ -47,5 +122,121 @@ def webhook():
             reduce_only=True,
             time_in_force="GoodTillCancel"
         )
+    return None
+
+
+def send_order(account, order, started):
+    """送出訂單並記錄從收到訊號起算的耗時"""
+    try:
+        response = account.session.place_order(**order)
+        result = {"account": account.name, "status": "success", "order_id": response.get("result", {}).get("orderId")}
+    except Exception as e:
+        result = {"account": account.name, "status": "error", "error": str(e)}
+    elapsed = time.perf_counter() - started
+    with metrics_lock:
+        account_latencies[account.name].append(elapsed)
+    result["latency_ms"] = round(elapsed * 1000, 1)
+    return result
+
+
+def retry_order(account, order, started):
+    """重試佇列：等到速率允許再送出；重試用完仍無法送出時記錄錯誤 (平倉單未送出代表持倉仍在)"""
+    try:
+        for _ in range(RATE_LIMIT_MAX_RETRIES):
+            if account.limiter.acquire():
+                result = send_order(account, order, started)
+                success = result["status"] == "success"
+                log = logger.info if success else logger.error
+                log(
+                    f"{'🔁' if success else '❌'} 重試佇列送出 ({account.name})：{result}",
+                    extra={"fields": {"event": "webhook_retry", **result}},
+                )
+                return result
+        elapsed = time.perf_counter() - started
+        with metrics_lock:
+            account_latencies[account.name].append(elapsed)
+            account_dropped[account.name] += 1
+        logger.error(
+            f"❌ 帳戶 {account.name} 速率限制重試 {RATE_LIMIT_MAX_RETRIES} 次仍無法下單，已放棄 "
+            f"({order['side']} {order['qty']} {order['symbol']}{' reduce_only' if order.get('reduce_only') else ''})，請手動確認持倉"
+        )
+        return {"account": account.name, "status": "dropped", "latency_ms": round(elapsed * 1000, 1)}
+    finally:
+        with account.queue_lock:
+            account.queued -= 1
+
+
+def place_for_account(account, action, symbol):
+    started = time.perf_counter()
+    order = build_order(action, symbol, account.qty)
+    if order is None:
+        return {"account": account.name, "status": "ignored"}
+    with account.queue_lock:
+        direct = account.queued == 0 and account.limiter.acquire()
+        if not direct:
+            account.queued += 1
+            logger.warning(f"⚠️ 帳戶 {account.name} 超過速率限制，訂單改由重試佇列送出 (佇列 {account.queued} 筆)")
+            account.retry_queue.submit(retry_order, account, order, started)
+    if not direct:
+        with metrics_lock:
+            account_rate_limited[account.name] += 1
+        return {
+            "account": account.name,
+            "status": "queued",
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+    return send_order(account, order, started)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000, 1)
+
+
+@app.route("/")
+def index():
+    return "Bybit Webhook is running"
+
+@app.route("/metrics")
+def metrics():
+    with metrics_lock:
+        return jsonify({
+            "fanout_ms": {"count": len(fanout_latencies), "p50": percentile(fanout_latencies, 0.5), "p99": percentile(fanout_latencies, 0.99)},
+            "accounts": {
+                name: {
+                    "count": len(values),
+                    "p50": percentile(values, 0.5),
+                    "p99": percentile(values, 0.99),
+                    "rate_limited": account_rate_limited[name],
+                    "dropped": account_dropped[name],
+                }
+                for name, values in account_latencies.items()
+            },
+        })
+
+@app.route("/webhook", methods=["POST"])
+def webhook():
+    data = request.get_json()
+    logger.info(f"📨 收到訊號：{data}")
+
+    action = data.get("data", {}).get("action")
+    symbol = data.get("symbol", "ETHUSDT")
+
+    # 同一個訊號同時送到所有帳戶，整體耗時約等於最慢的一個帳戶
+    started = time.perf_counter()
+    futures = [executor.submit(place_for_account, account, action, symbol) for account in accounts]
+    results = [f.result() for f in futures]
+    elapsed = time.perf_counter() - started
+    with metrics_lock:
+        fanout_latencies.append(elapsed)
+    failed = [r for r in results if r["status"] not in ("success", "ignored", "queued")]
+    log = logger.error if failed else logger.info
+    log(
+        f"{'❌' if failed else '📤'} 扇出 {len(accounts)} 個帳戶，耗時 {elapsed * 1000:.1f} ms：{results}",
+        extra={"fields": {"event": "webhook_fanout", "fanout_ms": round(elapsed * 1000, 1), "failed": len(failed)}},
+    )
 
-    return jsonify({"status": "success"})
+    status = "success" if all(r["status"] in ("success", "ignored") for r in results) else "partial"
+    return jsonify({"status": status, "fanout_ms": round(elapsed * 1000, 1), "results": results})
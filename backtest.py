@@ -0,0 +1,377 @@
+"""
+📊 回測引擎
+- 進場信號由 signals.py 的同一組規則對整段歷史一次向量化計算
+- 持倉狀態機逐根 K 線處理 (進出場互相依賴)，迴圈內只有純數值運算
+- 參數掃描時，不同 adx_threshold 的信號矩陣一次計算完成
+- 部位大小策略 (sizing.py) 對整段 K 線向量化計算「每單位權益的下單數量」，比較不同策略時共用同一組信號
+- 手續費 (taker) 於進出場扣除；資金費率由 funding_store.py 預先換算成每根 K 線的費率合計，
+  持倉跨越該根 K 線收盤 (結算時間) 時在同一個迴圈內扣除，每筆交易記錄毛利、手續費、資金費與淨利
+- 策略參數與指標計算來自 strategy_config.py / indicators.py (與實盤共用)，匯入本模組不會啟動實盤的日誌、.env 或熔斷器
+
+用法: python backtest.py <4小時K線CSV>  (欄位: timestamp, open, high, low, close, volume)
+"""
+
+import math
+import sys
+
+import numpy as np
+import pandas as pd
+
+from bar_aggregator import TIMEFRAME_MS
+from funding_store import FundingStore
+from indicators import calculate_indicators
+from models import BarBuffer
+from signals import LONG_ENTRY, SHORT_ENTRY
+from sizing import BARS_PER_YEAR_4H, SizingPolicy
+from strategy_config import DEFAULT_QTY_PERCENT, LEVER, STRATEGY_PARAMS, TAKER_FEE_RATE, TIMEFRAME
+
+DEFAULT_INITIAL_CAPITAL = 1000.0  # 與「最佳參數組合.json」的起始本金一致
+MIN_TRADE_QTY = 0.01  # ETH 最小下單量
+
+
+class BacktestResult:
+    """回測結果：交易紀錄與逐根 K 線的權益曲線"""
+
+    __slots__ = ("params", "trades", "equity", "initial_capital", "final_capital", "fees", "funding")
+
+    def __init__(self, params, trades, equity, initial_capital, final_capital, fees=0.0, funding=0.0):
+        self.params = params
+        self.trades = trades
+        self.equity = equity
+        self.initial_capital = initial_capital
+        self.final_capital = final_capital
+        self.fees = fees  # 手續費合計
+        self.funding = funding  # 資金費合計 (正數為支付)
+
+    @property
+    def total_pnl(self):
+        return self.final_capital - self.initial_capital
+
+    @property
+    def win_rate(self):
+        if not self.trades:
+            return 0.0
+        return sum(1 for t in self.trades if t["pnl"] > 0) / len(self.trades)
+
+    @property
+    def max_drawdown(self):
+        if len(self.equity) == 0:
+            return 0.0
+        peaks = np.maximum.accumulate(self.equity)
+        return float(np.max((peaks - self.equity) / peaks))
+
+    @property
+    def sharpe(self):
+        """逐根K線權益報酬的年化夏普比率 (無風險利率視為0)"""
+        if len(self.equity) < 2:
+            return 0.0
+        returns = np.diff(self.equity) / self.equity[:-1]
+        std = returns.std()
+        if std == 0:
+            return 0.0
+        return float(returns.mean() / std * np.sqrt(BARS_PER_YEAR_4H))
+
+    @property
+    def return_over_drawdown(self):
+        """總報酬率 / 最大回撤"""
+        max_drawdown = self.max_drawdown
+        if max_drawdown == 0:
+            return 0.0
+        return self.total_pnl / self.initial_capital / max_drawdown
+
+    def summary(self):
+        return {
+            "總交易次數": len(self.trades),
+            "總獲利": round(self.total_pnl, 2),
+            "獲利率": f"{self.total_pnl / self.initial_capital * 100:.2f}%",
+            "勝率": f"{self.win_rate * 100:.2f}%",
+            "最大回撤": f"{self.max_drawdown * 100:.2f}%",
+            "夏普比率": round(self.sharpe, 2),
+            "報酬回撤比": round(self.return_over_drawdown, 2),
+            "手續費": round(self.fees, 2),
+            "資金費": round(self.funding, 2),
+        }
+
+
+def prepare_buffer(data):
+    """接受 BarBuffer 或 K 線 DataFrame (缺少指標時自動計算)，回傳 BarBuffer"""
+    if isinstance(data, BarBuffer):
+        return data
+    if "ema90" not in data.columns:
+        data = calculate_indicators(data)
+    return BarBuffer.from_frame(data)
+
+
+def funding_per_bar(buffer, funding, bar_ms=TIMEFRAME_MS[TIMEFRAME]):
+    """
+    funding: None (不計資金費) / FundingStore / 已換算好的每根K線費率陣列
+    回傳長度與 buffer 相同的費率合計陣列
+    """
+    n = len(buffer)
+    if funding is None:
+        return np.zeros(n)
+    if isinstance(funding, FundingStore):
+        return funding.per_bar(buffer.times[:n], bar_ms)
+    return np.broadcast_to(np.asarray(funding, dtype=np.float64), (n,))
+
+
+def run_backtest(
+    data,
+    params=None,
+    initial_capital=DEFAULT_INITIAL_CAPITAL,
+    qty_percent=DEFAULT_QTY_PERCENT,
+    lever=LEVER,
+    signals=None,
+    sizing=None,
+    fee_rate=TAKER_FEE_RATE,
+    funding=None,
+):
+    """
+    以 4 小時 K 線回測策略
+    data: BarBuffer 或 K 線 DataFrame
+    params: 覆蓋 STRATEGY_PARAMS 的參數
+    signals: 可選，預先算好的 (多單信號, 空單信號) 布林陣列 (參數掃描時使用)
+    sizing: 可選，SizingPolicy；未提供時使用 qty_percent × lever
+    fee_rate: 進出場手續費率 (預設 taker；0 表示不計手續費)
+    funding: 可選，FundingStore 或每根K線的資金費率合計陣列 (見 funding_per_bar)
+    """
+    p = STRATEGY_PARAMS.copy()
+    if params:
+        p.update(params)
+
+    buffer = prepare_buffer(data)
+    if signals is None:
+        signal_params = {"adx_threshold": p["adx_threshold"]}
+        signals = (
+            LONG_ENTRY.evaluate(buffer, signal_params),
+            SHORT_ENTRY.evaluate(buffer, signal_params),
+        )
+    if sizing is None:
+        sizing = SizingPolicy("fixed_percent", qty_percent=qty_percent, lever=lever)
+    # 三種公式的數量都與權益成正比，先算出每單位權益的數量，模擬時再乘上當時的權益
+    qty_per_capital = np.broadcast_to(
+        sizing.qty(1.0, buffer.column("close"), buffer.column("atr")), (len(buffer),)
+    )
+    return _simulate(
+        buffer,
+        signals[0],
+        signals[1],
+        p,
+        initial_capital,
+        qty_per_capital,
+        fee_rate,
+        funding_per_bar(buffer, funding),
+    )
+
+
+def run_sweep(data, param_sets, **kwargs):
+    """
+    參數掃描：所有候選參數的進場信號以 (候選數, K線數) 矩陣一次計算
+    param_sets: 參數字典列表 (每組覆蓋 STRATEGY_PARAMS)
+    """
+    buffer = prepare_buffer(data)
+    thresholds = np.array(
+        [ps.get("adx_threshold", STRATEGY_PARAMS["adx_threshold"]) for ps in param_sets],
+        dtype=np.float64,
+    )
+    unique_thresholds, row_of = np.unique(thresholds, return_inverse=True)
+    if kwargs.get("funding") is not None:
+        kwargs["funding"] = funding_per_bar(buffer, kwargs["funding"])  # 所有候選共用，只換算一次
+    long_matrix = LONG_ENTRY.evaluate(buffer, {"adx_threshold": unique_thresholds})
+    short_matrix = SHORT_ENTRY.evaluate(buffer, {"adx_threshold": unique_thresholds})
+
+    return [
+        run_backtest(
+            buffer,
+            ps,
+            signals=(long_matrix[row_of[i]], short_matrix[row_of[i]]),
+            **kwargs,
+        )
+        for i, ps in enumerate(param_sets)
+    ]
+
+
+def compare_sizing(data, policies, params=None, **kwargs):
+    """
+    以同一組進場信號比較多種部位大小策略
+    policies: SizingPolicy 列表；回傳 {策略名稱: BacktestResult}
+    """
+    p = STRATEGY_PARAMS.copy()
+    if params:
+        p.update(params)
+    buffer = prepare_buffer(data)
+    signal_params = {"adx_threshold": p["adx_threshold"]}
+    signals = (
+        LONG_ENTRY.evaluate(buffer, signal_params),
+        SHORT_ENTRY.evaluate(buffer, signal_params),
+    )
+    if kwargs.get("funding") is not None:
+        kwargs["funding"] = funding_per_bar(buffer, kwargs["funding"])
+    return {
+        policy.name: run_backtest(buffer, p, signals=signals, sizing=policy, **kwargs)
+        for policy in policies
+    }
+
+
+def _simulate(
+    buffer, long_signal, short_signal, p, initial_capital, qty_per_capital, fee_rate=0.0, funding_rates=None
+):
+    """
+    持倉狀態機 (依實盤 process_bar 的處理順序)：
+    - 固定停損以 4 小時收盤價判斷
+    - 移動停損在實盤每分鐘檢查；回測沒有 1 分鐘資料，以 K 線高低價近似：
+      先用上一根的停損價檢查最低/最高價，再以本根高低點更新極值與停損價，最後用收盤價檢查
+    - 與實盤的已知差異 (近似造成，結果偏樂觀)：
+      移動停損以本根最高價 (空單為最低價) 判斷是否啟動，實盤以 1 分鐘收盤價判斷，回測可能較早啟動；
+      觸及停損價時以停損價成交，實盤以觸發當下的 1 分鐘收盤價市價平倉
+    - 同一根 K 線收盤的進場順序與實盤相同 (多單進場 → 多單停損 → 空單進場)：
+      移動停損在收盤前出場後多空皆可再進場；多單固定停損後只可進空單，空單固定停損後不再進場
+    - 資金費在 K 線收盤結算：持倉撐過移動停損 (收盤前) 的檢查時，
+      資金費 = 持倉量 × 收盤價 × funding_rates[i]；收盤後的固定停損出場仍需支付，本根新開的倉位不需支付
+    """
+    n = len(buffer)
+    high = buffer.column("high").tolist()
+    low = buffer.column("low").tolist()
+    close = buffer.column("close").tolist()
+    long_signal = np.asarray(long_signal, dtype=bool).tolist()
+    short_signal = np.asarray(short_signal, dtype=bool).tolist()
+    qty_per_capital = np.asarray(qty_per_capital, dtype=np.float64).tolist()
+    funding_rates = (
+        np.zeros(n) if funding_rates is None else np.asarray(funding_rates, dtype=np.float64)
+    ).tolist()
+
+    capital = initial_capital
+    total_fees = 0.0
+    total_funding = 0.0
+    trade_fee = 0.0  # 目前這筆交易累積的手續費 (含進場)
+    trade_funding = 0.0
+    equity = np.empty(n)
+    trades = []
+
+    qty = 0.0  # 正數為多單，負數為空單
+    entry = 0.0
+    extreme = 0.0
+    trail = None
+    active = False
+    entry_index = 0
+
+    def exit_position(i, price, reason):
+        nonlocal capital, qty, trail, active, total_fees, trade_fee
+        gross = (price - entry) * qty
+        fee = abs(qty) * price * fee_rate
+        capital += gross - fee
+        total_fees += fee
+        trade_fee += fee
+        pnl = gross - trade_fee - trade_funding
+        trades.append(
+            {
+                "entry_time": buffer.time_at(entry_index),
+                "exit_time": buffer.time_at(i),
+                "side": "long" if qty > 0 else "short",
+                "entry_price": entry,
+                "exit_price": price,
+                "qty": abs(qty),
+                "gross_pnl": gross,
+                "fee": trade_fee,
+                "funding": trade_funding,
+                "pnl": pnl,
+                "reason": reason,
+            }
+        )
+        qty = 0.0
+        trail = None
+        active = False
+
+    for i in range(n):
+        h, l, c = high[i], low[i], close[i]
+        fixed_exit = 0  # 本根K線固定停損出場的方向 (1 多單 / -1 空單)
+
+        if qty > 0:
+            if active and l <= trail:
+                exit_position(i, trail, "TRAIL_STOP")
+            else:
+                extreme = max(extreme, h)
+                if not active and h > entry * (1 + p["long_trailing_activate_profit_percent"]):
+                    active = True
+                    trail = entry * (1 + p["long_trailing_min_profit_percent"])
+                if active:
+                    trail = max(
+                        trail,
+                        extreme * (1 - p["long_trailing_pullback_percent"]),
+                        entry * (1 + p["long_trailing_min_profit_percent"]),
+                    )
+                    if c <= trail:
+                        exit_position(i, c, "TRAIL_STOP")
+
+        elif qty < 0:
+            if active and h >= trail:
+                exit_position(i, trail, "TRAIL_STOP")
+            else:
+                extreme = min(extreme, l)
+                if not active and l < entry * (1 - p["short_trailing_activate_profit_percent"]):
+                    active = True
+                    trail = entry * (1 - p["short_trailing_min_profit_percent"])
+                if active:
+                    trail = min(
+                        trail,
+                        extreme * (1 + p["short_trailing_pullback_percent"]),
+                        entry * (1 - p["short_trailing_min_profit_percent"]),
+                    )
+                    if c >= trail:
+                        exit_position(i, c, "TRAIL_STOP")
+
+        # 資金費於收盤結算：收盤前已由移動停損出場的持倉不需支付
+        if qty != 0 and funding_rates[i]:
+            cost = qty * c * funding_rates[i]
+            capital -= cost
+            total_funding += cost
+            trade_funding += cost
+
+        if qty > 0 and c <= entry * (1 - p["long_fixed_stop_loss_percent"]):
+            exit_position(i, c, "FIXED_STOP")
+            fixed_exit = 1
+        elif qty < 0 and c >= entry * (1 + p["short_fixed_stop_loss_percent"]):
+            exit_position(i, c, "FIXED_STOP")
+            fixed_exit = -1
+
+        go_long = long_signal[i] and fixed_exit == 0
+        go_short = short_signal[i] and fixed_exit != -1
+        if qty == 0 and (go_long or go_short):
+            trade_qty = math.floor(capital * qty_per_capital[i] * 100 + 1e-9) / 100
+            if trade_qty >= MIN_TRADE_QTY:
+                qty = trade_qty if go_long else -trade_qty
+                trade_fee = trade_qty * c * fee_rate
+                trade_funding = 0.0
+                capital -= trade_fee
+                total_fees += trade_fee
+                entry = c
+                extreme = h if qty > 0 else l
+                trail = None
+                active = False
+                entry_index = i
+
+        equity[i] = capital + (c - entry) * qty
+
+    return BacktestResult(p, trades, equity, initial_capital, capital, total_fees, total_funding)
+
+
+def load_klines_csv(path):
+    """讀取 K 線 CSV，timestamp 可為毫秒整數或日期字串"""
+    df = pd.read_csv(path)
+    if np.issubdtype(df["timestamp"].dtype, np.number):
+        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
+    else:
+        df["timestamp"] = pd.to_datetime(df["timestamp"])
+    df.set_index("timestamp", inplace=True)
+    df.columns = [col.lower() for col in df.columns]
+    return df
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python backtest.py <4小時K線CSV>")
+        sys.exit(1)
+    store = FundingStore()
+    result = run_backtest(load_klines_csv(sys.argv[1]), funding=store if len(store) else None)
+    for key, value in result.summary().items():
+        print(f"{key}: {value}")
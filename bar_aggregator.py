@@ -0,0 +1,104 @@
+"""
+🕐 K 線聚合器：由 1 分鐘 K 線 (或逐筆成交) 增量合成較長週期的 K 線
+- 週期邊界以 UTC epoch 對齊 (與 Bybit 4 小時 K 線相同：00/04/08/12/16/20 點)
+- 同一分鐘可重複更新 (尚未收盤的 1 分鐘 K 線會持續變動)，以最後一次為準
+- 收到下一個週期的第一筆資料時，上一根 K 線即收盤並回傳
+"""
+
+TIMEFRAME_MS = {
+    "1m": 60_000,
+    "5m": 5 * 60_000,
+    "15m": 15 * 60_000,
+    "1h": 3_600_000,
+    "4h": 4 * 3_600_000,
+    "1d": 24 * 3_600_000,
+}
+
+MINUTE_MS = 60_000
+
+
+def bucket_start(time_ms, timeframe_ms):
+    """時間戳所屬週期的開始時間 (UTC 對齊)"""
+    return time_ms - time_ms % timeframe_ms
+
+
+class BarAggregator:
+    def __init__(self, timeframe_ms):
+        self.timeframe_ms = timeframe_ms
+        self._bucket = None  # 目前週期的開始時間 (毫秒)
+        self._minutes = {}  # 分鐘時間戳 → [open, high, low, close, volume]
+
+    @property
+    def current_bucket(self):
+        return self._bucket
+
+    def update(self, time_ms, open_, high, low, close, volume):
+        """
+        加入/更新一根 1 分鐘 K 線。
+        回傳因此收盤的 K 線 (dict)，沒有收盤時回傳 None。
+        回傳的 K 線含 complete 欄位：週期的第一或最後一分鐘缺漏時為 False
+        (例如程式在週期中途啟動，或輪詢中斷過久)。
+        """
+        bucket = bucket_start(time_ms, self.timeframe_ms)
+        closed = None
+        if self._bucket is None:
+            self._bucket = bucket
+        elif bucket > self._bucket:
+            closed = self._close_bucket()
+            self._bucket = bucket
+        elif bucket < self._bucket:
+            return None  # 已收盤週期的遲到資料，忽略
+
+        self._minutes[time_ms - time_ms % MINUTE_MS] = [open_, high, low, close, volume]
+        return closed
+
+    def add_trade(self, time_ms, price, qty):
+        """以逐筆成交更新所屬分鐘的 K 線，回傳值同 update"""
+        minute = time_ms - time_ms % MINUTE_MS
+        current = self._minutes.get(minute)
+        if current is None:
+            return self.update(minute, price, price, price, price, qty)
+        current[1] = max(current[1], price)
+        current[2] = min(current[2], price)
+        current[3] = price
+        current[4] += qty
+        return None
+
+    def update_many(self, times_ms, opens, highs, lows, closes, volumes):
+        """批次加入 1 分鐘 K 線 (需依時間遞增)，回傳所有收盤的 K 線列表"""
+        closed_bars = []
+        for row in zip(times_ms, opens, highs, lows, closes, volumes):
+            closed = self.update(*row)
+            if closed is not None:
+                closed_bars.append(closed)
+        return closed_bars
+
+    def reset(self, bucket_ms=None):
+        """清空目前週期 (例如資料中斷後重新同步)，可指定新的起始週期"""
+        self._bucket = bucket_ms
+        self._minutes = {}
+
+    def current_bar(self):
+        """目前尚未收盤的 K 線 (沒有資料時回傳 None)"""
+        if not self._minutes:
+            return None
+        return self._build_bar()
+
+    def _build_bar(self):
+        minutes = sorted(self._minutes)
+        rows = [self._minutes[m] for m in minutes]
+        return {
+            "time": self._bucket,
+            "open": rows[0][0],
+            "high": max(r[1] for r in rows),
+            "low": min(r[2] for r in rows),
+            "close": rows[-1][3],
+            "volume": sum(r[4] for r in rows),
+            "complete": minutes[0] == self._bucket
+            and minutes[-1] == self._bucket + self.timeframe_ms - MINUTE_MS,
+        }
+
+    def _close_bucket(self):
+        bar = self._build_bar() if self._minutes else None
+        self._minutes = {}
+        return bar
@@ -0,0 +1,174 @@
+"""
+🔌 端點熔斷器與退避
+- 每個交易所端點 (K 線、報價、帳戶查詢...) 各自一個熔斷器，一個端點故障不影響其他端點
+- 連續失敗達門檻即熔斷 (open)，等待時間以指數退避並加入隨機抖動，避免與其他客戶端同時重試
+- 等待時間到後進入半開 (half-open)，只放行一次探測請求：成功即恢復，失敗則以更長的等待時間再次熔斷
+- 記錄熔斷次數、被拒絕的請求數與每次從熔斷到恢復的耗時
+"""
+
+import logging
+import random
+import time
+
+logger = logging.getLogger("autotrader.circuit")
+
+# 熔斷器狀態
+CLOSED = "closed"  # 正常
+OPEN = "open"  # 熔斷中，拒絕請求
+HALF_OPEN = "half_open"  # 探測中，只放行一次請求
+
+
+class CircuitOpenError(Exception):
+    """端點熔斷中，請求未送出"""
+
+
+class Backoff:
+    """指數退避 (含抖動)：第 n 次等待 base × 2^(n-1)，上限 max_delay，再乘上 [1 - jitter, 1] 的隨機係數"""
+
+    __slots__ = ("base_delay", "max_delay", "jitter", "attempts")
+
+    def __init__(self, base_delay=1.0, max_delay=60.0, jitter=0.5):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.attempts = 0
+
+    def next_delay(self):
+        self.attempts += 1
+        delay = min(self.max_delay, self.base_delay * 2 ** min(self.attempts - 1, 32))
+        return delay * (1 - self.jitter * random.random())
+
+    def reset(self):
+        self.attempts = 0
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name,
+        failure_threshold=3,
+        base_delay=2.0,
+        max_delay=300.0,
+        jitter=0.5,
+        clock=time.time,
+    ):
+        """
+        failure_threshold: 連續失敗幾次後熔斷
+        base_delay / max_delay: 第一次熔斷的等待秒數與上限 (每次探測失敗加倍)
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.clock = clock
+        self.backoff = Backoff(base_delay, max_delay, jitter)
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.opened_at = None  # 本次熔斷開始時間 (恢復時計算耗時)
+        self.trips = 0
+        self.failures = 0
+        self.rejected = 0
+        self.recoveries = 0
+        self.last_recovery_seconds = None
+        self.total_recovery_seconds = 0.0
+
+    def allow(self):
+        """是否可以送出請求 (熔斷中回傳 False；等待時間已到時轉為半開並放行一次探測)"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and self.clock() >= self.open_until:
+            self.state = HALF_OPEN
+            logger.info(f"🔌 [{self.name}] 熔斷等待結束，送出探測請求")
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        if self.state != CLOSED:
+            recovery = self.clock() - self.opened_at
+            self.recoveries += 1
+            self.last_recovery_seconds = recovery
+            self.total_recovery_seconds += recovery
+            logger.info(
+                f"✅ [{self.name}] 端點恢復，熔斷持續 {recovery:.1f} 秒",
+                extra={
+                    "fields": {"event": "circuit_closed", "endpoint": self.name, "recovery_seconds": recovery}
+                },
+            )
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.backoff.reset()
+
+    def record_failure(self, error=None):
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self._trip(error)
+
+    def call(self, func, *args, **kwargs):
+        """經過熔斷器呼叫 func；熔斷中拋出 CircuitOpenError，func 的例外照常拋出並記為失敗"""
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} 熔斷中，{self.seconds_until_retry():.0f} 秒後重試")
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+    def seconds_until_retry(self):
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.open_until - self.clock())
+
+    def _trip(self, error):
+        now = self.clock()
+        delay = self.backoff.next_delay()
+        if self.state == CLOSED:
+            self.trips += 1
+            self.opened_at = now
+        self.state = OPEN
+        self.open_until = now + delay
+        logger.warning(
+            f"🔌 [{self.name}] 連續失敗 {self.consecutive_failures} 次，熔斷 {delay:.1f} 秒: {error}",
+            extra={
+                "fields": {
+                    "event": "circuit_open",
+                    "endpoint": self.name,
+                    "delay": delay,
+                    "trips": self.trips,
+                    "consecutive_failures": self.consecutive_failures,
+                }
+            },
+        )
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "trips": self.trips,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "recoveries": self.recoveries,
+            "last_recovery_seconds": self.last_recovery_seconds,
+            "avg_recovery_seconds": (
+                self.total_recovery_seconds / self.recoveries if self.recoveries else None
+            ),
+        }
+
+
+class CircuitBreakerRegistry:
+    """依端點名稱取得熔斷器 (第一次使用時以共用設定建立)"""
+
+    def __init__(self, **defaults):
+        self.defaults = defaults
+        self._breakers = {}
+
+    def __getitem__(self, name):
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = self._breakers[name] = CircuitBreaker(name, **self.defaults)
+        return breaker
+
+    def stats(self):
+        return {name: breaker.stats() for name, breaker in self._breakers.items()}
@@ -5,14 +5,75 @@
 🔧 停損機制: 固定停損(4小時檢查) + 移動停損(每分鐘檢查)
 """
 
-import pandas as pd
-from datetime import datetime, timedelta
-import os
 import time
-import ccxt
+
+_PROCESS_START = time.perf_counter()  # 冷啟動計時起點
+
+import atexit
+import importlib
+import math
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from datetime import datetime, timedelta, timezone
+import os
+import socket
+import sys
 from dotenv import load_dotenv
 import json
 
+from bar_aggregator import MINUTE_MS, TIMEFRAME_MS, BarAggregator, bucket_start
+from circuit_breaker import Backoff, CircuitBreakerRegistry, CircuitOpenError
+from execution import OrderExecutor, amount_step, round_down
+from indicator_state import IndicatorState
+from indicators import calculate_indicators
+from kernels import trail_path
+from leader_lease import FileLeaseBackend, LeaderLease
+from logging_config import setup_logging
+from models import BAR_FIELDS, Bar, BarBuffer, PositionState
+from order_book import OrderBookCache
+from order_tracker import (
+    CANCELLED,
+    FAILED,
+    FILLED,
+    UNKNOWN,
+    OrderOutcomeUnknown,
+    PendingOrderTable,
+    new_client_order_id,
+)
+from reconcile import ExchangeSnapshot, apply_changes, diff, take_snapshot
+from risk import RiskEngine, RiskLimits
+from shadow import DEFAULT_QTY_STEP, ShadowBook
+from sizing import SizingPolicy
+from signals import LONG_ENTRY, SHORT_ENTRY
+from strategy_config import (
+    DEFAULT_QTY_PERCENT,
+    LEVER,
+    MAKER_FEE_RATE,
+    STRATEGY_PARAMS,
+    SYMBOL,
+    TAKER_FEE_RATE,
+    TIMEFRAME,
+)
+from trail_journal import TrailJournal
+from traffic import TrafficRecorder
+
+
+class _LazyModule:
+    """延遲載入的模組代理：第一次存取屬性時才真正 import，縮短冷啟動時間"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+pd = _LazyModule("pandas")
+ccxt = _LazyModule("ccxt")
+
 # 載入 .env 檔案中的環境變數
 load_dotenv()
 
@@ -20,25 +81,7 @@ load_dotenv()
 # 交易所設定
 BYBIT_API_KEY = os.getenv("BYBIT_API_KEY")
 BYBIT_API_SECRET = os.getenv("BYBIT_API_SECRET")
-SYMBOL = "ETH/USDT"
-TIMEFRAME = "4h"
-
-# 資金管理設定
-DEFAULT_QTY_PERCENT = 70  # 每次交易使用帳戶可用餘額的百分比
-LEVER = 1 # 如果需要槓桿，從此修改，並在bybitAPP也修改為相同槓桿倍數
-
-# 🏆 最佳策略參數 (2020-2025年優化結果，穩定性評分48.38)
-STRATEGY_PARAMS = {
-    "adx_threshold": 26,  # 更嚴格的趨勢判斷
-    "long_fixed_stop_loss_percent": 0.019,  # 1.9%
-    "long_trailing_activate_profit_percent": 0.011,  # 1.1%
-    "long_trailing_pullback_percent": 0.054,  # 5.4%
-    "long_trailing_min_profit_percent": 0.011,  # 1.1%
-    "short_fixed_stop_loss_percent": 0.013,  # 1.3%
-    "short_trailing_activate_profit_percent": 0.019,  # 1.9%
-    "short_trailing_pullback_percent": 0.018,  # 1.8%
-    "short_trailing_min_profit_percent": 0.016,  # 1.6%
-}
+# 交易對、週期、資金管理與策略參數見 strategy_config.py (與回測共用)
 
 # 系統設定
 TRADE_SLEEP_SECONDS = 60  # 每隔多久檢查一次新K線 (60秒檢查一次)
@@ -47,151 +90,507 @@ FETCH_KLINE_LIMIT = 300  # 獲取多少根K線用於指標計算 (確保涵蓋EM
 # 定義保存狀態的檔案路徑
 STATE_FILE = "strategy_state.json"
 
+# 快速啟動設定 (崩潰重啟後盡快恢復停損保護)
+FAST_START = os.getenv("FAST_START", "1") == "1"  # 使用市場資訊快取並並行初始化
+MARKET_CACHE_FILE = "market_cache.json"  # 市場資訊 (精度/限制) 本地快取
+MARKET_CACHE_TTL_SECONDS = 24 * 3600  # 快取有效期 (1天)
+COLD_START_TARGET_SECONDS = 2.0  # 冷啟動目標耗時，超過時記錄警告
+
+# 崩潰恢復設定 (搭配 supervisor.py 使用)
+TRAIL_JOURNAL_FILE = "trail_journal.jsonl"  # 峰值/谷值與移動停損價的 append-only 日誌
+PENDING_ORDERS_FILE = "pending_orders.json"  # 以 orderLinkId 追蹤的待確認訂單表
+INDICATOR_STATE_FILE = "indicator_state.json"  # 增量指標狀態 (EMA/ADX/RSI 累積值與最後一根K線時間)
+DUPLICATE_ORDER_LINK_ID_CODE = 110072  # Bybit: orderLinkId 重複 (訂單其實已送達)
+# Bybit v5 orderStatus → ccxt 訂單狀態 (其餘為 open)
+ORDER_STATUS_MAP = {
+    "Filled": "closed",
+    "Cancelled": "canceled",
+    "PartiallyFilledCanceled": "canceled",
+    "Deactivated": "canceled",
+    "Rejected": "rejected",
+}
+HEARTBEAT_FILE = os.getenv("HEARTBEAT_FILE")  # 由 supervisor.py 設定，未設定時不寫心跳
+HEARTBEAT_INTERVAL_SECONDS = 10  # 心跳更新間隔
+MAX_CATCH_UP_MINUTES = 1000  # 重啟時最多補算多少分鐘的停機期間高低點 (單次請求上限)
+RECONCILE_INTERVAL_SECONDS = 300  # 與交易所對帳的間隔 (單一快照，無差異時不寫檔)
+MAX_1M_FETCH_LIMIT = 1000  # 單次請求 1 分鐘 K 線的上限，中斷超過此長度時改以 REST 重新同步 4 小時 K 線
+
+# --- 熔斷與退避設定 (各端點獨立) ---
+CIRCUIT_FAILURE_THRESHOLD = 3  # 同一端點連續失敗幾次後熔斷
+CIRCUIT_BASE_DELAY_SECONDS = 5  # 第一次熔斷的等待時間，之後每次探測失敗加倍 (含隨機抖動)
+CIRCUIT_MAX_DELAY_SECONDS = 300  # 熔斷等待時間上限
+CIRCUIT_JITTER = 0.5  # 等待時間隨機縮短的最大比例
+LOOP_ERROR_BASE_DELAY_SECONDS = 1  # 主循環發生例外後第一次等待的秒數 (連續例外時加倍)
+LOOP_ERROR_MAX_DELAY_SECONDS = 30  # 主循環例外等待上限，避免長時間中斷移動停損檢查
+
+# --- 主備 (HA) 設定 ---
+# 兩個實例在同一個工作目錄 (共用檔案系統) 以 HA_MODE=1 啟動，持有租約者為主節點；
+# 備援節點持續輪詢K線、更新指標並刷新持倉快照，但不做交易判斷、不下單、不寫策略狀態檔
+HA_MODE = os.getenv("HA_MODE", "0") == "1"
+HA_INSTANCE_ID = os.getenv("HA_INSTANCE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+HA_LEASE_FILE = os.getenv("HA_LEASE_FILE", "leader.lease")
+HA_LEASE_TTL_SECONDS = 10  # 主節點停止續約後，備援節點最多等待此秒數接手
+HA_LEASE_SAFETY_SECONDS = 2  # 主節點提前認定租約失效的秒數 (吸收主機間時鐘誤差)
+HA_RENEW_INTERVAL_SECONDS = 2  # 續約/搶租約的間隔
+HA_STANDBY_REFRESH_SECONDS = 30  # 備援節點重新讀取狀態檔與交易所持倉快照的間隔
+
+# --- 流量錄製 (離線重播用，見 traffic.py) ---
+TRAFFIC_RECORD_FILE = os.getenv("TRAFFIC_RECORD_FILE")  # 設定時錄製所有交易所請求與策略事件 (.gz 結尾時壓縮)
+
+# --- 收盤排程設定 ---
+BAR_CLOSE_SETTLE_SECONDS = 2  # 週期邊界後等待交易所產生新K線的緩衝時間
+BAR_CLOSE_RETRY_INITIAL_SECONDS = 1  # 收盤K線尚未出現時第一次重試的等待時間
+BAR_CLOSE_RETRY_MAX_SECONDS = 16  # 重試等待時間上限
+BAR_CLOSE_MAX_RETRIES = 6  # 超過此次數改回一般的60秒輪詢
+
+# --- 下單執行設定 ---
+# 各動作的執行模式: market (市價) / post_only (掛單追價，逾時轉市價) / twap (拆單)
+# 預設皆為市價單 (原本行為)，以環境變數選用其他模式；出場 (停損、平倉) 必須確定成交，建議維持市價單
+EXECUTION_MODES = {
+    "entry": os.getenv("ENTRY_EXECUTION_MODE", "market"),
+    "exit": os.getenv("EXIT_EXECUTION_MODE", "market"),
+}
+POST_ONLY_CHASE_SECONDS = 10  # PostOnly 掛單每次等待成交的秒數
+POST_ONLY_MAX_CHASES = 3  # 追價次數上限，用完後剩餘數量改市價
+TWAP_SLICES = 4  # TWAP 拆單筆數
+TWAP_INTERVAL_SECONDS = 5  # TWAP 每筆間隔秒數
+TWAP_MIN_QTY = 5.0  # 數量 (ETH) 達到此值才拆單
+ORDER_BOOK_DEPTH = 50  # 訂單簿快照檔數
+MAX_ENTRY_SLIPPAGE_BPS = 10  # 進場數量以訂單簿深度限制在此滑價預算內 (相對中間價)
+
+# --- 部位大小設定 ---
+# fixed_percent (預設，DEFAULT_QTY_PERCENT × LEVER) / fixed_fractional_risk / volatility_target
+SIZING_POLICY = os.getenv("SIZING_POLICY", "fixed_percent")
+SIZING_PARAMS = {
+    "fixed_percent": {"qty_percent": DEFAULT_QTY_PERCENT, "lever": LEVER},
+    # 每筆交易風險為權益的1%，停損距離 = 2 × ATR
+    "fixed_fractional_risk": {"risk_per_trade": 0.01, "atr_multiple": 2.0, "max_leverage": LEVER},
+    # 年化目標波動度 50%
+    "volatility_target": {"target_volatility": 0.5, "max_leverage": LEVER},
+}
 
-# --- 1. 數據載入 (從 Bybit API 獲取數據) ---
-def fetch_bybit_klines(symbol, timeframe, limit=FETCH_KLINE_LIMIT):
+# --- 影子交易設定 ---
+# 參數變體清單 (JSON: [{"name": ..., "params": {...}}, ...])；檔案不存在時不啟用
+SHADOW_VARIANTS_FILE = os.getenv("SHADOW_VARIANTS_FILE", "shadow_variants.json")
+SHADOW_RESULTS_FILE = "shadow_results.json"  # 每根4小時K線收盤後更新的影子績效
+
+# --- 風控設定 ---
+RISK_MAX_DRAWDOWN = float(os.getenv("RISK_MAX_DRAWDOWN", "0.35"))  # 回撤達此比例停止新進場
+RISK_MAX_GROSS_EXPOSURE = LEVER * 1.0  # 所有商品名目價值合計 / 權益 上限
+RISK_MAX_SYMBOL_EXPOSURE = LEVER * 1.0  # 單一商品名目價值 / 權益 上限
+
+# 日誌設定 (背景執行緒寫出，交易執行緒不會被日誌 I/O 阻塞)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FILE = os.getenv("LOG_FILE", "logs/strategy.log")  # JSON 格式，自動輪替
+LOG_MAX_BYTES = 5 * 1024 * 1024  # 單一日誌檔上限 5MB
+LOG_BACKUP_COUNT = 5  # 保留的輪替檔案數量
+LOG_JSON_CONSOLE = os.getenv("LOG_JSON_CONSOLE", "0") == "1"  # Render 等環境可改為 JSON 輸出
+LOG_SAMPLE_SECONDS = 60  # 重複訊息 (峰值/停損更新) 每個類別最多每60秒輸出一次
+
+logger = setup_logging(
+    level=LOG_LEVEL,
+    log_file=LOG_FILE,
+    max_bytes=LOG_MAX_BYTES,
+    backup_count=LOG_BACKUP_COUNT,
+    json_console=LOG_JSON_CONSOLE,
+    sample_seconds=LOG_SAMPLE_SECONDS,
+)
+
+# 流量錄製器 (未設定 TRAFFIC_RECORD_FILE 時為 None)
+TRAFFIC_RECORDER = TrafficRecorder(TRAFFIC_RECORD_FILE) if TRAFFIC_RECORD_FILE else None
+
+# 交易所端點熔斷器：klines (K 線) / ticker (報價，K 線故障時供移動停損使用) / account (帳戶校正)
+BREAKERS = CircuitBreakerRegistry(
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    base_delay=CIRCUIT_BASE_DELAY_SECONDS,
+    max_delay=CIRCUIT_MAX_DELAY_SECONDS,
+    jitter=CIRCUIT_JITTER,
+)
+
+
+# --- 0. 市場資訊快取 ---
+def load_cached_markets(exchange, symbol):
     """
-    從 Bybit 獲取指定交易對和時間週期的 K 線數據。
+    從本地快取載入交易對的市場資訊 (精度、限制)，避免每次啟動都完整 load_markets。
+    快取不存在、過期或不含該交易對時回傳 False。
     """
-    exchange = ccxt.bybit(
-        {
-            "apiKey": BYBIT_API_KEY,
-            "secret": BYBIT_API_SECRET,
-            "sandbox": False,  # 實際交易模式
-            "options": {
-                "defaultType": "future",  # 或者 'spot', 'margin' 等，根據您的交易類型設定
-                "adjustForTimeDifference": True,  # 自動調整時間差
-                "recvWindow": 120000,  # 增加接收窗口時間到2分鐘
-            },
-        }
-    )
+    if not FAST_START or not os.path.exists(MARKET_CACHE_FILE):
+        return False
+    try:
+        with open(MARKET_CACHE_FILE, "r") as f:
+            cache = json.load(f)
+        if time.time() - cache.get("saved_at", 0) > MARKET_CACHE_TTL_SECONDS:
+            return False
+        markets = cache.get("markets", [])
+        if not any(m.get("symbol") == symbol for m in markets):
+            return False
+        exchange.set_markets(markets)
+        return True
+    except Exception as e:
+        logger.warning(f"⚠️ 讀取市場資訊快取失敗，改為線上載入: {e}")
+        return False
+
 
-    # 同步時間
+def save_market_cache(exchange, symbol):
+    """只快取與交易對相同 base/quote 的市場 (現貨與線性合約)，檔案保持精簡"""
     try:
-        exchange.load_time_difference()
-    except:
-        pass
+        market = exchange.market(symbol)
+        markets = [
+            m
+            for m in exchange.markets.values()
+            if m.get("base") == market["base"] and m.get("quote") == market["quote"]
+        ]
+        with open(MARKET_CACHE_FILE, "w") as f:
+            json.dump({"saved_at": time.time(), "markets": markets}, f)
+    except Exception as e:
+        logger.warning(f"⚠️ 保存市場資訊快取失敗: {e}")
+
 
-    # 載入市場資訊，ccxt 需要知道市場資訊才能正確處理交易對
+def ensure_markets(exchange, symbol):
+    """確保 exchange 已有市場資訊：優先使用快取，否則線上載入並更新快取"""
+    if exchange.markets and symbol in exchange.markets:
+        return
+    if load_cached_markets(exchange, symbol):
+        return
     exchange.load_markets()
+    save_market_cache(exchange, symbol)
+
 
+_public_exchange = None
+
+
+def get_public_exchange():
+    """K 線查詢共用的 exchange 實例，只在第一次使用時建立並載入市場資訊"""
+    global _public_exchange
+    if _public_exchange is None:
+        exchange = ccxt.bybit(
+            {
+                "apiKey": BYBIT_API_KEY,
+                "secret": BYBIT_API_SECRET,
+                "sandbox": False,  # 實際交易模式
+                "options": {
+                    "defaultType": "future",  # 或者 'spot', 'margin' 等，根據您的交易類型設定
+                    "adjustForTimeDifference": True,  # 自動調整時間差
+                    "recvWindow": 120000,  # 增加接收窗口時間到2分鐘
+                },
+            }
+        )
+        if TRAFFIC_RECORDER is not None:
+            exchange = TRAFFIC_RECORDER.wrap(exchange, "public")
+
+        # 同步時間
+        try:
+            exchange.load_time_difference()
+        except:
+            pass
+
+        # 載入市場資訊，ccxt 需要知道市場資訊才能正確處理交易對
+        ensure_markets(exchange, SYMBOL)
+        _public_exchange = exchange
+    return _public_exchange
+
+
+# --- 1. 數據載入 (從 Bybit API 獲取數據) ---
+def fetch_bybit_ohlcv(symbol, timeframe, limit=FETCH_KLINE_LIMIT):
+    """
+    從 Bybit 獲取 K 線原始資料 [[毫秒時間, open, high, low, close, volume], ...]，失敗時回傳 None。
+    實盤輪詢直接使用原始列表，不建立 DataFrame。
+    """
     try:
-        # 獲取 K 線數據
-        ohlcv = exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
-        df = pd.DataFrame(
-            ohlcv, columns=["timestamp", "open", "high", "low", "close", "volume"]
+        return BREAKERS["klines"].call(
+            lambda: get_public_exchange().fetch_ohlcv(symbol, timeframe, limit=limit)
         )
-        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
-        df.set_index("timestamp", inplace=True)
-        df.columns = [col.lower() for col in df.columns]  # 統一列名為小寫
-        return df
+    except CircuitOpenError as e:
+        logger.warning(f"⚠️ {e}", extra={"sample_key": "klines_circuit"})
     except ccxt.NetworkError as e:
-        print(f"網路錯誤: {e}")
-        return pd.DataFrame()
+        logger.error(f"網路錯誤: {e}")
     except ccxt.ExchangeError as e:
-        print(f"交易所錯誤: {e}")
-        return pd.DataFrame()
+        logger.error(f"交易所錯誤: {e}")
     except Exception as e:
-        print(f"獲取 K 線數據時發生未知錯誤: {e}")
-        return pd.DataFrame()
-
+        logger.error(f"獲取 K 線數據時發生未知錯誤: {e}")
+    return None
 
-# --- 2. 指標計算 ---
-def calculate_ema(series, period):
-    """計算指數移動平均線"""
-    return series.ewm(span=period, adjust=False).mean()
 
+def fetch_latest_price_bar(symbol):
+    """
+    以報價端點 (ticker) 取得最新成交價，包成高低收相同的 1 分鐘 K 線。
+    K 線端點故障或熔斷時供移動停損檢查使用；失敗時回傳 None。
+    """
+    try:
+        ticker = BREAKERS["ticker"].call(lambda: get_public_exchange().fetch_ticker(symbol))
+    except CircuitOpenError as e:
+        logger.warning(f"⚠️ {e}", extra={"sample_key": "ticker_circuit"})
+        return None
+    except Exception as e:
+        logger.error(f"獲取最新報價失敗: {e}")
+        return None
+    price = ticker.get("last")
+    if not price:
+        return None
+    minute_ms = bucket_start(int(time.time() * 1000), MINUTE_MS)
+    return Bar.from_ohlcv([minute_ms, price, price, price, price, 0.0])
 
-def calculate_adx(high, low, close, period=14):
-    """計算ADX指標 - 使用標準的Wilder平滑法"""
-    # 計算True Range
-    tr1 = high - low
-    tr2 = abs(high - close.shift(1))
-    tr3 = abs(low - close.shift(1))
-    tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
 
-    # 計算方向移動
-    plus_dm = high.diff()
-    minus_dm = -low.diff()
+def fetch_bybit_klines(symbol, timeframe, limit=FETCH_KLINE_LIMIT):
+    """
+    從 Bybit 獲取指定交易對和時間週期的 K 線數據。
+    """
+    ohlcv = fetch_bybit_ohlcv(symbol, timeframe, limit=limit)
+    if not ohlcv:
+        return pd.DataFrame()
+    df = pd.DataFrame(
+        ohlcv, columns=["timestamp", "open", "high", "low", "close", "volume"]
+    )
+    df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
+    df.set_index("timestamp", inplace=True)
+    df.columns = [col.lower() for col in df.columns]  # 統一列名為小寫
+    return df
 
-    plus_dm[plus_dm < 0] = 0
-    minus_dm[minus_dm < 0] = 0
 
-    # 當+DM > -DM時，-DM = 0；當-DM > +DM時，+DM = 0
-    plus_dm[(plus_dm <= minus_dm)] = 0
-    minus_dm[(minus_dm <= plus_dm)] = 0
+# --- 1b. 單一 1 分鐘資料流 (同時供應移動停損與 4 小時 K 線) ---
+class LiveBarFeed:
+    """
+    單一 1 分鐘 K 線資料流：
+    - 每次輪詢只請求 1 分鐘 K 線，最新一根提供移動停損檢查所需的價格
+    - 同一批資料增量合成 4 小時 K 線 (UTC 對齊)，週期一結束就產生收盤事件
+    - 只在啟動或資料不完整時以 REST 取得 4 小時歷史 K 線
+    - 4 小時歷史保存在預先配置的固定容量 BarBuffer，指標原地寫入同一份欄位陣列；
+      輪詢過程不建立 DataFrame，長時間運行記憶體用量固定
+    - 指標以 IndicatorState 逐根增量更新並保存到檔案，重啟時只補算錯過的K線
+    """
 
-    # 使用Wilder平滑法 (alpha = 1/period)
-    alpha = 1.0 / period
+    def __init__(
+        self,
+        symbol=SYMBOL,
+        timeframe=TIMEFRAME,
+        history_limit=FETCH_KLINE_LIMIT,
+        fetch=None,
+        clock=time.time,
+        indicator_state_file=None,
+        can_persist=None,
+    ):
+        """
+        fetch: K 線來源 (symbol, timeframe, limit) → 原始 OHLCV 列表或 None，預設為 fetch_bybit_ohlcv
+        clock: 目前時間 (秒)，模擬或重播時可替換
+        indicator_state_file: 指標狀態檔 (None 時不保存)
+        can_persist: 回傳目前是否可寫入指標狀態檔的函式 (HA 備援節點只讀不寫)，None 時一律寫入
+        """
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.history_limit = history_limit
+        self.fetch = fetch or fetch_bybit_ohlcv
+        self.clock = clock
+        self.aggregator = BarAggregator(TIMEFRAME_MS[timeframe])
+        self.history = BarBuffer(history_limit)  # 已收盤的 4 小時 K 線與指標
+        self.latest_1m = None  # 最新一根 1 分鐘 K 線 (Bar)
+        self.indicator_state_file = indicator_state_file
+        self.can_persist = can_persist
+        self.indicators = None  # IndicatorState
+        self._ready = False
+        self._last_minute_ms = None
+
+    @property
+    def ready(self):
+        return self._ready
+
+    def bootstrap(self):
+        """以 REST 取得已收盤的 4 小時歷史 K 線，目前週期交由 1 分鐘 K 線合成"""
+        rows = self.fetch(self.symbol, self.timeframe, self.history_limit + 1)
+        if not rows:
+            return False
 
-    # 計算平滑的TR和DM (使用指數移動平均)
-    atr = tr.ewm(alpha=alpha, adjust=False).mean()
-    plus_dm_smooth = plus_dm.ewm(alpha=alpha, adjust=False).mean()
-    minus_dm_smooth = minus_dm.ewm(alpha=alpha, adjust=False).mean()
+        now_ms = int(self.clock() * 1000)
+        current_bucket = bucket_start(now_ms, self.aggregator.timeframe_ms)
+        self.history.clear()
+        for row in rows:
+            if row[0] < current_bucket:
+                self.history.append(
+                    int(row[0]), open=row[1], high=row[2], low=row[3], close=row[4], volume=row[5]
+                )
+        self._restore_indicators()
+        self.aggregator.reset(current_bucket)
+        # 下一次輪詢從目前週期的第一分鐘開始補齊
+        self._last_minute_ms = current_bucket - MINUTE_MS
+        self._ready = True
+        return True
+
+    def poll(self):
+        """
+        取得最新的 1 分鐘 K 線並更新 4 小時 K 線。
+        回傳本次收盤的 4 小時 K 線時間列表 (可能為空)；請求失敗時回傳 None。
+        """
+        now_ms = int(self.clock() * 1000)
+        if self._last_minute_ms is None:
+            limit = 2
+        else:
+            limit = int((now_ms - self._last_minute_ms) // MINUTE_MS) + 2
 
-    # 計算DI
-    plus_di = 100 * (plus_dm_smooth / atr)
-    minus_di = 100 * (minus_dm_smooth / atr)
+        if limit > MAX_1M_FETCH_LIMIT:
+            logger.warning("⚠️ 1 分鐘資料中斷過久，重新同步 4 小時 K 線")
+            return self._resync()
 
-    # 計算DX和ADX
-    dx = 100 * abs(plus_di - minus_di) / (plus_di + minus_di)
-    adx = dx.ewm(alpha=alpha, adjust=False).mean()
+        rows = self.fetch(self.symbol, "1m", limit)
+        if not rows:
+            return None
 
-    return adx, plus_di, minus_di
+        self.latest_1m = Bar.from_ohlcv(rows[-1])
+        self._last_minute_ms = int(rows[-1][0])
+        closed_bars = self.aggregator.update_many(*zip(*rows))
+
+        closed_times = []
+        for bar in closed_bars:
+            if not bar["complete"]:
+                logger.warning("⚠️ 合成的 4 小時 K 線資料不完整，改用 REST 重新同步")
+                return self._resync()
+            self._append_history(
+                bar["time"], bar["open"], bar["high"], bar["low"], bar["close"], bar["volume"]
+            )
+            closed_times.append(self.history.time_at(-1))
+        return closed_times
 
+    def _append_history(self, time_ms, open_, high, low, close, volume):
+        """寫入預先配置的緩衝區 (容量滿時原地左移，丟棄最舊的K線)，並增量更新這根K線的指標"""
+        self.history.append(int(time_ms), open=open_, high=high, low=low, close=close, volume=volume)
+        self.indicators.apply_to(self.history, len(self.history) - 1)
+        self._save_indicators()
 
-def calculate_rsi(close, period=14):
-    """計算RSI指標"""
-    delta = close.diff()
-    gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
-    rs = gain / loss
-    rsi = 100 - (100 / (1 + rs))
-    return rsi
+    def _restore_indicators(self):
+        """
+        延續記憶體或檔案中的指標狀態，只補算之後的K線；
+        狀態與歷史K線接不上 (停機太久或沒有狀態) 時以目前的歷史K線重新計算
+        """
+        history = self.history
+        if not len(history):
+            return
+        state = self.indicators or IndicatorState.load(self.indicator_state_file)
+        first_ms = int(history.times[0])
+        step = self.aggregator.timeframe_ms
+        if state is None or state.last_time_ms is None or state.last_time_ms < first_ms - step:
+            state = IndicatorState()
+            state.apply_to(history)
+            logger.info(f"📐 以 {len(history)} 根K線重新計算指標")
+        else:
+            caught_up = state.apply_to(history)
+            logger.info(f"📐 指標狀態已延續 (累積 {state.bars} 根K線)，補算 {caught_up} 根")
+        self.indicators = state
+        self._save_indicators()
 
+    def _save_indicators(self):
+        if self.can_persist is not None and not self.can_persist():
+            return
+        if self.indicator_state_file and self.indicators is not None:
+            self.indicators.save(self.indicator_state_file)
 
-def calculate_macd(close, fast=12, slow=26, signal=9):
-    """計算MACD指標"""
-    ema_fast = calculate_ema(close, fast)
-    ema_slow = calculate_ema(close, slow)
-    macd_line = ema_fast - ema_slow
-    signal_line = calculate_ema(macd_line, signal)
-    histogram = macd_line - signal_line
-    return macd_line, signal_line, histogram
+    def latest_bar(self):
+        """最新一根已收盤的K線 (含指標)；指標尚未就緒時回傳 None"""
+        if not len(self.history):
+            return None
+        bar = self.history.bar(-1)
+        if any(math.isnan(getattr(bar, f)) for f in BAR_FIELDS):
+            return None
+        return bar
 
+    def _resync(self):
+        """以 REST 重建 4 小時歷史 (目前週期由下一次輪詢重新補齊)，回傳比原歷史更新的收盤 K 線時間"""
+        history = self.history
+        last_known = int(history.times[history.length - 1]) if self.ready and len(history) else None
+        if not self.bootstrap():
+            return None
+        times = history.times[: history.length]
+        if last_known is None:
+            return [history.time_at(-1)] if len(history) else []
+        return [history.time_at(i) for i in range(len(history)) if times[i] > last_known]
 
-def calculate_indicators(df):
-    """計算所有技術指標"""
-    df = df.copy()
 
-    # EMA指標
-    df["ema90"] = calculate_ema(df["close"], 90)
-    df["ema200"] = calculate_ema(df["close"], 200)
+# --- 1c. 收盤排程 (UTC 對齊) ---
+class BarCloseScheduler:
+    """
+    4 小時 K 線收盤排程：
+    - 依 UTC 週期邊界計算下次收盤時間，主循環在「邊界 + 緩衝秒數」時立即輪詢，不必等下一次60秒輪詢
+    - 收盤K線尚未出現時以指數退避重試，超過次數後改回一般輪詢
+    - 記錄收盤到完成交易判斷的延遲
+    """
 
-    # ADX指標
-    adx, plus_di, minus_di = calculate_adx(df["high"], df["low"], df["close"], 14)
-    df["adx"] = adx
-    df["plus_di"] = plus_di
-    df["minus_di"] = minus_di
+    def __init__(
+        self,
+        timeframe=TIMEFRAME,
+        settle_seconds=BAR_CLOSE_SETTLE_SECONDS,
+        retry_initial_seconds=BAR_CLOSE_RETRY_INITIAL_SECONDS,
+        retry_max_seconds=BAR_CLOSE_RETRY_MAX_SECONDS,
+        max_retries=BAR_CLOSE_MAX_RETRIES,
+    ):
+        self.timeframe_ms = TIMEFRAME_MS[timeframe]
+        self.settle_seconds = settle_seconds
+        self.retry_initial_seconds = retry_initial_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.max_retries = max_retries
+        self.next_close_ms = None  # 下一個週期邊界 (毫秒)
+        self.latencies = deque(maxlen=100)  # 最近的收盤→判斷延遲 (秒)
+        self._due = None  # 下一次排程輪詢的時間 (秒)
+        self._retries = 0
+        self._retry_delay = retry_initial_seconds
+
+    def schedule(self, now):
+        """排定 now 之後的下一個週期邊界"""
+        now_ms = int(now * 1000)
+        self.next_close_ms = bucket_start(now_ms, self.timeframe_ms) + self.timeframe_ms
+        self._due = self.next_close_ms / 1000 + self.settle_seconds
+        self._retries = 0
+        self._retry_delay = self.retry_initial_seconds
+
+    def is_due(self, now):
+        return self._due is not None and now >= self._due
+
+    def seconds_until_due(self, now):
+        if self._due is None:
+            return float("inf")
+        return max(0.0, self._due - now)
+
+    def on_poll(self, closed, now):
+        """
+        每次輪詢後呼叫。closed: 本次是否有K線收盤。
+        已收盤 → 排定下一個週期；排程時間已到但尚未收盤 → 退避重試
+        """
+        if closed:
+            self.schedule(now)
+            return
+        if not self.is_due(now):
+            return
 
-    # RSI指標
-    df["rsi"] = calculate_rsi(df["close"], 14)
+        self._retries += 1
+        if self._retries > self.max_retries:
+            logger.warning(
+                f"⚠️ 收盤K線在邊界後 {now - self.next_close_ms / 1000:.0f} 秒仍未出現，改回一般輪詢"
+            )
+            self.schedule(now)
+            return
+        self._due = now + self._retry_delay
+        self._retry_delay = min(self._retry_delay * 2, self.retry_max_seconds)
 
-    # MACD指標
-    macd_line, signal_line, histogram = calculate_macd(df["close"])
-    df["macd"] = macd_line
-    df["macd_signal"] = signal_line
-    df["macd_histogram"] = histogram
+    def record_decision(self, bar_time, now):
+        """記錄K線收盤 (bar_time 為 UTC 開盤時間) 到完成交易判斷的延遲，回傳秒數"""
+        close_seconds = (
+            bar_time.replace(tzinfo=timezone.utc).timestamp() + self.timeframe_ms / 1000
+        )
+        latency = now - close_seconds
+        self.latencies.append(latency)
+        return latency
 
-    return df.dropna()
+    def latency_stats(self):
+        """最近收盤延遲的中位數與最大值 (秒)"""
+        if not self.latencies:
+            return {}
+        ordered = sorted(self.latencies)
+        return {"p50": ordered[len(ordered) // 2], "max": ordered[-1], "count": len(ordered)}
 
 
 # --- 3. 交易邏輯實現 ---
 class TradingStrategy:
-    def __init__(self, custom_params=None):
+    def __init__(self, custom_params=None, lease=None):
         """
         初始化交易策略
         custom_params: 可選的自定義參數字典，會覆蓋預設參數
+        lease: HA 模式的 LeaderLease；提供時只有主節點可以下單與寫入狀態檔
         """
         # 使用預設參數，並允許自定義覆蓋
         params = STRATEGY_PARAMS.copy()
@@ -201,6 +600,9 @@ class TradingStrategy:
         # 資金管理設定
         self.default_qty_percent = DEFAULT_QTY_PERCENT
 
+        # 主備租約 (None 表示單一實例，永遠視為主節點)
+        self.lease = lease
+
         # ccxt 交易所實例 - 統一帳戶合約交易
         self.exchange = ccxt.bybit(
             {
@@ -216,96 +618,13 @@ class TradingStrategy:
                 "enableRateLimit": True,  # 啟用速率限制，避免被交易所 ban IP
             }
         )
+        if TRAFFIC_RECORDER is not None:
+            # 錄製所有交易所請求，並保存啟動時的本地狀態 (重播時由同一個起點開始)
+            self.exchange = TRAFFIC_RECORDER.wrap(self.exchange, "private")
+            TRAFFIC_RECORDER.startup_files([STATE_FILE, PENDING_ORDERS_FILE, TRAIL_JOURNAL_FILE])
 
-        # 同步時間
-        try:
-            self.exchange.load_time_difference()
-        except:
-            pass
-        self.exchange.load_markets()
         self.symbol = SYMBOL
 
-        # 提醒用戶確認槓桿設置
-        print("⚠️ 重要提醒: 請確認在Bybit平台手動設置ETH/USDT槓桿為1倍")
-        print("   1. 登入Bybit網站 -> 合約交易")
-        print("   2. 選擇ETH/USDT交易對")
-        print("   3. 將槓桿設置為1x")
-        print("   4. 確認設置後再開始交易")
-
-        # 嘗試從檔案加載狀態
-        if not self.load_state():
-            print("未找到或無法加載狀態檔案，初始化策略狀態...")
-            self.current_capital = self._get_free_balance()  # 從 Bybit 獲取當前可用資金
-            self.position_size = (
-                self._get_current_position_size()
-            )  # 從 Bybit 獲取當前持倉
-
-            self.entry_price = 0  # 添加缺失的屬性
-            self.long_entry_price = None
-            self.long_peak = None
-            self.long_trail_stop_price = None
-            self.is_long_trail_active = False
-
-            self.short_entry_price = None
-            self.short_trough = None
-            self.short_trail_stop_price = None
-            self.is_short_trail_active = False
-
-            self.peak_capital = self.current_capital
-            self.max_drawdown = 0.0
-        else:
-            print("策略狀態已從檔案加載。")
-            # 🔧 重要修正：加載後必須重新同步實際持倉和進場價格
-            self.current_capital = self._get_free_balance()
-            actual_position = self._get_current_position_size()
-
-            # � 重要修正：加載後必須重新同步實際持倉和進場價格
-            if actual_position != 0:
-                actual_avg_price = self._get_position_avg_price()
-
-                if actual_avg_price and actual_avg_price > 0:
-                    old_price = self.long_entry_price if actual_position > 0 else self.short_entry_price
-
-                    # 只有在價格不同時才顯示更新訊息
-                    if abs(actual_avg_price - (old_price or 0)) > 0.01:
-                        print(f"🔧 進場價格同步: ${old_price} → ${actual_avg_price:.2f}")
-
-                    self.entry_price = actual_avg_price
-                    self.position_size = actual_position
-                    if actual_position > 0:
-                        self.long_entry_price = actual_avg_price
-                        # 重置空單相關狀態
-                        self.short_entry_price = None
-                        self.short_trough = None
-                        self.short_trail_stop_price = None
-                        self.is_short_trail_active = False
-                    else:
-                        self.short_entry_price = actual_avg_price
-                        # 重置多單相關狀態
-                        self.long_entry_price = None
-                        self.long_peak = None
-                        self.long_trail_stop_price = None
-                        self.is_long_trail_active = False
-
-                    self.save_state()  # 保存更正後的狀態
-            else:
-                # 無持倉時重置所有進場相關狀態
-                self.position_size = 0
-                self.entry_price = 0
-                self.long_entry_price = None
-                self.short_entry_price = None
-                self.long_peak = None
-                self.long_trail_stop_price = None
-                self.is_long_trail_active = False
-                self.short_trough = None
-                self.short_trail_stop_price = None
-                self.is_short_trail_active = False
-                self.save_state()
-
-            print(
-                f"📊 帳戶狀態：未使用資金: {self.current_capital:.2f} USDT, 持倉量: {self.position_size:.3f} {SYMBOL.split('/')[0]}"
-            )
-
         # 策略參數設定
         self.adx_threshold = params["adx_threshold"]
         self.long_fixed_stop_loss_percent = params["long_fixed_stop_loss_percent"]
@@ -327,21 +646,180 @@ class TradingStrategy:
 
         self.trade_log = []  # 實時交易日誌記錄
 
-        print(
-            f"✅ 策略初始化完成 | 未使用資金: {self.current_capital:.2f} USDT | 持倉: {self.position_size:.3f} {SYMBOL.split('/')[0]}"
+        # 部位大小策略 (fixed_percent 使用此實例的 default_qty_percent)
+        sizing_params = dict(SIZING_PARAMS[SIZING_POLICY])
+        if SIZING_POLICY == "fixed_percent":
+            sizing_params["qty_percent"] = self.default_qty_percent
+        self.sizing = SizingPolicy(SIZING_POLICY, **sizing_params)
+
+        # 風控引擎：以成交與標記價格增量計算權益與回撤，啟動查詢完成後再以交易所資料對齊
+        self.risk = RiskEngine(
+            RiskLimits(
+                max_drawdown=RISK_MAX_DRAWDOWN,
+                max_gross_exposure=RISK_MAX_GROSS_EXPOSURE,
+                max_symbol_exposure=RISK_MAX_SYMBOL_EXPOSURE,
+            )
+        )
+
+        # 待確認訂單表：每筆訂單以 orderLinkId 登記，重試沿用同一個 id 避免重複下單
+        self.pending_orders = PendingOrderTable(PENDING_ORDERS_FILE)
+
+        # 訂單簿快取：進場數量的深度檢查與掛單共用同一份快照
+        self.book_cache = OrderBookCache(self.exchange, self.symbol, depth=ORDER_BOOK_DEPTH)
+
+        # 下單執行演算法 (市價單仍走 _place_order 的備援流程)
+        self.executor = OrderExecutor(
+            self.exchange,
+            self.symbol,
+            lambda side, qty: self._place_order(side, qty, "market"),
+            taker_fee_rate=TAKER_FEE_RATE,
+            maker_fee_rate=MAKER_FEE_RATE,
+            chase_seconds=POST_ONLY_CHASE_SECONDS,
+            max_chases=POST_ONLY_MAX_CHASES,
+            twap_slices=TWAP_SLICES,
+            twap_interval_seconds=TWAP_INTERVAL_SECONDS,
+            twap_min_qty=TWAP_MIN_QTY,
+            book_cache=self.book_cache,
+            pending_orders=self.pending_orders,
+            can_trade=lambda: self.is_leader,
+        )
+
+        # 持倉狀態 (持倉同步會讀寫這些欄位，必須在查詢交易所之前建立)
+        self.state = PositionState()
+
+        # 移動停損狀態日誌，每次峰值/停損價變動都會寫入，用於崩潰後精確恢復
+        self.trail_journal = TrailJournal(TRAIL_JOURNAL_FILE)
+        try:
+            # 必須在任何 save_state 之前讀取，否則會被啟動過程中的推估狀態覆蓋
+            journal_record = self.trail_journal.load_last()
+        except Exception as e:
+            logger.error(f"❌ 讀取移動停損日誌失敗: {e}")
+            journal_record = None
+
+        # 提醒用戶確認槓桿設置
+        logger.warning("⚠️ 重要提醒: 請確認在Bybit平台手動設置ETH/USDT槓桿為1倍")
+        logger.info("   1. 登入Bybit網站 -> 合約交易")
+        logger.info("   2. 選擇ETH/USDT交易對")
+        logger.info("   3. 將槓桿設置為1x")
+        logger.info("   4. 確認設置後再開始交易")
+
+        # 並行查詢時間差、市場資訊、餘額與持倉
+        init_start = time.perf_counter()
+        free_balance, total_balance, positions = self._warm_start_exchange()
+        logger.info(f"⚡ 交易所初始化查詢耗時 {time.perf_counter() - init_start:.2f} 秒")
+
+        # 只有上次崩潰時留下結果不明的訂單才需要額外查詢 (備援節點在接手時才處理)
+        if self.is_leader:
+            self._resolve_pending_orders()
+
+        # 嘗試從檔案加載狀態
+        if not self.load_state():
+            logger.info("未找到或無法加載狀態檔案，初始化策略狀態...")
+            self.state.current_capital = free_balance  # 從 Bybit 獲取當前可用資金
+            self.state.position_size = self._get_current_position_size(
+                positions
+            )  # 從 Bybit 獲取當前持倉
+            self.state.peak_capital = self.state.current_capital
+        else:
+            logger.info("策略狀態已從檔案加載。")
+            # 🔧 重要修正：加載後必須重新同步實際持倉和進場價格 (以啟動時並行查詢的結果對帳)
+            if self.state.peak_capital is None:
+                self.state.peak_capital = free_balance
+            if positions is not None:
+                self.reconcile(
+                    "啟動",
+                    ExchangeSnapshot(positions, free_balance=free_balance, total_balance=total_balance),
+                )
+            else:
+                self.state.current_capital = free_balance
+
+            logger.info(
+                f"📊 帳戶狀態：未使用資金: {self.state.current_capital:.2f} USDT, 持倉量: {self.state.position_size:.3f} {SYMBOL.split('/')[0]}"
+            )
+
+        self._sync_risk_engine(total_balance, positions)
+
+        # 用日誌中的真實峰值/谷值覆蓋啟動時的推估值，並補上停機期間的高低點
+        self._restore_trail_state(journal_record)
+
+        logger.info(
+            f"✅ 策略初始化完成 | 未使用資金: {self.state.current_capital:.2f} USDT | 持倉: {self.state.position_size:.3f} {SYMBOL.split('/')[0]}"
         )
 
+    @property
+    def is_leader(self):
+        return self.lease is None or self.lease.is_leader
+
     def _get_free_balance(self, currency="USDT"):
         """獲取 Bybit 帳戶的可用資金"""
         try:
             balance = self.exchange.fetch_balance()
             return balance["free"][currency]
         except Exception as e:
-            print(f"獲取帳戶餘額失敗: {e}")
+            logger.error(f"獲取帳戶餘額失敗: {e}")
             return 0
 
-    def _get_current_position_size(self):
-        """獲取 Bybit 統一帳戶當前指定交易對的持倉量，並同步進場價格"""
+    def _get_balances(self, currency="USDT"):
+        """一次查詢取得 (可用資金, 錢包餘額)，失敗時回傳 (0, 0)"""
+        try:
+            balance = self.exchange.fetch_balance()
+            return balance["free"][currency], balance["total"][currency]
+        except Exception as e:
+            logger.error(f"獲取帳戶餘額失敗: {e}")
+            return 0, 0
+
+    def _sync_risk_engine(self, total_balance, positions=None):
+        """以交易所餘額與持倉重新對齊風控引擎 (啟動與定期校正時呼叫)"""
+        mark_price = None
+        for pos in positions or []:
+            if float(pos.get("size", 0) or 0) > 0:
+                try:
+                    mark_price = float(pos.get("markPrice"))
+                except (TypeError, ValueError):
+                    pass
+        self.risk.set_position(
+            self.symbol, self.state.position_size, self.state.entry_price, mark_price
+        )
+        if total_balance is not None:
+            self.risk.sync_balance(total_balance)
+        self.risk.restore(self.state.peak_capital, self.state.max_drawdown)
+
+    def _warm_start_exchange(self):
+        """
+        啟動時並行執行交易所查詢 (時間同步、市場資訊、餘額、持倉)，並在背景預先載入 pandas。
+        回傳 (可用資金, 錢包餘額, 持倉列表)。
+        """
+        markets_cached = load_cached_markets(self.exchange, self.symbol)
+
+        with ThreadPoolExecutor(max_workers=5 if FAST_START else 1) as pool:
+            pool.submit(importlib.import_module, "pandas")
+            pool.submit(self._load_time_difference)
+            markets_future = (
+                None
+                if markets_cached
+                else pool.submit(ensure_markets, self.exchange, self.symbol)
+            )
+
+            def fetch_balances():
+                # fetch_balance 內部需要市場資訊，等市場載入完成以免重複 load_markets
+                if markets_future is not None:
+                    markets_future.result()
+                return self._get_balances()
+
+            balance_future = pool.submit(fetch_balances)
+            positions_future = pool.submit(self._fetch_position_list)
+            free_balance, total_balance = balance_future.result()
+            return free_balance, total_balance, positions_future.result()
+
+    def _load_time_difference(self):
+        """同步本地與交易所的時間差 (recvWindow 為2分鐘，可與其他請求並行)"""
+        try:
+            self.exchange.load_time_difference()
+        except:
+            pass
+
+    def _fetch_position_list(self):
+        """查詢 Bybit v5 持倉列表原始資料，失敗時回傳 None"""
         try:
             # 使用原始API直接獲取持倉（這個方法有效）
             if hasattr(self.exchange, "private_get_v5_position_list"):
@@ -349,159 +827,181 @@ class TradingStrategy:
                 response = self.exchange.private_get_v5_position_list(params)
 
                 if "result" in response and "list" in response["result"]:
-                    positions = response["result"]["list"]
-                    for pos in positions:
-                        size = float(pos.get("size", 0))
-                        if size > 0:
-                            side = pos.get("side", "")
-                            avg_price = (
-                                float(pos.get("avgPrice", 0))
-                                if pos.get("avgPrice") != "N/A"
-                                else 0
+                    return response["result"]["list"]
+            return []
+        except Exception as e:
+            logger.error(f"獲取持倉失敗: {e}")
+            return None
+
+    def _get_current_position_size(self, positions=None):
+        """
+        獲取 Bybit 統一帳戶當前指定交易對的持倉量，並同步進場價格
+        positions: 可選，已查詢好的持倉列表，避免重複請求
+        """
+        try:
+            if positions is None:
+                positions = self._fetch_position_list()
+            for pos in positions or []:
+                size = float(pos.get("size", 0))
+                if size > 0:
+                    side = pos.get("side", "")
+                    avg_price = (
+                        float(pos.get("avgPrice", 0))
+                        if pos.get("avgPrice") != "N/A"
+                        else 0
+                    )
+                    mark_price = pos.get("markPrice", "N/A")
+                    unrealized_pnl = pos.get("unrealisedPnl", "N/A")
+
+                    # 持倉檢測（簡化日誌）
+                    side_text = "多單" if side == "Buy" else "空單"
+
+                    # 🔧 修正：同步進場價格到策略狀態
+                    if side == "Buy" and avg_price > 0:
+                        # 如果檢測到多單但策略狀態中沒有進場價格，則同步
+                        if (
+                            self.state.long_entry_price is None
+                            or self.state.long_entry_price == 0
+                        ):
+                            self.state.long_entry_price = avg_price
+                            self.state.entry_price = avg_price
+
+
+                            # 🔧 修正移動停損初始化：嘗試恢復合理的移動停損狀態
+                            current_price = (
+                                float(mark_price)
+                                if mark_price != "N/A"
+                                else avg_price
+                            )
+                            profit_percent = (
+                                current_price - avg_price
+                            ) / avg_price
+
+                            # 如果當前已有利潤且超過激活閾值，應該激活移動停損
+                            if (
+                                profit_percent
+                                > self.long_trailing_activate_profit_percent
+                            ):
+                                self.state.long_peak = (
+                                    current_price  # 設定當前價格為峰值
+                                )
+                                self.state.long_trail_stop_price = avg_price * (
+                                    1 + self.long_trailing_min_profit_percent
+                                )
+                                self.state.is_long_trail_active = True
+                                logger.info(
+                                    f"🔧 恢復移動停損狀態: 峰值${self.state.long_peak:.2f}, 止損價${self.state.long_trail_stop_price:.2f}"
+                                )
+                            else:
+                                # 如果沒有足夠利潤，重置移動停損狀態
+                                self.state.long_peak = None
+                                self.state.long_trail_stop_price = None
+                                self.state.is_long_trail_active = False
+
+
+                            self.save_state()
+                        return size
+                    elif side == "Sell" and avg_price > 0:
+                        # 如果檢測到空單但策略狀態中沒有進場價格，則同步
+                        if (
+                            self.state.short_entry_price is None
+                            or self.state.short_entry_price == 0
+                        ):
+                            self.state.short_entry_price = avg_price
+                            self.state.entry_price = avg_price
+
+
+                            # 🔧 修正移動停損初始化：嘗試恢復合理的移動停損狀態
+                            current_price = (
+                                float(mark_price)
+                                if mark_price != "N/A"
+                                else avg_price
                             )
-                            mark_price = pos.get("markPrice", "N/A")
-                            unrealized_pnl = pos.get("unrealisedPnl", "N/A")
-
-                            # 持倉檢測（簡化日誌）
-                            side_text = "多單" if side == "Buy" else "空單"
-
-                            # 🔧 修正：同步進場價格到策略狀態
-                            if side == "Buy" and avg_price > 0:
-                                # 如果檢測到多單但策略狀態中沒有進場價格，則同步
-                                if (
-                                    self.long_entry_price is None
-                                    or self.long_entry_price == 0
-                                ):
-                                    self.long_entry_price = avg_price
-                                    self.entry_price = avg_price
-
-
-                                    # 🔧 修正移動停損初始化：嘗試恢復合理的移動停損狀態
-                                    current_price = (
-                                        float(mark_price)
-                                        if mark_price != "N/A"
-                                        else avg_price
-                                    )
-                                    profit_percent = (
-                                        current_price - avg_price
-                                    ) / avg_price
-
-                                    # 如果當前已有利潤且超過激活閾值，應該激活移動停損
-                                    if (
-                                        profit_percent
-                                        > self.long_trailing_activate_profit_percent
-                                    ):
-                                        self.long_peak = (
-                                            current_price  # 設定當前價格為峰值
-                                        )
-                                        self.long_trail_stop_price = avg_price * (
-                                            1 + self.long_trailing_min_profit_percent
-                                        )
-                                        self.is_long_trail_active = True
-                                        print(
-                                            f"🔧 恢復移動停損狀態: 峰值${self.long_peak:.2f}, 止損價${self.long_trail_stop_price:.2f}"
-                                        )
-                                    else:
-                                        # 如果沒有足夠利潤，重置移動停損狀態
-                                        self.long_peak = None
-                                        self.long_trail_stop_price = None
-                                        self.is_long_trail_active = False
-
-
-                                    self.save_state()
-                                return size
-                            elif side == "Sell" and avg_price > 0:
-                                # 如果檢測到空單但策略狀態中沒有進場價格，則同步
-                                if (
-                                    self.short_entry_price is None
-                                    or self.short_entry_price == 0
-                                ):
-                                    self.short_entry_price = avg_price
-                                    self.entry_price = avg_price
-
-
-                                    # 🔧 修正移動停損初始化：嘗試恢復合理的移動停損狀態
-                                    current_price = (
-                                        float(mark_price)
-                                        if mark_price != "N/A"
-                                        else avg_price
-                                    )
-                                    profit_percent = (
-                                        avg_price - current_price
-                                    ) / avg_price
-
-                                    # 如果當前已有利潤且超過激活閾值，應該激活移動停損
-                                    if (
-                                        profit_percent
-                                        > self.short_trailing_activate_profit_percent
-                                    ):
-                                        self.short_trough = (
-                                            current_price  # 設定當前價格為谷值
-                                        )
-                                        self.short_trail_stop_price = avg_price * (
-                                            1 - self.short_trailing_min_profit_percent
-                                        )
-                                        self.is_short_trail_active = True
-                                        print(
-                                            f"🔧 恢復移動停損狀態: 谷值${self.short_trough:.2f}, 止損價${self.short_trail_stop_price:.2f}"
-                                        )
-                                    else:
-                                        # 如果沒有足夠利潤，重置移動停損狀態
-                                        self.short_trough = None
-                                        self.short_trail_stop_price = None
-                                        self.is_short_trail_active = False
-
-
-                                    self.save_state()
-                                return -size
-
-            print("📊 無持倉")
+                            profit_percent = (
+                                avg_price - current_price
+                            ) / avg_price
+
+                            # 如果當前已有利潤且超過激活閾值，應該激活移動停損
+                            if (
+                                profit_percent
+                                > self.short_trailing_activate_profit_percent
+                            ):
+                                self.state.short_trough = (
+                                    current_price  # 設定當前價格為谷值
+                                )
+                                self.state.short_trail_stop_price = avg_price * (
+                                    1 - self.short_trailing_min_profit_percent
+                                )
+                                self.state.is_short_trail_active = True
+                                logger.info(
+                                    f"🔧 恢復移動停損狀態: 谷值${self.state.short_trough:.2f}, 止損價${self.state.short_trail_stop_price:.2f}"
+                                )
+                            else:
+                                # 如果沒有足夠利潤，重置移動停損狀態
+                                self.state.short_trough = None
+                                self.state.short_trail_stop_price = None
+                                self.state.is_short_trail_active = False
+
+
+                            self.save_state()
+                        return -size
+
+            logger.info("📊 無持倉")
             return 0
 
         except Exception as e:
-            print(f"獲取持倉失敗: {e}")
+            logger.error(f"獲取持倉失敗: {e}")
             return 0
 
-    def _get_position_avg_price(self):
-        """獲取當前持倉的平均進場價格"""
+    def _get_position_avg_price(self, positions=None):
+        """
+        獲取當前持倉的平均進場價格
+        positions: 可選，已查詢好的持倉列表，避免重複請求
+        """
         try:
-            # 使用原始API直接獲取持倉
-            if hasattr(self.exchange, "private_get_v5_position_list"):
-                params = {"category": "linear", "symbol": "ETHUSDT"}
-                response = self.exchange.private_get_v5_position_list(params)
-
-                if "result" in response and "list" in response["result"]:
-                    positions = response["result"]["list"]
-
-                    for pos in positions:
-                        size = float(pos.get("size", 0))
-                        avg_price = pos.get("avgPrice", "N/A")
-
-                        if size > 0:
-                            if avg_price != "N/A" and avg_price != "" and avg_price != "0":
-                                try:
-                                    return float(avg_price)
-                                except:
-                                    pass
+            if positions is None:
+                positions = self._fetch_position_list()
+
+            for pos in positions or []:
+                size = float(pos.get("size", 0))
+                avg_price = pos.get("avgPrice", "N/A")
+
+                if size > 0:
+                    if avg_price != "N/A" and avg_price != "" and avg_price != "0":
+                        try:
+                            return float(avg_price)
+                        except:
+                            pass
             return None
         except Exception as e:
-            print(f"❌ 獲取持倉平均價格失敗: {e}")
+            logger.error(f"❌ 獲取持倉平均價格失敗: {e}")
             return None
 
-    def _place_order(self, side, trade_qty, price_type="market"):
-        """下單到 Bybit 統一帳戶"""
+    def _place_order(self, side, trade_qty, price_type="market", link_id=None):
+        """
+        下單到 Bybit 統一帳戶
+        link_id: orderLinkId，未提供時自動產生；所有重試沿用同一個 id，交易所會拒絕重複的訂單
+        """
+        if not self.is_leader:
+            logger.error(f"🚫 非主節點，拒絕下單: {side} {trade_qty} {self.symbol}")
+            return None
         try:
             # 確保數量是非零的
             if trade_qty <= 0:
-                print(f"嘗試下單數量為 {trade_qty}，訂單取消。")
+                logger.info(f"嘗試下單數量為 {trade_qty}，訂單取消。")
                 return None
 
+            # 送出前先登記，崩潰重啟後才知道這筆訂單可能已送達
+            link_id = link_id or new_client_order_id()
+            self.pending_orders.add(link_id, side, trade_qty, type=price_type)
+
             # 嘗試不同的下單參數組合
-            print(f"🔄 嘗試下單: {side} {trade_qty} {self.symbol}")
+            logger.info(f"🔄 嘗試下單: {side} {trade_qty} {self.symbol} (orderLinkId={link_id})")
 
             # 方法1: 強制使用線性合約參數
             try:
-                params = {"category": "linear"}  # 強制使用合約交易
+                # 強制使用合約交易
+                params = {"category": "linear", "clientOrderId": link_id}
                 order = self.exchange.create_order(
                     symbol=self.symbol,
                     type=price_type,
@@ -511,9 +1011,10 @@ class TradingStrategy:
                     params=params,
                 )
             except Exception as e1:
-                print(f"方法1失敗: {e1}")
+                logger.error(f"方法1失敗: {e1}")
 
                 # 方法2: 使用原始API確保合約交易
+                # 沿用同一個 orderLinkId：若方法1其實已送達 (例如逾時)，交易所會回報重複而不會再下一次單
                 try:
                     if hasattr(self.exchange, "private_post_v5_order_create"):
                         order_params = {
@@ -522,6 +1023,7 @@ class TradingStrategy:
                             "side": side.capitalize(),
                             "orderType": "Market",
                             "qty": str(trade_qty),
+                            "orderLinkId": link_id,
                         }
                         response = self.exchange.private_post_v5_order_create(
                             order_params
@@ -548,12 +1050,37 @@ class TradingStrategy:
                         else:
                             raise Exception(f"API錯誤: {response}")
                     else:
-                        raise Exception("無可用的下單方法")
+                        raise e1  # 沒有備援方法時以方法1的錯誤判斷訂單是否可能已送達
                 except Exception as e2:
-                    print(f"方法2失敗: {e2}")
-                    raise e2
-            print(
-                f"下單成功: {order['side']} {order['amount']} {order['symbol']} @ {order.get('price', 'N/A')} (類型: {order['type']})"
+                    if str(DUPLICATE_ORDER_LINK_ID_CODE) in str(e2):
+                        # ccxt 將 110072 以 InvalidOrder 拋出：方法1其實已送達交易所，查詢成交結果而非當作失敗
+                        logger.warning(
+                            f"⚠️ 訂單 {link_id} 已由方法1送達交易所，不重複下單，查詢成交結果"
+                        )
+                        order = self._lookup_order(link_id)
+                        if order is None:
+                            raise OrderOutcomeUnknown(f"查詢不到已送達的訂單 {link_id}")
+                    elif isinstance(e2, ccxt.NetworkError):
+                        # 兩次都是網路錯誤，訂單可能已送達：以 orderLinkId 查詢一次
+                        logger.error(f"方法2失敗: {e2}")
+                        order = self._lookup_order(link_id)
+                        if order is None:
+                            raise e2
+                    else:
+                        logger.error(f"方法2失敗: {e2}")
+                        raise e2
+            self.pending_orders.mark(link_id, FILLED, order_id=order["id"])
+            logger.info(
+                f"下單成功: {order['side']} {order['amount']} {order['symbol']} @ {order.get('price', 'N/A')} (類型: {order['type']})",
+                extra={
+                    "fields": {
+                        "event": "order_placed",
+                        "side": side,
+                        "qty": trade_qty,
+                        "price": order.get("price"),
+                        "order_id": order["id"],
+                    }
+                },
             )
             self.trade_log.append(
                 {
@@ -563,12 +1090,14 @@ class TradingStrategy:
                     "qty": trade_qty,
                     "status": "PLACED",
                     "order_id": order["id"],
+                    "order_link_id": link_id,
                 }
             )
             return order
         except ccxt.InsufficientFunds as e:
-            print(f"資金不足，無法下單 {side} {trade_qty} {self.symbol}")
-            print(f"詳細錯誤: {e}")
+            self.pending_orders.mark(link_id, FAILED, error=str(e))
+            logger.error(f"❌ 資金不足，無法下單 {side} {trade_qty} {self.symbol}")
+            logger.error(f"詳細錯誤: {e}")
             self.trade_log.append(
                 {
                     "time": datetime.now().isoformat(),
@@ -577,7 +1106,8 @@ class TradingStrategy:
                 }
             )
         except ccxt.InvalidOrder as e:
-            print(f"無效訂單: {e}")
+            self.pending_orders.mark(link_id, FAILED, error=str(e))
+            logger.error(f"❌ 無效訂單: {e}")
             self.trade_log.append(
                 {
                     "time": datetime.now().isoformat(),
@@ -586,7 +1116,13 @@ class TradingStrategy:
                 }
             )
         except Exception as e:
-            print(f"下單失敗: {e}")
+            # 網路錯誤或查詢不到已送達的訂單時無法確認結果，保留為 unknown，重啟或下次校正時再以 orderLinkId 查詢；
+            # 其他錯誤是交易所明確拒絕 (同一個 orderLinkId 從未成立)，標記為 failed
+            if isinstance(e, (ccxt.NetworkError, OrderOutcomeUnknown)):
+                self.pending_orders.mark(link_id, UNKNOWN, error=str(e))
+            else:
+                self.pending_orders.mark(link_id, FAILED, error=str(e))
+            logger.error(f"下單失敗: {e}")
             self.trade_log.append(
                 {
                     "time": datetime.now().isoformat(),
@@ -594,78 +1130,212 @@ class TradingStrategy:
                     "details": str(e),
                 }
             )
+        return None
+
+    def _lookup_order(self, link_id):
+        """以 orderLinkId 查詢訂單 (先查即時訂單，再查歷史訂單)，回傳與 _place_order 相同格式的 dict"""
+        params = {"category": "linear", "orderLinkId": link_id}
+        for endpoint in ("private_get_v5_order_realtime", "private_get_v5_order_history"):
+            if not hasattr(self.exchange, endpoint):
+                continue
+            try:
+                response = getattr(self.exchange, endpoint)(params)
+            except Exception as e:
+                logger.warning(f"⚠️ 查詢訂單 {link_id} 失敗: {e}")
+                continue
+            orders = response.get("result", {}).get("list", [])
+            if not orders:
+                continue
+            raw = orders[0]
+            filled = float(raw.get("cumExecQty") or 0)
+            try:
+                price = float(raw.get("avgPrice") or 0) or None
+            except (TypeError, ValueError):
+                price = None
+            return {
+                "id": raw.get("orderId"),
+                "side": raw.get("side", "").lower(),
+                "amount": float(raw.get("qty") or 0),
+                "filled": filled,
+                "price": price,
+                "symbol": self.symbol,
+                "type": raw.get("orderType", "").lower(),
+                "status": ORDER_STATUS_MAP.get(raw.get("orderStatus"), "open"),
+            }
+        return None
+
+    def _resolve_pending_orders(self):
+        """啟動時以 orderLinkId 確認上次結果不明的訂單 (只查詢這些訂單)"""
+        for record in self.pending_orders.unresolved():
+            link_id = record["link_id"]
+            order = self._lookup_order(link_id)
+            if order is None:
+                self.pending_orders.mark(link_id, FAILED, error="交易所查無此訂單")
+                logger.info(f"🧾 訂單 {link_id} 未送達交易所")
+                continue
+            if order["status"] == "open":
+                # 上次流程中斷時留下的掛單 (例如 PostOnly)：已無流程追蹤，撤單後以最終狀態為準
+                try:
+                    self.exchange.cancel_order(order["id"], self.symbol, params={"category": "linear"})
+                    order = self._lookup_order(link_id) or order
+                except Exception as e:
+                    logger.warning(f"⚠️ 撤銷遺留掛單 {link_id} 失敗: {e}")
+            if order["filled"] > 0:
+                self.pending_orders.mark(link_id, FILLED, order_id=order["id"], filled=order["filled"])
+                logger.warning(
+                    f"🧾 上次結果不明的訂單 {link_id} 已成交: {order['side']} {order['filled']}"
+                )
+            elif order["status"] in ("canceled", "rejected"):
+                self.pending_orders.mark(link_id, CANCELLED, order_id=order["id"], error=f"交易所狀態: {order['status']}")
+                logger.info(f"🧾 上次結果不明的訂單 {link_id} 未成交 ({order['status']})")
+            else:
+                logger.warning(f"⚠️ 訂單 {link_id} 仍掛在交易所且未成交，保留待確認")
+
+    def _cap_qty_by_depth(self, side, trade_qty, qty_step, min_amount):
+        """依訂單簿深度將進場數量限制在滑價預算 (MAX_ENTRY_SLIPPAGE_BPS) 內；低於最小交易量時回傳 0"""
+        try:
+            book = self.book_cache.get()
+        except Exception as e:
+            logger.warning(f"⚠️ 取得訂單簿失敗，略過深度檢查: {e}")
+            return trade_qty
+
+        max_qty = round_down(book.max_qty_within_slippage(side, MAX_ENTRY_SLIPPAGE_BPS), qty_step)
+        if trade_qty > max_qty:
+            logger.warning(
+                f"⚠️ 訂單簿深度不足，進場數量由 {trade_qty} 調整為 {max_qty} (滑價預算 {MAX_ENTRY_SLIPPAGE_BPS} bps)"
+            )
+            trade_qty = max_qty
+            if trade_qty < min_amount:
+                logger.error(f"❌ 調整後數量 {trade_qty} 小於最小交易量 {min_amount}，跳過交易。")
+                return 0
+
+        expected_price = book.expected_fill_price(side, trade_qty)
+        if expected_price is not None:
+            logger.info(
+                f"📚 預期成交均價 ${expected_price:.2f} (中間價 ${book.mid:.2f})",
+                extra={
+                    "fields": {
+                        "event": "expected_fill",
+                        "side": side,
+                        "qty": trade_qty,
+                        "expected_price": expected_price,
+                        "mid": book.mid,
+                    }
+                },
+            )
+        return trade_qty
+
+    def _check_risk(self, side, trade_qty, price):
+        """新進場前的風控檢查，不通過時回傳 0"""
+        if trade_qty <= 0:
+            return trade_qty
+        allowed, reason = self.risk.check_order(self.symbol, side, trade_qty, price)
+        if not allowed:
+            logger.warning(
+                f"🛑 風控拒絕進場: {reason}",
+                extra={"fields": {"event": "risk_rejected", "side": side, "qty": trade_qty}},
+            )
+            return 0
+        return trade_qty
+
+    def _execute_order(self, side, trade_qty, action, reference_price=None):
+        """
+        依動作 (entry / exit) 選擇執行模式下單，記錄成交品質
+        reference_price: 計算滑價的參考價 (觸發訊號的K線收盤價)
+        回傳與 _place_order 相同格式的訂單 dict，全部失敗時回傳 None
+        """
+        if trade_qty <= 0:
+            logger.info(f"嘗試下單數量為 {trade_qty}，訂單取消。")
+            return None
+        if not self.is_leader:
+            logger.error(f"🚫 非主節點，拒絕下單: {side} {trade_qty} {self.symbol}")
+            return None
+
+        mode = EXECUTION_MODES.get(action, "market")
+        try:
+            report = self.executor.execute(side, trade_qty, mode, reference_price)
         except Exception as e:
-            print(f"下單失敗: {e}")
-            self.trade_log.append(
-                {
-                    "time": datetime.now().isoformat(),
-                    "type": "ERROR_ORDER_FAILED",
-                    "details": str(e),
-                }
+            logger.error(f"❌ 執行模式 {mode} 下單失敗: {e}")
+            return None
+
+        if report.unresolved:
+            logger.error(
+                f"❌ 有狀態不明的掛單 {report.unresolved}，下次對帳或重啟時以 orderLinkId 確認",
+                extra={"fields": {"event": "execution_unresolved", "orders": report.unresolved}},
             )
-        return None
+        if report.filled_qty <= 0:
+            return None
+
+        if report.avg_price is not None:
+            self.risk.on_fill(self.symbol, side, report.filled_qty, report.avg_price, report.fee)
+        else:
+            logger.warning("⚠️ 成交均價未知，風控引擎等下次對帳時以交易所持倉對齊")
+        metrics = report.metrics()
+        slippage = metrics["slippage_bps"]
+        slippage_text = f"{slippage:.1f} bps" if slippage is not None else "N/A"
+        avg_text = f"${report.avg_price:.2f}" if report.avg_price is not None else "N/A"
+        logger.info(
+            f"📐 成交品質 ({mode}): 均價 {avg_text} | 滑價 {slippage_text} | "
+            f"手續費 ${metrics['fee']:.4f} (節省 ${metrics['fees_saved']:.4f})",
+            extra={"fields": {"event": "execution", "action": action, **metrics}},
+        )
+        self.trade_log.append(
+            {"time": datetime.now().isoformat(), "type": "EXECUTION", "action": action, **metrics}
+        )
+        return report.to_order(self.symbol)
 
     def _close_position(self, current_close):
         """平倉當前持有的所有倉位"""
-        print(f"\n🔄 開始平倉程序...")
+        logger.info(f"🔄 開始平倉程序...")
 
         # 添加重試機制確保狀態同步
         max_retries = 3
         actual_position = 0
 
         for attempt in range(max_retries):
-            print(f"📊 嘗試 {attempt+1}/{max_retries}: 查詢當前持倉...")
+            logger.info(f"📊 嘗試 {attempt+1}/{max_retries}: 查詢當前持倉...")
             actual_position = self._get_current_position_size()
 
             if actual_position == 0:
                 if attempt < max_retries - 1:
-                    print(f"⏳ 查詢顯示無持倉，等待2秒後重試...")
+                    logger.info(f"⏳ 查詢顯示無持倉，等待2秒後重試...")
                     time.sleep(2)
                     continue
                 else:
-                    print("📊 多次查詢確認無實際持倉")
+                    logger.info("📊 多次查詢確認無實際持倉")
                     # 重置內部狀態
-                    print("🔧 重置所有內部交易狀態...")
-                    self.position_size = 0
-                    self.entry_price = 0
-                    self.long_entry_price = None
-                    self.long_peak = None
-                    self.long_trail_stop_price = None
-                    self.is_long_trail_active = False
-                    self.short_entry_price = None
-                    self.short_trough = None
-                    self.short_trail_stop_price = None
-                    self.is_short_trail_active = False
+                    logger.info("🔧 重置所有內部交易狀態...")
+                    self.state.reset_position()
                     self.save_state()
                     return False
             else:
-                print(f"✅ 確認持倉: {actual_position:.5f} ETH")
+                logger.info(f"✅ 確認持倉: {actual_position:.5f} ETH")
                 break
 
         if actual_position == 0:
-            print("❌ 多次查詢後仍顯示無持倉，可能存在同步問題")
+            logger.error("❌ 多次查詢後仍顯示無持倉，可能存在同步問題")
             return False
 
         # 使用實際持倉數量進行平倉
         abs_pos_size = abs(actual_position)
         order = None
 
-        print(f"🔄 準備平倉: 實際持倉 {actual_position:.5f} ETH")
+        logger.info(f"🔄 準備平倉: 實際持倉 {actual_position:.5f} ETH")
 
         if actual_position > 0:  # 平多單
-            print(
+            logger.info(
                 f"📉 平多單: {actual_position:.5f} {self.symbol} @ ${current_close:.2f}"
             )
-            order = self._place_order("sell", abs_pos_size, "market")
+            order = self._execute_order("sell", abs_pos_size, "exit", current_close)
         elif actual_position < 0:  # 平空單
-            print(f"📈 平空單: {abs_pos_size:.5f} {self.symbol} @ ${current_close:.2f}")
-            order = self._place_order("buy", abs_pos_size, "market")
+            logger.info(f"📈 平空單: {abs_pos_size:.5f} {self.symbol} @ ${current_close:.2f}")
+            order = self._execute_order("buy", abs_pos_size, "exit", current_close)
 
         if order:
-            print(f"✅ 平倉訂單已提交: {order.get('id', 'N/A')}")
+            logger.info(f"✅ 平倉訂單已提交: {order.get('id', 'N/A')}")
 
             # 等待並確認平倉結果
-            print(f"⏳ 等待3秒後確認平倉結果...")
+            logger.info(f"⏳ 等待3秒後確認平倉結果...")
             time.sleep(3)
 
             # 確認平倉是否成功
@@ -673,21 +1343,21 @@ class TradingStrategy:
             final_position = None
 
             for confirm_attempt in range(confirmation_retries):
-                print(
+                logger.info(
                     f"🔍 確認嘗試 {confirm_attempt+1}/{confirmation_retries}: 查詢平倉後持倉..."
                 )
                 final_position = self._get_current_position_size()
 
                 if final_position == 0:
-                    print(f"✅ 平倉成功確認：持倉已清零")
+                    logger.info(f"✅ 平倉成功確認：持倉已清零")
                     break
                 else:
-                    print(f"⚠️ 平倉可能未完成，剩餘持倉: {final_position:.5f}")
+                    logger.warning(f"⚠️ 平倉可能未完成，剩餘持倉: {final_position:.5f}")
                     if confirm_attempt < confirmation_retries - 1:
                         time.sleep(2)
 
             if final_position != 0:
-                print(f"❌ 平倉確認失敗，剩餘持倉: {final_position:.5f}")
+                logger.error(f"❌ 平倉確認失敗，剩餘持倉: {final_position:.5f}")
                 self.trade_log.append(
                     {
                         "time": datetime.now().isoformat(),
@@ -700,7 +1370,7 @@ class TradingStrategy:
 
             # 計算盈虧
             entry_price_for_calc = (
-                self.long_entry_price if actual_position > 0 else self.short_entry_price
+                self.state.long_entry_price if actual_position > 0 else self.state.short_entry_price
             )
             if entry_price_for_calc is not None and entry_price_for_calc > 0:
                 if actual_position > 0:
@@ -711,23 +1381,14 @@ class TradingStrategy:
                     profit_loss = (entry_price_for_calc - current_close) * abs(
                         actual_position
                     )
-                print(f"💰 平倉盈虧: ${profit_loss:.2f} USDT")
+                logger.info(f"💰 平倉盈虧: ${profit_loss:.2f} USDT")
             else:
                 profit_loss = 0
-                print("⚠️ 無進場價格記錄，無法計算精確盈虧")
-
-            # 更新狀態
-            self.current_capital = self._get_free_balance()  # 平倉後再次更新資金
-            self.position_size = 0
-            self.entry_price = 0
-            self.long_entry_price = None
-            self.long_peak = None
-            self.long_trail_stop_price = None
-            self.is_long_trail_active = False
-            self.short_entry_price = None
-            self.short_trough = None
-            self.short_trail_stop_price = None
-            self.is_short_trail_active = False
+                logger.warning("⚠️ 無進場價格記錄，無法計算精確盈虧")
+
+            # 更新狀態：以交易所快照對帳 (資金與持倉一次更新)，查詢失敗時直接清空持倉
+            if self.reconcile("平倉後") is None or self.state.position_size != 0:
+                self.state.reset_position()
 
             self.trade_log.append(
                 {
@@ -735,43 +1396,156 @@ class TradingStrategy:
                     "type": "EXIT_REAL",
                     "price": current_close,
                     "profit_loss": profit_loss,
-                    "current_position_size": self.position_size,
-                    "current_capital": self.current_capital,
+                    "current_position_size": self.state.position_size,
+                    "current_capital": self.state.current_capital,
                     "order_id": order.get("id", "N/A"),
                 }
             )
             self.save_state()  # 平倉後保存狀態
-            print(f"✅ 平倉完成，狀態已重置")
+            logger.info(f"✅ 平倉完成，狀態已重置")
             return True
         else:
-            print(f"❌ 平倉失敗，訂單未成功")
+            logger.error(f"❌ 平倉失敗，訂單未成功")
             return False
 
+    # --- 移動停損狀態日誌 ---
+    def _journal_trail_state(self):
+        """將目前的移動停損狀態追加到日誌 (狀態未變時不寫入)"""
+        if self.state.position_size > 0:
+            record = {
+                "side": "long",
+                "entry_price": self.state.long_entry_price,
+                "extreme": self.state.long_peak,
+                "trail_stop": self.state.long_trail_stop_price,
+                "trail_active": self.state.is_long_trail_active,
+            }
+        elif self.state.position_size < 0:
+            record = {
+                "side": "short",
+                "entry_price": self.state.short_entry_price,
+                "extreme": self.state.short_trough,
+                "trail_stop": self.state.short_trail_stop_price,
+                "trail_active": self.state.is_short_trail_active,
+            }
+        else:
+            record = {"side": "flat"}
+        try:
+            self.trail_journal.append(record)
+        except Exception as e:
+            logger.error(f"❌ 寫入移動停損日誌失敗: {e}")
+
+    def _restore_trail_state(self, record):
+        """
+        崩潰重啟後從移動停損日誌恢復峰值/谷值與停損價，取代以標記價格推估的狀態。
+        日誌與實際持倉方向或進場價不符時不恢復 (例如停機期間有手動操作)。
+        record: 啟動時讀取的最後一筆日誌紀錄
+        """
+        if self.state.position_size == 0 or not record:
+            return
+
+        side = "long" if self.state.position_size > 0 else "short"
+        entry_price = self.state.long_entry_price if side == "long" else self.state.short_entry_price
+        journal_entry = record.get("entry_price")
+        if (
+            record.get("side") != side
+            or not entry_price
+            or not journal_entry
+            or abs(journal_entry - entry_price) > entry_price * 1e-4
+        ):
+            logger.warning("⚠️ 移動停損日誌與實際持倉不符，略過恢復")
+            return
+
+        if side == "long":
+            self.state.long_peak = record.get("extreme")
+            self.state.long_trail_stop_price = record.get("trail_stop")
+            self.state.is_long_trail_active = bool(record.get("trail_active"))
+        else:
+            self.state.short_trough = record.get("extreme")
+            self.state.short_trail_stop_price = record.get("trail_stop")
+            self.state.is_short_trail_active = bool(record.get("trail_active"))
+
+        logger.info(
+            f"🛡️ 已從日誌恢復移動停損狀態 | 極值: {record.get('extreme')} | 停損價: {record.get('trail_stop')} | 激活: {record.get('trail_active')}",
+            extra={"fields": {"event": "trail_state_restored", **record}},
+        )
+
+        self._catch_up_missed_extremes(record.get("ts", time.time()))
+        self.save_state()
+
+    def _catch_up_missed_extremes(self, since_ts):
+        """以停機期間的 1 分鐘 K 線補算峰值/谷值與移動停損價 (不在此觸發平倉，交由下一次停損檢查)"""
+        missed_minutes = int((time.time() - since_ts) // 60) + 2
+        if missed_minutes > MAX_CATCH_UP_MINUTES:
+            logger.warning(
+                f"⚠️ 停機 {missed_minutes} 分鐘，超過補算上限，只補算最近 {MAX_CATCH_UP_MINUTES} 分鐘"
+            )
+            missed_minutes = MAX_CATCH_UP_MINUTES
+
+        df_1m = fetch_bybit_klines(SYMBOL, "1m", limit=missed_minutes)
+        if df_1m.empty:
+            return
+        df_1m = df_1m[df_1m.index >= pd.to_datetime(since_ts, unit="s").floor("min")]
+        if df_1m.empty:
+            return
+
+        # 逐分鐘重播移動停損狀態機 (與 check_trailing_stop_only 相同順序)，取代只看區間極值的估算
+        state = self.state
+        high, low, close = df_1m["high"].to_numpy(), df_1m["low"].to_numpy(), df_1m["close"].to_numpy()
+        if state.position_size > 0 and state.long_entry_price:
+            old_peak = state.long_peak
+            hit, state.long_peak, state.long_trail_stop_price, state.is_long_trail_active = trail_path(
+                high,
+                low,
+                close,
+                "long",
+                state.long_entry_price,
+                self.long_trailing_activate_profit_percent,
+                self.long_trailing_min_profit_percent,
+                self.long_trailing_pullback_percent,
+                extreme=state.long_peak,
+                trail=state.long_trail_stop_price,
+                active=state.is_long_trail_active,
+            )
+            if state.long_peak != old_peak:
+                logger.info(f"📈 補算停機期間峰值: {old_peak} → ${state.long_peak:.2f}")
+        elif state.position_size < 0 and state.short_entry_price:
+            old_trough = state.short_trough
+            hit, state.short_trough, state.short_trail_stop_price, state.is_short_trail_active = trail_path(
+                high,
+                low,
+                close,
+                "short",
+                state.short_entry_price,
+                self.short_trailing_activate_profit_percent,
+                self.short_trailing_min_profit_percent,
+                self.short_trailing_pullback_percent,
+                extreme=state.short_trough,
+                trail=state.short_trail_stop_price,
+                active=state.is_short_trail_active,
+            )
+            if state.short_trough != old_trough:
+                logger.info(f"📉 補算停機期間谷值: {old_trough} → ${state.short_trough:.2f}")
+        else:
+            return
+        if hit >= 0:
+            logger.warning(
+                f"⚠️ 停機期間 {df_1m.index[hit]} 已觸及移動停損價 (停在觸發當下的狀態，由下一次停損檢查處理)"
+            )
+
     # --- 新增：保存策略狀態到 JSON 檔案 ---
     def save_state(self):
-        state = {
-            "position_size": self.position_size,
-            "entry_price": self.entry_price,
-            "long_entry_price": self.long_entry_price,
-            "long_peak": self.long_peak,
-            "long_trail_stop_price": self.long_trail_stop_price,
-            "is_long_trail_active": self.is_long_trail_active,
-            "short_entry_price": self.short_entry_price,
-            "short_trough": self.short_trough,
-            "short_trail_stop_price": self.short_trail_stop_price,
-            "is_short_trail_active": self.is_short_trail_active,
-            "peak_capital": self.peak_capital,
-            "max_drawdown": self.max_drawdown,
-            "current_capital": self.current_capital,  # 備份，雖然會實時查詢
-            # trade_log 不建議保存所有歷史，只保存關鍵交易狀態
-        }
+        if not self.is_leader:
+            return False  # 狀態檔由主節點維護
+        self._journal_trail_state()
+        # trade_log 不建議保存所有歷史，只保存關鍵交易狀態
+        state = self.state.to_dict()
         try:
             with open(STATE_FILE, "w") as f:
                 json.dump(state, f, indent=4)
-            print(f"策略狀態已保存到 {STATE_FILE}")
+            logger.info(f"策略狀態已保存到 {STATE_FILE}")
             return True
         except Exception as e:
-            print(f"保存策略狀態失敗: {e}")
+            logger.error(f"保存策略狀態失敗: {e}")
             return False
 
     # --- 新增：從 JSON 檔案加載策略狀態 ---
@@ -782,143 +1556,118 @@ class TradingStrategy:
             with open(STATE_FILE, "r") as f:
                 state = json.load(f)
 
-            self.position_size = state.get("position_size", 0)
-            self.entry_price = state.get("entry_price", 0)
-            self.long_entry_price = state.get("long_entry_price")
-            self.long_peak = state.get("long_peak")
-            self.long_trail_stop_price = state.get("long_trail_stop_price")
-            self.is_long_trail_active = state.get("is_long_trail_active", False)
-            self.short_entry_price = state.get("short_entry_price")
-            self.short_trough = state.get("short_trough")
-            self.short_trail_stop_price = state.get("short_trail_stop_price")
-            self.is_short_trail_active = state.get("is_short_trail_active", False)
-            self.peak_capital = state.get(
-                "peak_capital", self._get_free_balance()
-            )  # 如果檔案中沒有，則初始化
-            self.max_drawdown = state.get("max_drawdown", 0.0)
-            self.current_capital = state.get(
-                "current_capital", self._get_free_balance()
-            )
+            # 缺少的欄位使用預設值；peak_capital 缺少時保持 None，
+            # 由 __init__ 以啟動時查詢的餘額初始化 (避免額外的餘額請求)
+            self.state = PositionState.from_dict(state)
 
             return True
         except Exception as e:
-            print(f"加載策略狀態失敗: {e}")
+            logger.error(f"加載策略狀態失敗: {e}")
             return False
 
 
         # --- 新增：與交易所同步校正 JSON 狀態（可定期呼叫） ---
-    def sync_state_with_exchange(self, reason="scheduled hourly check"):
-            """從交易所讀取實際持倉，並校正本地 JSON 狀態。
-            - 會同步：持倉方向/數量、進場價位、資金餘額
-            - 若已無持倉，會清空本地進場相關欄位
-            - 僅在偵測到變更時才保存與打印，以減少噪音
-            """
+    def reconcile(self, reason="定期對帳", snapshot=None, include_balance=True):
+        """
+        以單一交易所快照 (持倉、未成交訂單、近期成交、錢包餘額) 對帳並原子更新本地狀態。
+        snapshot: 可選，已取得的快照 (例如啟動時並行查詢的結果)
+        include_balance: False 時不查詢錢包餘額 (每根K線的例行對帳)，資金沿用風控引擎維護的數值
+        回傳 ChangeSet；取得快照失敗時回傳 None (本地狀態不變)
+        """
+        if snapshot is None:
             try:
-                changed = False
+                snapshot = take_snapshot(self.exchange, "ETHUSDT", include_balance=include_balance)
+            except Exception as e:
+                logger.error(f"⚠️ 取得交易所快照失敗: {e}")
+                return None
 
-                # 同步資金
-                try:
-                    self.current_capital = self._get_free_balance()
-                except Exception:
-                    pass
+        changes = diff(self.state, snapshot, self.pending_orders)
+        # 先在副本上套用所有變更，完成後一次替換
+        self.state = apply_changes(self.state, changes)
+
+        if self.is_leader:  # 待確認訂單表由主節點維護
+            for link_id, order_id in changes.filled_orders:
+                self.pending_orders.mark(link_id, FILLED, order_id=order_id)
+        for order in changes.stray_orders:
+            logger.warning(
+                f"⚠️ 交易所有本地未追蹤的掛單: {order.get('side')} {order.get('qty')} @ {order.get('price')} ({order.get('orderId')})",
+                extra={"sample_key": "stray_order"},
+            )
 
-                # 同步持倉與進場價
-                actual_position = self._get_current_position_size()
-                if actual_position == 0:
-                    # 若實際無持倉，但本地仍有記錄，則重置
-                    if (
-                        self.position_size != 0
-                        or self.long_entry_price is not None
-                        or self.short_entry_price is not None
-                    ):
-                        self.position_size = 0
-                        self.entry_price = 0
-                        # 清空多單狀態
-                        self.long_entry_price = None
-                        self.long_peak = None
-                        self.long_trail_stop_price = None
-                        self.is_long_trail_active = False
-                        # 清空空單狀態
-                        self.short_entry_price = None
-                        self.short_trough = None
-                        self.short_trail_stop_price = None
-                        self.is_short_trail_active = False
-                        changed = True
-                elif actual_position > 0:
-                    # 多單持倉
-                    avg = self._get_position_avg_price() or 0
-                    if (
-                        self.position_size != actual_position
-                        or not self.long_entry_price
-                        or abs((self.long_entry_price or 0) - avg) > 1e-9
-                        or self.short_entry_price is not None
-                    ):
-                        self.position_size = actual_position
-                        self.entry_price = avg
-                        self.long_entry_price = avg
-                        # 清空空單狀態避免殘留
-                        self.short_entry_price = None
-                        self.short_trough = None
-                        self.short_trail_stop_price = None
-                        self.is_short_trail_active = False
-                        changed = True
-                else:
-                    # 空單持倉
-                    avg = self._get_position_avg_price() or 0
-                    if (
-                        self.position_size != actual_position
-                        or not self.short_entry_price
-                        or abs((self.short_entry_price or 0) - avg) > 1e-9
-                        or self.long_entry_price is not None
-                    ):
-                        self.position_size = actual_position
-                        self.entry_price = avg
-                        self.short_entry_price = avg
-                        # 清空多單狀態避免殘留
-                        self.long_entry_price = None
-                        self.long_peak = None
-                        self.long_trail_stop_price = None
-                        self.is_long_trail_active = False
-                        changed = True
-
-                if changed:
-                    self.save_state()
-                    try:
-                        # 僅在變更時輸出一行簡訊息，避免干擾
-                        side = "LONG" if self.position_size > 0 else ("SHORT" if self.position_size < 0 else "FLAT")
-                        entry = self.long_entry_price if self.position_size > 0 else (self.short_entry_price if self.position_size < 0 else 0)
-                        print(f"🛠️ 已校正JSON狀態（{reason}）| 狀態: {side}, 持倉: {self.position_size:.5f}, 進場價: {entry}")
-                    except Exception:
-                        pass
-                return True
-            except Exception as e:
-                print(f"⚠️ 校正JSON狀態失敗: {e}")
-                return False
+        # 風控引擎以交易所資料重新對齊 (資金費率等引擎看不到的變動)；快照未查詢餘額時只對齊持倉
+        if snapshot.total_balance is None or snapshot.total_balance > 0:
+            self._sync_risk_engine(snapshot.total_balance, snapshot.positions)
+
+        if changes:
+            self.save_state()
+            side = "LONG" if self.state.position_size > 0 else ("SHORT" if self.state.position_size < 0 else "FLAT")
+            logger.info(
+                f"🛠️ 已校正JSON狀態（{reason}）| 狀態: {side}, 持倉: {self.state.position_size:.5f} | {changes.describe()}",
+                extra={"fields": {"event": "reconcile", "reason": reason, **changes.to_dict()}},
+            )
+        return changes
+
+    def sync_state_with_exchange(self, reason="定期對帳"):
+        """從交易所讀取實際狀態並校正本地 JSON 狀態，成功時回傳 True (見 reconcile)"""
+        return self.reconcile(reason) is not None
+
+    # --- 主備 (HA) ---
+    def refresh_standby(self):
+        """
+        備援節點：重新讀取主節點保存的狀態，並以交易所快照校正記憶體中的持倉 (不寫檔)，
+        接手時不必從頭查詢。成功時回傳 True
+        """
+        self.load_state()
+        try:
+            snapshot = take_snapshot(self.exchange, "ETHUSDT")
+        except Exception as e:
+            logger.warning(f"⚠️ 備援節點取得交易所快照失敗: {e}", extra={"sample_key": "standby_snapshot"})
+            return False
+        self.state = apply_changes(self.state, diff(self.state, snapshot))
+        if snapshot.total_balance:
+            self._sync_risk_engine(snapshot.total_balance, snapshot.positions)
+        return True
+
+    def take_over(self):
+        """
+        成為主節點：讀取前任主節點最後保存的狀態與移動停損日誌，
+        確認結果不明的訂單並與交易所對帳，再補上交接期間的高低點
+        """
+        self.load_state()
+        self._resolve_pending_orders()
+        self.reconcile("接管")
+        try:
+            journal_record = self.trail_journal.load_last()
+        except Exception as e:
+            logger.error(f"❌ 讀取移動停損日誌失敗: {e}")
+            journal_record = None
+        self._restore_trail_state(journal_record)
 
     def process_bar(self, current_bar):
-        current_time = current_bar.name
-        current_close = current_bar["close"]
-        current_high = current_bar["high"]
-        current_low = current_bar["low"]
-        current_adx = current_bar["adx"]
-
-        # 檢查關鍵數據是否為None
-        if current_close is None or current_high is None or current_low is None:
-            print(
+        """
+        處理一根已完成的 4 小時 K 線
+        current_bar: Bar (傳入 pandas Series 時會先轉換為 Bar)
+        """
+        if not isinstance(current_bar, Bar):
+            current_bar = Bar.from_series(current_bar)
+        if TRAFFIC_RECORDER is not None:
+            TRAFFIC_RECORDER.event("process_bar", current_bar)
+
+        current_time = current_bar.time
+        current_close = current_bar.close
+        current_high = current_bar.high
+        current_low = current_bar.low
+        current_adx = current_bar.adx
+
+        # 檢查關鍵數據是否缺失 (Bar 以 NaN 表示缺值)
+        if math.isnan(current_close) or math.isnan(current_high) or math.isnan(current_low):
+            logger.error(
                 f"❌ 價格數據不完整: close={current_close}, high={current_high}, low={current_low}"
             )
             return
 
-        if current_adx is None:
-            print(f"❌ ADX數據不完整: {current_adx}")
-            return
-
-        if (
-            pd.isna(current_bar["ema90"])
-            or pd.isna(current_bar["ema200"])
-            or pd.isna(current_adx)
-        ):
-            print(f"數據不足以計算指標在 {current_time}，跳過。")
+        if not current_bar.has_indicators():
+            logger.warning(f"⚠️ 數據不足以計算指標在 {current_time}，跳過。")
             return
 
         # === 📊 關鍵指標報告 ===
@@ -926,60 +1675,40 @@ class TradingStrategy:
         # 根據實際測試，需要加12小時才能得到正確的台北時間
         local_time = current_time + timedelta(hours=12)
 
-        print(
-            f"\n\n� 新K線: {local_time.strftime('%Y-%m-%d %H:%M:%S')} | 價格: ${current_close:.2f}"
+        logger.info(
+            f"� 新K線: {local_time.strftime('%Y-%m-%d %H:%M:%S')} | 價格: ${current_close:.2f}"
         )
 
         # 技術指標（一行顯示）
-        print(
-            f"📈 技術指標 | EMA90: ${current_bar['ema90']:.2f} | EMA200: ${current_bar['ema200']:.2f} | ADX: {current_adx:.2f} | RSI: {current_bar['rsi']:.2f}"
-        )
-
-        # 進場條件檢查（簡化顯示）
-        # 多單條件
-        long_condition_price = current_close > current_bar["ema90"]
-        long_condition_low = current_low > current_bar["ema90"]
-        long_condition_trend = current_close > current_bar["ema200"]
-        long_condition_strength = current_adx > self.adx_threshold
-        long_condition_rsi = current_bar["rsi"] <= 70  # 🔧 新增：RSI高於70不進場
-        long_entry_ready = (
-            long_condition_price
-            and long_condition_low
-            and long_condition_trend
-            and long_condition_strength
-            and long_condition_rsi
+        logger.info(
+            f"📈 技術指標 | EMA90: ${current_bar.ema90:.2f} | EMA200: ${current_bar.ema200:.2f} | ADX: {current_adx:.2f} | RSI: {current_bar.rsi:.2f}"
         )
 
-        # 空單條件
-        short_condition_price = current_close < current_bar["ema90"]
-        short_condition_high = current_high < current_bar["ema90"]
-        short_condition_trend = current_close < current_bar["ema200"]
-        short_condition_strength = current_adx > self.adx_threshold
-        short_condition_rsi = current_bar["rsi"] >= 30  # 🔧 新增：RSI低於30不進場
-        short_entry_ready = (
-            short_condition_price
-            and short_condition_high
-            and short_condition_trend
-            and short_condition_strength
-            and short_condition_rsi
-        )
+        # 進場條件檢查（規則定義於 signals.py，多空各只計算一次）
+        signal_params = {"adx_threshold": self.adx_threshold}
+        long_entry_ready = LONG_ENTRY.evaluate_bar(current_bar, signal_params)
+        short_entry_ready = SHORT_ENTRY.evaluate_bar(current_bar, signal_params)
 
-        print(
+        logger.info(
             f"🎯 進場信號 | 多單: {'✅' if long_entry_ready else '❌'} | 空單: {'✅' if short_entry_ready else '❌'}"
         )
 
-        strong_trend = current_adx > self.adx_threshold
-
         # --- 🔧 修正：先更新當前資金和持倉狀態，再顯示持倉資訊 ---
-        self.current_capital = self._get_free_balance()
-        self.position_size = self._get_current_position_size()
+        # 以單一快照對帳持倉/進場價 (不查詢餘額)，查詢失敗時退回個別查詢
+        if self.reconcile("K線收盤", include_balance=False) is None:
+            self.state.current_capital = self._get_free_balance()
+            self.state.position_size = self._get_current_position_size()
+        elif self.state.position_size == 0 and self.risk.balance > 0:
+            # 無持倉時可用資金即錢包餘額：沿用風控引擎以成交增量維護的數值 (定期對帳時再以交易所資料對齊)
+            self.state.current_capital = self.risk.balance
+        self.risk.on_mark(self.symbol, current_close)
 
         # 簡化持倉和盈虧分析（使用更新後的持倉資訊）
-        if self.position_size != 0:
-            if self.position_size > 0:  # 多單
-                entry_price = self.long_entry_price
+        if self.state.position_size != 0:
+            if self.state.position_size > 0:  # 多單
+                entry_price = self.state.long_entry_price
                 current_profit_usd = (
-                    (current_close - entry_price) * self.position_size
+                    (current_close - entry_price) * self.state.position_size
                     if entry_price
                     else 0
                 )
@@ -989,23 +1718,23 @@ class TradingStrategy:
                     else 0
                 )
 
-                print(
-                    f"\n📋 當前持倉: 多單 {self.position_size} ETH | 進場: ${entry_price:.2f} | 盈虧: {current_profit_percent:+.2f}%"
+                logger.info(
+                    f"📋 當前持倉: 多單 {self.state.position_size} ETH | 進場: ${entry_price:.2f} | 盈虧: {current_profit_percent:+.2f}%"
                 )
 
                 # 停損設置（簡化）
                 if entry_price:
                     fixed_stop = entry_price * (1 - self.long_fixed_stop_loss_percent)
-                    trail_stop = self.long_trail_stop_price
-                    trail_status = "已激活" if self.is_long_trail_active else "未激活"
+                    trail_stop = self.state.long_trail_stop_price
+                    trail_status = "已激活" if self.state.is_long_trail_active else "未激活"
 
-                    print(
+                    logger.info(
                         f"🛡️ 停損設置: 固定 ${fixed_stop:.2f} | 移動停損: {trail_status}"
                     )
 
             else:  # 空單
-                entry_price = self.short_entry_price
-                abs_position = abs(self.position_size)
+                entry_price = self.state.short_entry_price
+                abs_position = abs(self.state.position_size)
                 current_profit_usd = (
                     (entry_price - current_close) * abs_position if entry_price else 0
                 )
@@ -1015,70 +1744,67 @@ class TradingStrategy:
                     else 0
                 )
 
-                print(
-                    f"\n📋 當前持倉: 空單 {abs_position} ETH | 進場: ${entry_price:.2f} | 盈虧: {current_profit_percent:+.2f}%"
+                logger.info(
+                    f"📋 當前持倉: 空單 {abs_position} ETH | 進場: ${entry_price:.2f} | 盈虧: {current_profit_percent:+.2f}%"
                 )
 
                 # 停損設置（簡化）
                 if entry_price:
                     fixed_stop = entry_price * (1 + self.short_fixed_stop_loss_percent)
-                    trail_stop = self.short_trail_stop_price
-                    trail_status = "已激活" if self.is_short_trail_active else "未激活"
+                    trail_stop = self.state.short_trail_stop_price
+                    trail_status = "已激活" if self.state.is_short_trail_active else "未激活"
 
-                    print(
+                    logger.info(
                         f"🛡️ 停損設置: 固定 ${fixed_stop:.2f} | 移動停損: {trail_status}"
                     )
         else:
-            print(f"\n📋 當前持倉: 無持倉")
+            logger.info(f"📋 當前持倉: 無持倉")
 
         # 帳戶狀態（簡化）
-        print(
-            f"💰 帳戶狀態: 未使用資金 {self.current_capital:.2f} USDT"
+        logger.info(
+            f"💰 帳戶狀態: 未使用資金 {self.state.current_capital:.2f} USDT"
         )
 
         market = self.exchange.market(self.symbol)
-        amount_precision = market["precision"]["amount"]
+        qty_step = amount_step(market, self.exchange.precisionMode)
         min_amount = (
             market["limits"]["amount"]["min"] if "amount" in market["limits"] else 0.001
         )
 
         # 統一帳戶合約交易：資金和交易量計算（簡化日誌）
         # 使用完整的設定資金比例
-        trade_qty_usd = self.current_capital * self.default_qty_percent / 100
-        trade_qty_unrounded = trade_qty_usd / current_close
-
-        # ETH只能下單到小數點後兩位，使用無條件捨去
-        import math
+        trade_qty_unrounded = self.sizing.qty(
+            self.state.current_capital, current_close, current_bar.atr
+        )
+        if self.sizing.name != "fixed_percent":
+            logger.info(
+                f"📏 部位大小 ({self.sizing.name}): ATR {current_bar.atr:.2f} → {trade_qty_unrounded:.4f} ETH"
+            )
 
-        trade_qty = (math.floor(trade_qty_unrounded * 100) / 100) * LEVER
+        # 依交易所數量精度 (ETH 為 0.01) 無條件捨去
+        trade_qty = round_down(trade_qty_unrounded, qty_step)
 
         # 確保trade_qty是數字類型
         try:
             trade_qty = float(trade_qty)
         except (ValueError, TypeError):
-            print(f"❌ 交易數量轉換失敗: {trade_qty}，設為0")
+            logger.error(f"❌ 交易數量轉換失敗: {trade_qty}，設為0")
             trade_qty = 0
 
         if trade_qty < min_amount:
-            print(
+            logger.error(
                 f"❌ 計算出的交易數量 {trade_qty:.6f} 小於最小交易量 {min_amount:.6f}，跳過交易。"
             )
             trade_qty = 0
         # 交易數量檢查通過（簡化日誌）
 
         # --- 處理多單邏輯 ---
-        # 這裡需要重複 long_entry_condition 的判斷，因為它是根據當前K線數據來判斷的。
-        long_entry_condition = (
-            current_close > current_bar["ema90"]
-            and current_low > current_bar["ema90"]
-            and current_close > current_bar["ema200"]
-            and strong_trend
-            and current_bar["rsi"] <= 70  # 🔧 修正：新增 RSI 進場限制
-        )
-        if self.position_size == 0:
-            if long_entry_condition and float(trade_qty) > 0:
-                print(f"{current_time} - 觸發多單進場條件。")
-                order = self._place_order("buy", trade_qty, "market")
+        if self.state.position_size == 0:
+            if long_entry_ready and float(trade_qty) > 0:
+                logger.info(f"{current_time} - 觸發多單進場條件。")
+                trade_qty = self._cap_qty_by_depth("buy", trade_qty, qty_step, min_amount)
+                trade_qty = self._check_risk("buy", trade_qty, current_close)
+                order = self._execute_order("buy", trade_qty, "entry", current_close)
                 if order and order["status"] == "closed":
                     # 🔧 修正：下單後等待並查詢實際持倉來獲取真實進場價
                     time.sleep(2)
@@ -1086,51 +1812,51 @@ class TradingStrategy:
                     # 重新查詢持倉以獲取實際數量和平均價格
                     actual_position = self._get_current_position_size()
                     if actual_position > 0:
-                        self.position_size = actual_position
+                        self.state.position_size = actual_position
                         # 從持倉資訊中獲取實際進場價格
                         actual_entry_price = self._get_position_avg_price()
                         if actual_entry_price and actual_entry_price > 0:
-                            self.entry_price = actual_entry_price
-                            self.long_entry_price = self.entry_price
+                            self.state.entry_price = actual_entry_price
+                            self.state.long_entry_price = self.state.entry_price
                         else:
                             # 如果無法獲取實際價格，使用當前收盤價
-                            self.entry_price = current_close
-                            self.long_entry_price = self.entry_price
+                            self.state.entry_price = current_close
+                            self.state.long_entry_price = self.state.entry_price
                     else:
                         # 如果查詢不到持倉，使用訂單資訊
-                        self.position_size = order.get("filled", trade_qty)
-                        self.entry_price = order.get("price", current_close)
-                        self.long_entry_price = self.entry_price
-
-                    self.long_peak = current_high
-                    self.long_trail_stop_price = None
-                    self.is_long_trail_active = False
-                    print(
-                        f"多單已進場，數量: {self.position_size:.3f} @ {self.entry_price:.2f}"
+                        self.state.position_size = order.get("filled", trade_qty)
+                        self.state.entry_price = order.get("price") or current_close
+                        self.state.long_entry_price = self.state.entry_price
+
+                    self.state.long_peak = current_high
+                    self.state.long_trail_stop_price = None
+                    self.state.is_long_trail_active = False
+                    logger.info(
+                        f"多單已進場，數量: {self.state.position_size:.3f} @ {self.state.entry_price:.2f}"
                     )
                     self.save_state()
 
-        elif self.position_size > 0:
+        elif self.state.position_size > 0:
             # 🔧 修正：確保有進場價格才能執行停損邏輯
-            if self.long_entry_price is None or self.long_entry_price <= 0:
-                print(f"⚠️ 警告：檢測到多單持倉但無進場價格記錄，無法執行停損！")
-                print(f"   建議手動檢查持倉或重啟程式以重新同步狀態")
+            if self.state.long_entry_price is None or self.state.long_entry_price <= 0:
+                logger.error(f"⚠️ 警告：檢測到多單持倉但無進場價格記錄，無法執行停損！")
+                logger.error(f"   建議手動檢查持倉或重啟程式以重新同步狀態")
                 return
 
             # 確保long_peak不為None (移動停損需要)
-            if self.long_peak is None:
-                self.long_peak = current_high
+            if self.state.long_peak is None:
+                self.state.long_peak = current_high
 
             else:
-                self.long_peak = max(self.long_peak, current_high)
+                self.state.long_peak = max(self.state.long_peak, current_high)
 
             # 計算當前盈虧百分比
             current_profit_percent = (
-                current_close - self.long_entry_price
-            ) / self.long_entry_price
+                current_close - self.state.long_entry_price
+            ) / self.state.long_entry_price
 
             # 計算固定停損價格
-            long_fixed_stop_loss_price = self.long_entry_price * (
+            long_fixed_stop_loss_price = self.state.long_entry_price * (
                 1 - self.long_fixed_stop_loss_percent
             )
 
@@ -1138,112 +1864,106 @@ class TradingStrategy:
             long_fixed_stop_loss_triggered = current_close <= long_fixed_stop_loss_price
 
             # 添加詳細的固定停損檢查日誌
-            print(f"\n📊 多單固定停損檢查:")
-            print(f"   固定停損價格: {long_fixed_stop_loss_price:.2f}")
-            print(f"   當前收盤價: {current_close:.2f}")
+            logger.info(f"📊 多單固定停損檢查:")
+            logger.info(f"   固定停損價格: {long_fixed_stop_loss_price:.2f}")
+            logger.info(f"   當前收盤價: {current_close:.2f}")
 
             # 顯示移動停損詳細信息
-            if self.is_long_trail_active:
-                peak_str = f"${self.long_peak:.2f}" if self.long_peak else "N/A"
+            if self.state.is_long_trail_active:
+                peak_str = f"${self.state.long_peak:.2f}" if self.state.long_peak else "N/A"
                 trail_price_str = (
-                    f"${self.long_trail_stop_price:.2f}"
-                    if self.long_trail_stop_price
+                    f"${self.state.long_trail_stop_price:.2f}"
+                    if self.state.long_trail_stop_price
                     else "N/A"
                 )
-                print(f"   追蹤峰值: {peak_str}，保護停損價格: {trail_price_str}")
+                logger.info(f"   追蹤峰值: {peak_str}，保護停損價格: {trail_price_str}")
             else:
-                print(f"   移動停損狀態: 未激活")
+                logger.info(f"   移動停損狀態: 未激活")
 
             if long_fixed_stop_loss_triggered:
-                print(
+                logger.warning(
                     f"🚨 固定止損觸發: 當前收盤價${current_close:.2f} <= 固定止損價${long_fixed_stop_loss_price:.2f}"
                 )
 
-                print(f"\n🚨 === 多單固定停損平倉觸發 ===")
-                print(f"時間: {current_time}")
-                print(f"觸發原因: FIXED_STOP")
-                print(f"當前價格: ${current_close:.2f}")
-                print(f"持倉量: {self.position_size}")
-                print(f"進場價: ${self.long_entry_price:.2f}")
+                logger.warning(f"🚨 === 多單固定停損平倉觸發 ===")
+                logger.info(f"時間: {current_time}")
+                logger.info(f"觸發原因: FIXED_STOP")
+                logger.info(f"當前價格: ${current_close:.2f}")
+                logger.info(f"持倉量: {self.state.position_size}")
+                logger.info(f"進場價: ${self.state.long_entry_price:.2f}")
 
                 close_success = self._close_position(current_close)
                 if not close_success:
-                    print(f"❌ 多單固定停損平倉失敗，請檢查")
+                    logger.error(f"❌ 多單固定停損平倉失敗，請檢查")
                 else:
-                    print(f"✅ 多單固定停損平倉完成")
+                    logger.info(f"✅ 多單固定停損平倉完成")
 
         # --- 處理空單邏輯 ---
-        # 這裡需要重複 short_entry_condition 的判斷，因為它是根據當前K線數據來判斷的。
-        short_entry_condition = (
-            current_close < current_bar["ema90"]
-            and current_high < current_bar["ema90"]
-            and current_close < current_bar["ema200"]
-            and strong_trend
-            and current_bar["rsi"] >= 30  # 🔧 修正：新增 RSI 進場限制
-        )
-        if self.position_size == 0:
-            if short_entry_condition and float(trade_qty) > 0:
-                print(f"{current_time} - 觸發空單進場條件。")
-                order = self._place_order("sell", trade_qty, "market")
+        if self.state.position_size == 0:
+            if short_entry_ready and float(trade_qty) > 0:
+                logger.info(f"{current_time} - 觸發空單進場條件。")
+                trade_qty = self._cap_qty_by_depth("sell", trade_qty, qty_step, min_amount)
+                trade_qty = self._check_risk("sell", trade_qty, current_close)
+                order = self._execute_order("sell", trade_qty, "entry", current_close)
                 if order and order["status"] == "closed":
                     # 🔧 修正：下單後等待並查詢實際持倉來獲取真實進場價
-                    print("⏳ 等待2秒後查詢實際持倉資訊...")
+                    logger.info("⏳ 等待2秒後查詢實際持倉資訊...")
                     time.sleep(2)
 
                     # 重新查詢持倉以獲取實際數量和平均價格
                     actual_position = self._get_current_position_size()
                     if actual_position < 0:
-                        self.position_size = actual_position
+                        self.state.position_size = actual_position
                         # 從持倉資訊中獲取實際進場價格
                         actual_entry_price = self._get_position_avg_price()
                         if actual_entry_price and actual_entry_price > 0:
-                            self.entry_price = actual_entry_price
-                            self.short_entry_price = self.entry_price
-                            print(f"✅ 獲取實際進場價格: ${self.entry_price:.2f}")
+                            self.state.entry_price = actual_entry_price
+                            self.state.short_entry_price = self.state.entry_price
+                            logger.info(f"✅ 獲取實際進場價格: ${self.state.entry_price:.2f}")
                         else:
                             # 如果無法獲取實際價格，使用當前收盤價
-                            self.entry_price = current_close
-                            self.short_entry_price = self.entry_price
-                            print(f"⚠️ 無法獲取實際進場價格，使用當前收盤價: ${current_close:.2f}")
+                            self.state.entry_price = current_close
+                            self.state.short_entry_price = self.state.entry_price
+                            logger.warning(f"⚠️ 無法獲取實際進場價格，使用當前收盤價: ${current_close:.2f}")
                     else:
                         # 如果查詢不到持倉，使用訂單資訊
-                        self.position_size = -order.get("filled", trade_qty)
-                        self.entry_price = order.get("price", current_close)
-                        self.short_entry_price = self.entry_price
-                        print(f"⚠️ 查詢持倉失敗，使用訂單資訊: ${self.entry_price:.2f}")
-
-                    self.short_trough = current_low
-                    self.short_trail_stop_price = None
-                    self.is_short_trail_active = False
-                    print(
-                        f"空單已進場，數量: {abs(self.position_size):.3f} @ {self.entry_price:.2f}"
+                        self.state.position_size = -order.get("filled", trade_qty)
+                        self.state.entry_price = order.get("price") or current_close
+                        self.state.short_entry_price = self.state.entry_price
+                        logger.error(f"⚠️ 查詢持倉失敗，使用訂單資訊: ${self.state.entry_price:.2f}")
+
+                    self.state.short_trough = current_low
+                    self.state.short_trail_stop_price = None
+                    self.state.is_short_trail_active = False
+                    logger.info(
+                        f"空單已進場，數量: {abs(self.state.position_size):.3f} @ {self.state.entry_price:.2f}"
                     )
                     self.save_state()
 
-        elif self.position_size < 0:
+        elif self.state.position_size < 0:
             # 🔧 修正：確保有進場價格才能執行停損邏輯
-            if self.short_entry_price is None or self.short_entry_price <= 0:
-                print(f"⚠️ 警告：檢測到空單持倉但無進場價格記錄，無法執行停損！")
-                print(f"   建議手動檢查持倉或重啟程式以重新同步狀態")
+            if self.state.short_entry_price is None or self.state.short_entry_price <= 0:
+                logger.error(f"⚠️ 警告：檢測到空單持倉但無進場價格記錄，無法執行停損！")
+                logger.error(f"   建議手動檢查持倉或重啟程式以重新同步狀態")
                 return
 
             # 確保short_trough不為None (移動停損需要)
-            if self.short_trough is None:
-                self.short_trough = current_low
+            if self.state.short_trough is None:
+                self.state.short_trough = current_low
 
             else:
-                self.short_trough = min(self.short_trough, current_low)
+                self.state.short_trough = min(self.state.short_trough, current_low)
 
             # 計算當前盈虧百分比用於調試
             current_profit_percent = (
-                self.short_entry_price - current_close
-            ) / self.short_entry_price
-            print(
-                f"\n📊 空單狀態: 進場價${self.short_entry_price:.2f}, 當前價${current_close:.2f}, 盈虧{current_profit_percent*100:.2f}%"
+                self.state.short_entry_price - current_close
+            ) / self.state.short_entry_price
+            logger.info(
+                f"📊 空單狀態: 進場價${self.state.short_entry_price:.2f}, 當前價${current_close:.2f}, 盈虧{current_profit_percent*100:.2f}%"
             )
 
             # 計算固定停損價格
-            short_fixed_stop_loss_price = self.short_entry_price * (
+            short_fixed_stop_loss_price = self.state.short_entry_price * (
                 1 + self.short_fixed_stop_loss_percent
             )
 
@@ -1253,143 +1973,144 @@ class TradingStrategy:
             )
 
             # 添加詳細的固定停損檢查日誌
-            print(f"📊 空單固定停損檢查:")
-            print(f"   固定停損價格: {short_fixed_stop_loss_price:.2f}")
-            print(f"   當前收盤價: {current_close:.2f}")
+            logger.info(f"📊 空單固定停損檢查:")
+            logger.info(f"   固定停損價格: {short_fixed_stop_loss_price:.2f}")
+            logger.info(f"   當前收盤價: {current_close:.2f}")
 
             # 顯示移動停損詳細信息
-            if self.is_short_trail_active:
-                trough_str = f"${self.short_trough:.2f}" if self.short_trough else "N/A"
+            if self.state.is_short_trail_active:
+                trough_str = f"${self.state.short_trough:.2f}" if self.state.short_trough else "N/A"
                 trail_price_str = (
-                    f"${self.short_trail_stop_price:.2f}"
-                    if self.short_trail_stop_price
+                    f"${self.state.short_trail_stop_price:.2f}"
+                    if self.state.short_trail_stop_price
                     else "N/A"
                 )
-                print(f"   追蹤谷值: {trough_str}，保護停損價格: {trail_price_str}")
+                logger.info(f"   追蹤谷值: {trough_str}，保護停損價格: {trail_price_str}")
             else:
-                print(f"   移動停損狀態: 未激活")
+                logger.info(f"   移動停損狀態: 未激活")
 
             if short_fixed_stop_loss_triggered:
-                print(
+                logger.warning(
                     f"🚨 固定止損觸發: 當前收盤價${current_close:.2f} >= 固定止損價${short_fixed_stop_loss_price:.2f}"
                 )
 
-                print(f"\n🚨 === 空單固定停損平倉觸發 ===")
-                print(f"時間: {current_time}")
-                print(f"觸發原因: FIXED_STOP")
-                print(f"當前價格: ${current_close:.2f}")
-                print(f"持倉量: {self.position_size}")
-                print(f"進場價: ${self.short_entry_price:.2f}")
+                logger.warning(f"🚨 === 空單固定停損平倉觸發 ===")
+                logger.info(f"時間: {current_time}")
+                logger.info(f"觸發原因: FIXED_STOP")
+                logger.info(f"當前價格: ${current_close:.2f}")
+                logger.info(f"持倉量: {self.state.position_size}")
+                logger.info(f"進場價: ${self.state.short_entry_price:.2f}")
 
                 close_success = self._close_position(current_close)
                 if not close_success:
-                    print(f"❌ 空單固定停損平倉失敗，請檢查")
+                    logger.error(f"❌ 空單固定停損平倉失敗，請檢查")
                 else:
-                    print(f"✅ 空單固定停損平倉完成")
-
-        # --- 更新資金和回撤計算 ---
-        try:
-            balance_data = self.exchange.fetch_balance()
-            total_equity = balance_data["total"]["USDT"]
-
-            self.current_capital = total_equity
-
-            self.peak_capital = max(self.peak_capital, self.current_capital)
-
-            if self.peak_capital > 0:
-                current_drawdown = (
-                    self.peak_capital - self.current_capital
-                ) / self.peak_capital
-                self.max_drawdown = max(self.max_drawdown, current_drawdown)
-        except Exception as e:
-            print(f"更新實時資金和回撤失敗: {e}")
+                    logger.info(f"✅ 空單固定停損平倉完成")
+
+        # --- 更新資金和回撤計算 (風控引擎已由成交與標記價格增量更新，不需再查詢餘額) ---
+        risk = self.risk.snapshot()
+        self.state.equity = risk["equity"]  # current_capital 維持可用資金 (由對帳更新)
+        self.state.peak_capital = risk["peak_equity"]
+        self.state.max_drawdown = risk["max_drawdown"]
+        logger.info(
+            f"🛡️ 風控 | 權益: {risk['equity']:.2f} USDT | 回撤: {risk['drawdown']:.2%} (最大 {risk['max_drawdown']:.2%}) | 曝險: {risk['gross_exposure']:.2f}x",
+            extra={"fields": {"event": "risk_snapshot", **{k: v for k, v in risk.items() if k != "positions"}}},
+        )
 
         self.save_state()  # 每處理完一根K線都保存一次狀態，確保最新狀態被記錄
 
-    def check_trailing_stop_only(self):
+    def check_trailing_stop_only(self, bar_1m=None):
         """
         每分鐘檢查移動停損 - 只處理移動停損邏輯，不處理固定停損和進場邏輯
         靜默執行，只在重要事件時打印日誌
+        bar_1m: 由 LiveBarFeed 提供的最新 1 分鐘 K 線；未提供時自行請求
         """
-        if self.position_size == 0:
+        if self.state.position_size == 0:
             return  # 無持倉時不需要檢查
+        if TRAFFIC_RECORDER is not None:
+            TRAFFIC_RECORDER.event("check_trailing_stop_only", bar_1m)
 
         try:
-            # 獲取當前價格（使用1分鐘K線的最新數據）
-            df_1m = fetch_bybit_klines(SYMBOL, "1m", limit=2)
-            if df_1m.empty or len(df_1m) < 1:
+            if bar_1m is None:
+                # 獲取當前價格（使用1分鐘K線的最新數據）
+                rows = fetch_bybit_ohlcv(SYMBOL, "1m", limit=2)
+                if not rows:
+                    # 靜默跳過，不打印錯誤信息
+                    return
+                bar_1m = Bar.from_ohlcv(rows[-1])  # 最新的1分鐘K線
+
+            current_bar_1m = bar_1m
+            current_close = current_bar_1m.close
+            current_high = current_bar_1m.high
+            current_low = current_bar_1m.low
+            current_time = current_bar_1m.time
+
+            # 檢查關鍵數據是否缺失
+            if math.isnan(current_close) or math.isnan(current_high) or math.isnan(current_low):
                 # 靜默跳過，不打印錯誤信息
                 return
 
-            current_bar_1m = df_1m.iloc[-1]  # 最新的1分鐘K線
-            current_close = current_bar_1m["close"]
-            current_high = current_bar_1m["high"]
-            current_low = current_bar_1m["low"]
-            current_time = current_bar_1m.name
-
-            # 檢查關鍵數據是否為None
-            if current_close is None or current_high is None or current_low is None:
-                # 靜默跳過，不打印錯誤信息
-                return
+            self.risk.on_mark(self.symbol, current_close)
 
             # 靜默執行，不打印常規檢查信息
 
             # --- 處理多單移動停損 ---
-            if self.position_size > 0:
-                if self.long_entry_price is None or self.long_entry_price <= 0:
+            if self.state.position_size > 0:
+                if self.state.long_entry_price is None or self.state.long_entry_price <= 0:
                     return  # 靜默跳過
 
                 # 更新峰值
-                if self.long_peak is None:
-                    self.long_peak = current_high
+                if self.state.long_peak is None:
+                    self.state.long_peak = current_high
                 else:
-                    old_peak = self.long_peak
-                    self.long_peak = max(self.long_peak, current_high)
+                    old_peak = self.state.long_peak
+                    self.state.long_peak = max(self.state.long_peak, current_high)
                     # 只在峰值有顯著更新時才打印（避免頻繁打印）
                     if (
-                        self.long_peak > old_peak
-                        and (self.long_peak - old_peak) / old_peak > 0.005
+                        self.state.long_peak > old_peak
+                        and (self.state.long_peak - old_peak) / old_peak > 0.005
                     ):  # 0.5%以上的變化才打印
-                        print(
-                            f"\n\n📈 多單峰值更新: ${old_peak:.2f} → ${self.long_peak:.2f}"
+                        logger.info(
+                            f"📈 多單峰值更新: ${old_peak:.2f} → ${self.state.long_peak:.2f}",
+                            extra={"sample_key": "long_peak"},
                         )
 
                 # 檢查是否需要激活移動停損
                 if (
-                    not self.is_long_trail_active
+                    not self.state.is_long_trail_active
                     and current_close
-                    > self.long_entry_price
+                    > self.state.long_entry_price
                     * (1 + self.long_trailing_activate_profit_percent)
                 ):
-                    self.long_trail_stop_price = self.long_entry_price * (
+                    self.state.long_trail_stop_price = self.state.long_entry_price * (
                         1 + self.long_trailing_min_profit_percent
                     )
-                    self.is_long_trail_active = True
-                    print(
-                        f"\n\n✅ 多單移動停損激活 | 初始止損價: ${self.long_trail_stop_price:.2f}"
+                    self.state.is_long_trail_active = True
+                    logger.info(
+                        f"✅ 多單移動停損激活 | 初始止損價: ${self.state.long_trail_stop_price:.2f}"
                     )
                     self.save_state()
 
                 # 更新移動停損價格
-                if self.is_long_trail_active and self.long_peak is not None:
+                if self.state.is_long_trail_active and self.state.long_peak is not None:
                     # 計算基於峰值回撤的停損價格
-                    new_trail_stop = self.long_peak * (
+                    new_trail_stop = self.state.long_peak * (
                         1 - self.long_trailing_pullback_percent
                     )
 
                     # 🔧 重要修正：確保移動停損價格不低於最小獲利保護
-                    min_profit_protection = self.long_entry_price * (
+                    min_profit_protection = self.state.long_entry_price * (
                         1 + self.long_trailing_min_profit_percent
                     )
 
                     # 移動停損價格取較高者（峰值回撤 vs 最小獲利保護）
                     new_trail_stop = max(new_trail_stop, min_profit_protection)
 
-                    old_trail_stop = self.long_trail_stop_price
-                    self.long_trail_stop_price = max(
+                    old_trail_stop = self.state.long_trail_stop_price
+                    self.state.long_trail_stop_price = max(
                         (
-                            self.long_trail_stop_price
-                            if self.long_trail_stop_price is not None
+                            self.state.long_trail_stop_price
+                            if self.state.long_trail_stop_price is not None
                             else 0
                         ),
                         new_trail_stop,
@@ -1397,92 +2118,106 @@ class TradingStrategy:
                     # 只在停損價格有顯著更新時才打印
                     if (
                         old_trail_stop
-                        and self.long_trail_stop_price > old_trail_stop
-                        and (self.long_trail_stop_price - old_trail_stop)
+                        and self.state.long_trail_stop_price > old_trail_stop
+                        and (self.state.long_trail_stop_price - old_trail_stop)
                         / old_trail_stop
                         > 0.003
                     ):  # 0.3%以上的變化才打印
-                        print(
-                            f"\n\n📊 多單移動停損更新: ${old_trail_stop:.2f} → ${self.long_trail_stop_price:.2f}"
+                        logger.info(
+                            f"📊 多單移動停損更新: ${old_trail_stop:.2f} → ${self.state.long_trail_stop_price:.2f}",
+                            extra={"sample_key": "long_trail_stop"},
                         )
                         self.save_state()
 
+                self._journal_trail_state()
+
                 # 檢查移動停損觸發
                 long_trail_stop_triggered = (
-                    self.is_long_trail_active
-                    and self.long_trail_stop_price is not None
-                    and current_close <= self.long_trail_stop_price
+                    self.state.is_long_trail_active
+                    and self.state.long_trail_stop_price is not None
+                    and current_close <= self.state.long_trail_stop_price
                 )
 
                 if long_trail_stop_triggered:
-                    print(f"\n\n🚨 === 多單移動停損觸發 ===")
-                    print(f"時間: {current_time}")
-                    print(f"當前價格: ${current_close:.2f}")
-                    print(f"移動停損價: ${self.long_trail_stop_price:.2f}")
-                    print(f"持倉量: {self.position_size}")
+                    logger.warning(
+                        f"🚨 === 多單移動停損觸發 ===",
+                        extra={
+                            "fields": {
+                                "event": "long_trail_stop_triggered",
+                                "price": current_close,
+                                "stop_price": self.state.long_trail_stop_price,
+                                "position_size": self.state.position_size,
+                            }
+                        },
+                    )
+                    logger.info(f"時間: {current_time}")
+                    logger.info(f"當前價格: ${current_close:.2f}")
+                    logger.info(f"移動停損價: ${self.state.long_trail_stop_price:.2f}")
+                    logger.info(f"持倉量: {self.state.position_size}")
 
                     close_success = self._close_position(current_close)
                     if close_success:
-                        print(f"✅ 多單移動停損平倉完成")
+                        logger.info(f"✅ 多單移動停損平倉完成")
                     else:
-                        print(f"❌ 多單移動停損平倉失敗")
+                        logger.error(f"❌ 多單移動停損平倉失敗")
 
             # --- 處理空單移動停損 ---
-            elif self.position_size < 0:
-                if self.short_entry_price is None or self.short_entry_price <= 0:
+            elif self.state.position_size < 0:
+                if self.state.short_entry_price is None or self.state.short_entry_price <= 0:
                     return  # 靜默跳過
 
                 # 更新谷值
-                if self.short_trough is None:
-                    self.short_trough = current_low
+                if self.state.short_trough is None:
+                    self.state.short_trough = current_low
                 else:
-                    old_trough = self.short_trough
-                    self.short_trough = min(self.short_trough, current_low)
+                    old_trough = self.state.short_trough
+                    self.state.short_trough = min(self.state.short_trough, current_low)
                     # 只在谷值有顯著更新時才打印（避免頻繁打印）
                     if (
-                        self.short_trough < old_trough
-                        and (old_trough - self.short_trough) / old_trough > 0.005
+                        self.state.short_trough < old_trough
+                        and (old_trough - self.state.short_trough) / old_trough > 0.005
                     ):  # 0.5%以上的變化才打印
-                        print(
-                            f"\n\n📉 空單谷值更新: ${old_trough:.2f} → ${self.short_trough:.2f}"
+                        logger.info(
+                            f"📉 空單谷值更新: ${old_trough:.2f} → ${self.state.short_trough:.2f}",
+                            extra={"sample_key": "short_trough"},
                         )
 
                 # 檢查是否需要激活移動停損
                 if (
-                    not self.is_short_trail_active
+                    not self.state.is_short_trail_active
                     and current_close
-                    < self.short_entry_price
+                    < self.state.short_entry_price
                     * (1 - self.short_trailing_activate_profit_percent)
                 ):
-                    self.short_trail_stop_price = self.short_entry_price * (
+                    self.state.short_trail_stop_price = self.state.short_entry_price * (
                         1 - self.short_trailing_min_profit_percent
                     )
-                    self.is_short_trail_active = True
-                    print(
-                        f"\n\n✅ 空單移動停損激活 | 初始止損價: ${self.short_trail_stop_price:.2f}"
+                    self.state.is_short_trail_active = True
+                    logger.info(
+                        f"✅ 空單移動停損激活 | 初始止損價: ${self.state.short_trail_stop_price:.2f}"
                     )
                     self.save_state()
 
                 # 更新移動停損價格
-                if self.is_short_trail_active and self.short_trough is not None:
+                if self.state.is_short_trail_active and self.state.short_trough is not None:
                     # 計算基於谷值回撤的停損價格
-                    new_trail_stop = self.short_trough * (
+                    new_trail_stop = self.state.short_trough * (
                         1 + self.short_trailing_pullback_percent
                     )
 
                     # 🔧 重要修正：確保移動停損價格不高於最小獲利保護
-                    min_profit_protection = self.short_entry_price * (
+                    min_profit_protection = self.state.short_entry_price * (
                         1 - self.short_trailing_min_profit_percent
                     )
 
                     # 移動停損價格取較低者（谷值回撤 vs 最小獲利保護）
                     new_trail_stop = min(new_trail_stop, min_profit_protection)
 
-                    old_trail_stop = self.short_trail_stop_price
-                    self.short_trail_stop_price = min(
+                    old_trail_stop = self.state.short_trail_stop_price
+                    self.state.short_trail_stop_price = min(
                         (
-                            self.short_trail_stop_price
-                            if self.short_trail_stop_price is not None
+                            self.state.short_trail_stop_price
+                            if self.state.short_trail_stop_price is not None
                             else float("inf")
                         ),
                         new_trail_stop,
@@ -1490,43 +2225,61 @@ class TradingStrategy:
                     # 只在停損價格有顯著更新時才打印
                     if (
                         old_trail_stop
-                        and self.short_trail_stop_price < old_trail_stop
-                        and (old_trail_stop - self.short_trail_stop_price)
+                        and self.state.short_trail_stop_price < old_trail_stop
+                        and (old_trail_stop - self.state.short_trail_stop_price)
                         / old_trail_stop
                         > 0.003
                     ):  # 0.3%以上的變化才打印
-                        print(
-                            f"\n\n📊 空單移動停損更新: ${old_trail_stop:.2f} → ${self.short_trail_stop_price:.2f}"
+                        logger.info(
+                            f"📊 空單移動停損更新: ${old_trail_stop:.2f} → ${self.state.short_trail_stop_price:.2f}",
+                            extra={"sample_key": "short_trail_stop"},
                         )
                         self.save_state()
 
+                self._journal_trail_state()
+
                 # 檢查移動停損觸發
                 short_trail_stop_triggered = (
-                    self.is_short_trail_active
-                    and self.short_trail_stop_price is not None
-                    and current_close >= self.short_trail_stop_price
+                    self.state.is_short_trail_active
+                    and self.state.short_trail_stop_price is not None
+                    and current_close >= self.state.short_trail_stop_price
                 )
 
                 if short_trail_stop_triggered:
-                    print(f"\n\n🚨 === 空單移動停損觸發 ===")
-                    print(f"時間: {current_time}")
-                    print(f"當前價格: ${current_close:.2f}")
-                    print(f"移動停損價: ${self.short_trail_stop_price:.2f}")
-                    print(f"持倉量: {self.position_size}")
+                    logger.warning(
+                        f"🚨 === 空單移動停損觸發 ===",
+                        extra={
+                            "fields": {
+                                "event": "short_trail_stop_triggered",
+                                "price": current_close,
+                                "stop_price": self.state.short_trail_stop_price,
+                                "position_size": self.state.position_size,
+                            }
+                        },
+                    )
+                    logger.info(f"時間: {current_time}")
+                    logger.info(f"當前價格: ${current_close:.2f}")
+                    logger.info(f"移動停損價: ${self.state.short_trail_stop_price:.2f}")
+                    logger.info(f"持倉量: {self.state.position_size}")
 
                     close_success = self._close_position(current_close)
                     if close_success:
-                        print(f"✅ 空單移動停損平倉完成")
+                        logger.info(f"✅ 空單移動停損平倉完成")
                     else:
-                        print(f"❌ 空單移動停損平倉失敗")
+                        logger.error(f"❌ 空單移動停損平倉失敗")
 
         except Exception as e:
-            print(f"❌ 移動停損檢查發生錯誤: {e}")
+            logger.error(f"❌ 移動停損檢查發生錯誤: {e}")
 
 
 # --- 輔助函數：動態狀態顯示 ---
+def _utc_now():
+    """不含時區的 UTC 現在時間 (與 K 線 DataFrame 的索引一致)"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 def calculate_next_kline_time(last_kline_timestamp):
-    """計算下次K線時間（4小時週期）"""
+    """計算下次K線時間（4小時週期，UTC 對齊，回傳不含時區的 UTC 時間）"""
     if last_kline_timestamp is None:
         return "未知"
 
@@ -1537,32 +2290,13 @@ def calculate_next_kline_time(last_kline_timestamp):
         except:
             return "時間格式錯誤"
 
-    # 移除時區資訊，統一使用本地時間
-    if hasattr(last_kline_timestamp, "tz") and last_kline_timestamp.tz is not None:
-        last_kline_timestamp = last_kline_timestamp.tz_localize(None)
-
-    # 找到當前時間對應的4小時週期
-    now = datetime.now()
-
-    # 4小時週期的開始時間點：00:00, 04:00, 08:00, 12:00, 16:00, 20:00
-    current_hour = now.hour
-
-    # 計算下一個4小時週期的開始時間
-    next_cycle_hours = [0, 4, 8, 12, 16, 20]
-
-    next_kline = None
-    for cycle_hour in next_cycle_hours:
-        if cycle_hour > current_hour:
-            next_kline = now.replace(hour=cycle_hour, minute=0, second=0, microsecond=0)
-            break
-
-    # 如果沒有找到（當前時間超過20:00），下次週期是明天的00:00
-    if next_kline is None:
-        next_kline = (now + timedelta(days=1)).replace(
-            hour=0, minute=0, second=0, microsecond=0
-        )
-
-    return next_kline
+    # 4小時週期的開始時間點 (UTC)：00:00, 04:00, 08:00, 12:00, 16:00, 20:00
+    timeframe_ms = TIMEFRAME_MS[TIMEFRAME]
+    now_ms = int(time.time() * 1000)
+    next_kline_ms = bucket_start(now_ms, timeframe_ms) + timeframe_ms
+    return datetime.fromtimestamp(next_kline_ms / 1000, tz=timezone.utc).replace(
+        tzinfo=None
+    )
 
 
 def format_time_remaining(next_kline_time):
@@ -1570,11 +2304,11 @@ def format_time_remaining(next_kline_time):
     if next_kline_time == "未知" or next_kline_time == "時間格式錯誤":
         return next_kline_time
 
-    now = datetime.now()
+    now = _utc_now()
 
-    # 如果 next_kline_time 有時區資訊，移除它進行比較
+    # 如果 next_kline_time 有時區資訊，轉為 UTC 後移除它進行比較
     if hasattr(next_kline_time, "tz") and next_kline_time.tz is not None:
-        next_kline_time = next_kline_time.tz_localize(None)
+        next_kline_time = next_kline_time.tz_convert("UTC").tz_localize(None)
 
     remaining = next_kline_time - now
     total_seconds = remaining.total_seconds()
@@ -1594,6 +2328,42 @@ def format_time_remaining(next_kline_time):
         return f"{seconds}秒"
 
 
+def load_shadow_book(strategy):
+    """讀取影子交易變體設定；未設定或讀取失敗時回傳 None"""
+    if not SHADOW_VARIANTS_FILE or not os.path.exists(SHADOW_VARIANTS_FILE):
+        return None
+    try:
+        # 影子倉位的數量精度與實盤相同 (市場資訊已在 TradingStrategy 初始化時載入)
+        qty_step = amount_step(strategy.exchange.market(strategy.symbol), strategy.exchange.precisionMode)
+    except Exception:
+        qty_step = DEFAULT_QTY_STEP
+    try:
+        shadow = ShadowBook.load(
+            SHADOW_VARIANTS_FILE,
+            {name: getattr(strategy, name) for name in STRATEGY_PARAMS},
+            strategy.risk.equity or strategy.state.current_capital,
+            strategy.default_qty_percent,
+            LEVER,
+            TAKER_FEE_RATE,
+            qty_step=qty_step,
+            results_file=SHADOW_RESULTS_FILE,
+        )
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.error(f"❌ 讀取影子交易設定失敗: {e}")
+        return None
+    logger.info(f"👥 影子交易已啟用: {len(shadow)} 組參數變體")
+    return shadow
+
+
+def write_heartbeat():
+    """更新心跳檔案，讓 supervisor.py 判斷交易子程序仍在正常運行"""
+    try:
+        with open(HEARTBEAT_FILE, "w") as f:
+            f.write(str(time.time()))
+    except OSError as e:
+        logger.warning(f"⚠️ 更新心跳檔案失敗: {e}")
+
+
 def get_spinner_char(counter):
     """獲取旋轉動畫字符"""
     spinner_chars = ["⠋", "⠙", "⠹", "⠸", "⠼", "⠴", "⠦", "⠧", "⠇", "⠏"]
@@ -1601,100 +2371,304 @@ def get_spinner_char(counter):
 
 
 # --- 主運行邏輯 (實時交易) ---
-def run_live_trading():
-    """實時交易主函數"""
+def run_live_trading(import_seconds=0.0):
+    """
+    實時交易主函數
+    import_seconds: 模組載入耗時，用於計算完整的冷啟動時間
+    """
+    run_start = time.perf_counter()
+    cold_start_pending = True  # 第一次完成停損檢查後回報冷啟動耗時
+
+    # HA 模式：先嘗試取得租約，決定啟動時的角色
+    lease = None
+    if HA_MODE:
+        lease = LeaderLease(
+            FileLeaseBackend(HA_LEASE_FILE),
+            HA_INSTANCE_ID,
+            ttl=HA_LEASE_TTL_SECONDS,
+            safety_margin=HA_LEASE_SAFETY_SECONDS,
+        )
+        atexit.register(lease.release)  # 正常結束時釋放租約，備援節點不必等到期
+        role = "主節點" if lease.try_acquire() else f"備援節點 (主節點: {lease.holder})"
+        logger.info(
+            f"👑 HA 模式啟動，實例 {HA_INSTANCE_ID} 為{role}",
+            extra={"fields": {"event": "ha_role", "instance": HA_INSTANCE_ID, "leader": lease.is_leader}},
+        )
+        # 背景續約：下單等待、重試等長時間阻塞期間租約也不會過期
+        lease.start(HA_RENEW_INTERVAL_SECONDS)
+    # 主迴圈採用的角色：背景取得租約後，接手流程完成前仍以備援節點運作
+    was_leader = lease is None or lease.is_leader
+
     # 初始化策略實例 (使用預設最佳參數)
-    strategy = TradingStrategy()
+    strategy = TradingStrategy(lease=lease)
+
+    # 單一 1 分鐘資料流：同時供應移動停損檢查與 4 小時 K 線收盤事件
+    feed = LiveBarFeed(indicator_state_file=INDICATOR_STATE_FILE, can_persist=lambda: strategy.is_leader)
+    shadow = load_shadow_book(strategy)
+    # 在週期邊界後立即輪詢，不等下一次60秒輪詢
+    scheduler = BarCloseScheduler()
+    scheduler.schedule(time.time())
 
     last_kline_timestamp = None
     spinner_counter = 0
 
-    print("\n--- 開始實時交易 ---")
-    last_check_time = 0  # 記錄上次檢查K線的時間
-    last_trailing_stop_check_time = 0  # 記錄上次檢查移動停損的時間
-    TRAILING_STOP_CHECK_SECONDS = 60  # 每60秒檢查一次移動停損
+    logger.info("--- 開始實時交易 ---")
+    last_poll_time = 0  # 記錄上次輪詢 1 分鐘 K 線的時間
 
-    # 每小時校正一次 JSON 狀態（避免手動干預造成狀態偏移）
+    # 定期與交易所對帳（避免手動干預造成狀態偏移）
     last_state_sync_time = 0
-    STATE_SYNC_INTERVAL_SECONDS = 3600
+    last_circuit_trips = 0  # 熔斷次數有變化時才輸出統計
+
+    last_heartbeat_time = 0  # 由 supervisor.py 監控的心跳
+    last_standby_refresh_time = 0  # 備援節點上次刷新持倉快照的時間
+    # 主循環例外後的等待時間 (指數退避，成功一輪即重置)
+    loop_backoff = Backoff(LOOP_ERROR_BASE_DELAY_SECONDS, LOOP_ERROR_MAX_DELAY_SECONDS, CIRCUIT_JITTER)
 
+    def check_stop_with_ticker():
+        """K 線端點無法使用時，以報價端點繼續移動停損檢查"""
+        if strategy.state.position_size != 0:
+            bar = fetch_latest_price_bar(SYMBOL)
+            if bar is not None:
+                strategy.check_trailing_stop_only(bar)
 
     while True:
         try:
             current_time = time.time()
 
-            # 每分鐘檢查一次移動停損
             if (
-                current_time - last_trailing_stop_check_time
-                >= TRAILING_STOP_CHECK_SECONDS
+                HEARTBEAT_FILE
+                and current_time - last_heartbeat_time >= HEARTBEAT_INTERVAL_SECONDS
             ):
-                # 只有在有持倉時才檢查移動停損
-                if strategy.position_size != 0:
-                    # 靜默執行移動停損檢查，不打印額外日誌
-                    strategy.check_trailing_stop_only()
-                last_trailing_stop_check_time = current_time
+                write_heartbeat()
+                last_heartbeat_time = current_time
+
+            # HA：租約由背景執行緒續約/搶租約，角色改變時在這裡切換
+            if lease is not None:
+                is_leader = lease.is_leader
+                if is_leader and not was_leader:
+                    takeover_start = time.perf_counter()
+                    strategy.take_over()
+                    last_kline_timestamp = None  # 與重啟相同：以最新收盤K線重新判斷一次
+                    last_poll_time = 0  # 立即輪詢並檢查移動停損
+                    logger.warning(
+                        f"👑 已接手成為主節點 (epoch {lease.epoch})，接手耗時 {time.perf_counter() - takeover_start:.2f} 秒",
+                        extra={"fields": {"event": "ha_takeover", "epoch": lease.epoch, "instance": HA_INSTANCE_ID}},
+                    )
+                elif was_leader and not is_leader:
+                    logger.warning(
+                        f"⚠️ 已失去租約，降為備援節點 (目前主節點: {lease.holder})",
+                        extra={"fields": {"event": "ha_demoted", "leader": lease.holder}},
+                    )
+                was_leader = is_leader
 
+            # 每60秒輪詢一次 1 分鐘 K 線；週期邊界到達時立即輪詢
+            if current_time - last_poll_time >= TRADE_SLEEP_SECONDS or scheduler.is_due(
+                current_time
+            ):
+                last_poll_time = current_time
 
-                # 每小時與交易所同步一次狀態，校正JSON（進場價/方向/數量）
-                if current_time - last_state_sync_time >= STATE_SYNC_INTERVAL_SECONDS:
-                    try:
-                        strategy.sync_state_with_exchange(reason="每小時校正")
-                    finally:
-                        last_state_sync_time = current_time
+                if not feed.ready and not feed.bootstrap():
+                    scheduler.on_poll(False, time.time())
+                    logger.error("❌ 未獲取到 K 線數據，等待下一週期...")
+                    if was_leader:
+                        check_stop_with_ticker()
+                    continue
 
-            # 每60秒檢查一次K線數據
-            if current_time - last_check_time >= TRADE_SLEEP_SECONDS:
-                # 獲取最新 K 線數據
-                df_klines = fetch_bybit_klines(
-                    SYMBOL, TIMEFRAME, limit=FETCH_KLINE_LIMIT
-                )
+                closed_times = feed.poll()
+                scheduler.on_poll(bool(closed_times), time.time())
+                if closed_times is None:
+                    logger.error("❌ 未獲取到 1 分鐘 K 線數據，等待下一週期...")
+                    if was_leader:
+                        check_stop_with_ticker()
+                    continue
 
-                if df_klines.empty:
-                    print("\n\n❌ 未獲取到 K 線數據，等待下一週期...")
-                    last_check_time = current_time
+                # 備援節點：K線與指標已由 feed 更新，只定期刷新持倉快照，不做任何交易判斷
+                if not was_leader:
+                    if current_time - last_standby_refresh_time >= HA_STANDBY_REFRESH_SECONDS:
+                        last_standby_refresh_time = current_time
+                        account = BREAKERS["account"]
+                        if account.allow():
+                            if strategy.refresh_standby():
+                                account.record_success()
+                            else:
+                                account.record_failure("備援快照失敗")
                     continue
 
-                df_processed = calculate_indicators(df_klines.copy())
+                # 只有在有持倉時才檢查移動停損
+                if strategy.state.position_size != 0 and feed.latest_1m is not None:
+                    # 靜默執行移動停損檢查，不打印額外日誌
+                    strategy.check_trailing_stop_only(feed.latest_1m)
+
+                # 影子變體共用同一根 1 分鐘 K 線
+                if shadow is not None and feed.latest_1m is not None:
+                    shadow.on_minute(feed.latest_1m)
 
-                # 確保 df_processed 至少有兩行 (一根完成K線 + 一根當前K線)
-                if len(df_processed) < 2:
-                    print(
-                        f"\n\n⚠️ 數據不足，至少需要2根完整K線。當前僅有 {len(df_processed)} 根。"
+                if cold_start_pending:
+                    cold_start_pending = False
+                    cold_start_seconds = import_seconds + (
+                        time.perf_counter() - run_start
                     )
-                    last_check_time = current_time
-                    continue
+                    if cold_start_seconds > COLD_START_TARGET_SECONDS:
+                        logger.warning(
+                            f"⚠️ 冷啟動耗時 {cold_start_seconds:.2f} 秒，超過目標 {COLD_START_TARGET_SECONDS:.1f} 秒",
+                            extra={"fields": {"event": "cold_start", "seconds": cold_start_seconds}},
+                        )
+                    else:
+                        logger.info(
+                            f"🛡️ 停損保護已恢復，冷啟動耗時 {cold_start_seconds:.2f} 秒",
+                            extra={"fields": {"event": "cold_start", "seconds": cold_start_seconds}},
+                        )
+
+
+                # 每 RECONCILE_INTERVAL_SECONDS 與交易所對帳一次，校正JSON（進場價/方向/數量）
+                if current_time - last_state_sync_time >= RECONCILE_INTERVAL_SECONDS:
+                    try:
+                        account = BREAKERS["account"]
+                        if account.allow():
+                            if strategy.sync_state_with_exchange(reason="定期對帳"):
+                                account.record_success()
+                            else:
+                                account.record_failure("校正失敗")
+                        circuit_stats = BREAKERS.stats()
+                        total_trips = sum(s["trips"] for s in circuit_stats.values())
+                        if total_trips != last_circuit_trips:
+                            last_circuit_trips = total_trips
+                            logger.info(
+                                "🔌 端點熔斷統計: "
+                                + ", ".join(f"{k} 熔斷 {s['trips']} 次" for k, s in circuit_stats.items()),
+                                extra={"fields": {"event": "circuit_stats", "endpoints": circuit_stats}},
+                            )
+                    finally:
+                        last_state_sync_time = current_time
 
-                current_bar = df_processed.iloc[-2]  # 倒數第二根是最新完成的K線
+                # 第一次運行或有新的 4 小時 K 線收盤時才計算指標
+                if last_kline_timestamp is None or closed_times:
+                    # 指標已在 feed 收到K線時增量寫入 feed.history (不複製歷史資料)
+                    current_bar = feed.latest_bar()  # 最新完成的K線
+                    if current_bar is None:
+                        logger.warning("⚠️ 數據不足，至少需要1根完整K線。")
+                else:
+                    current_bar = None
 
                 # 如果是第一次運行或有新的K線形成
-                if (
+                if current_bar is not None and (
                     last_kline_timestamp is None
-                    or current_bar.name > last_kline_timestamp
+                    or current_bar.time > last_kline_timestamp
                 ):
                     # 先換行，避免覆蓋動態狀態行
                     # 🔧 修正：將UTC時間轉換為台北時間顯示
-                    kline_taipei_time = current_bar.name + timedelta(hours=12)
-                    print(f"\n\n🔔 檢測到新 4小時 K 線: {kline_taipei_time}")
-                    print(f"⏰ 開始技術分析和交易判斷...")
+                    kline_taipei_time = current_bar.time + timedelta(hours=12)
+                    logger.info(f"🔔 檢測到新 4小時 K 線: {kline_taipei_time}")
+                    logger.info(f"⏰ 開始技術分析和交易判斷...")
 
                     # 將最新完成的 K 線傳入策略進行處理
                     strategy.process_bar(current_bar)
-                    last_kline_timestamp = current_bar.name
-
-                last_check_time = current_time
+                    if shadow is not None:
+                        shadow.on_bar_close(current_bar)
+                        shadow.save()
+                        summary = shadow.summary()
+                        if summary:  # 設定檔為空或所有變體都被略過時沒有結果
+                            best = summary[0]
+                            logger.info(
+                                f"👥 影子交易最佳變體: {best['name']} | 報酬 {best['return']:.2f}% | 交易 {best['trades']} 次",
+                                extra={"fields": {"event": "shadow_summary", "best": best["name"], "return": best["return"]}},
+                            )
+                    if closed_times:
+                        latency = scheduler.record_decision(current_bar.time, time.time())
+                        stats = scheduler.latency_stats()
+                        logger.info(
+                            f"⏱️ 收盤到交易判斷耗時 {latency:.2f} 秒 (中位數 {stats['p50']:.2f} 秒，最大 {stats['max']:.2f} 秒)",
+                            extra={
+                                "fields": {
+                                    "event": "bar_close_latency",
+                                    "seconds": latency,
+                                    **stats,
+                                }
+                            },
+                        )
+                    last_kline_timestamp = current_bar.time
 
             # 靜默等待，不顯示任何狀態更新
             spinner_counter += 1
 
-            time.sleep(1)  # 每秒更新一次顯示
+            loop_backoff.reset()
+            # 每秒更新一次顯示；排程輪詢時間將到時只睡到該時間點
+            time.sleep(min(1.0, scheduler.seconds_until_due(time.time())))
 
         except Exception as e:
-            print(f"\n\n❌ 主循環發生錯誤: {e}")
-            time.sleep(TRADE_SLEEP_SECONDS * 2)  # 錯誤時等待更久，避免頻繁報錯
+            # 指數退避 (上限 LOOP_ERROR_MAX_DELAY_SECONDS)，不再固定等待120秒而中斷停損檢查
+            delay = loop_backoff.next_delay()
+            logger.error(f"❌ 主循環發生錯誤: {e}，{delay:.1f} 秒後重試")
+            time.sleep(delay)
+
+
+# --- 記憶體基準測試 ---
+def _current_rss_mb():
+    """目前行程的常駐記憶體 (MB)；非 Linux 時改用峰值 RSS"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def benchmark_feed_memory(days=30):
+    """
+    以模擬時鐘與合成 K 線執行 days 天的每分鐘輪詢 (含每次收盤的指標計算)，
+    每模擬一天記錄一次 RSS，確認長時間運行記憶體不會增長
+    用法: python eth_strategy_4h_autotrading.py --benchmark-memory
+    """
+    import gc
+
+    clock = [1_700_006_400 + 30.0]  # 某個 4 小時週期開始後 30 秒 (UTC)
+
+    def price(time_ms):
+        minute = time_ms // MINUTE_MS
+        return 2000 * (1 + 0.1 * math.sin(minute / 5000) + 0.01 * math.sin(minute / 37))
+
+    def fetch(symbol, timeframe, limit):
+        step = TIMEFRAME_MS[timeframe]
+        end = bucket_start(int(clock[0] * 1000), step)
+        rows = []
+        for i in range(limit - 1, -1, -1):
+            t = end - i * step
+            p = price(t)
+            rows.append([t, p, p * 1.002, p * 0.998, p, 1.0])
+        return rows
+
+    feed = LiveBarFeed(fetch=fetch, clock=lambda: clock[0])
+    feed.bootstrap()
+    gc.collect()
+    baseline = _current_rss_mb()
+    samples = []
+    closes = 0
+    started = time.perf_counter()
+    for minute in range(1, days * 1440 + 1):
+        clock[0] += 60
+        if feed.poll():
+            closes += 1
+            feed.latest_bar()
+        if minute % 1440 == 0:
+            samples.append(_current_rss_mb())
+
+    elapsed = time.perf_counter() - started
+    print(f"模擬 {days} 天 ({days * 1440} 次輪詢, {closes} 根4小時K線收盤)，耗時 {elapsed:.1f} 秒")
+    print(f"RSS 基準 {baseline:.1f} MB | 第1天 {samples[0]:.1f} MB | 最後 {samples[-1]:.1f} MB | 最高 {max(samples):.1f} MB")
+    print(f"第1天之後的增長: {samples[-1] - samples[0]:+.2f} MB")
+    return samples
 
 
 # --- 主程式入口 ---
 if __name__ == "__main__":
+    if "--benchmark-memory" in sys.argv:
+        benchmark_feed_memory()
+        sys.exit(0)
+
+    import_seconds = time.perf_counter() - _PROCESS_START
+
     print("🏆 ETH 4小時自動交易策略啟動 (移動停損優化版)")
     print("📅 版本更新日期: 2025/8/3")
     print("🔧 新功能: 新增RSI進場限制")
@@ -1705,7 +2679,8 @@ if __name__ == "__main__":
         input("請確認您已理解風險並準備好，按 Enter 鍵繼續...")
     except EOFError:
         print("檢測到非互動模式，自動確認繼續...")
-        time.sleep(2)
+        if not FAST_START:
+            time.sleep(2)
 
-    run_live_trading()
+    run_live_trading(import_seconds)
 
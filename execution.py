@@ -0,0 +1,370 @@
+"""
+⚡ 下單執行演算法
+- market: 直接市價單 (與原本行為相同)
+- post_only: 以買一/賣一掛 PostOnly 限價單 (maker 手續費)，逾時未成交即撤單追價，
+  追價次數用完後剩餘數量改市價成交
+- twap: 大額訂單拆成多筆，間隔送出 (冰山式，每次只露出一小部分數量)
+- 訂單簿由 OrderBookCache 提供，同一次下單流程 (計算數量、掛單) 共用同一份快照
+- ExecutionReport 記錄成交均價、相對K線收盤價的滑價與相對全市價單節省的手續費；
+  市價單的成交均價向交易所查詢，查詢不到時記為未知 (不以K線收盤價代替)
+- 掛單撤銷失敗且查詢不到最終狀態時立即停止，不再追價或補市價單 (避免超量成交)
+"""
+
+import logging
+import math
+import time
+
+from order_book import OrderBookCache
+from order_tracker import CANCELLED, FAILED, FILLED, UNKNOWN, new_client_order_id
+
+logger = logging.getLogger("autotrader.execution")
+
+EXECUTION_MODES = ("market", "post_only", "twap")
+TERMINAL_STATUSES = ("closed", "canceled", "rejected", "expired")  # 訂單已不在訂單簿上
+
+
+def round_down(qty, step):
+    """數量無條件捨去到交易所的最小變動單位"""
+    if not step:
+        return qty
+    # 加上極小值避免浮點誤差 (例如 0.3 / 0.01 = 29.999999...)
+    return round(math.floor(qty / step + 1e-9) * step, 12)
+
+
+def amount_step(market, precision_mode, default=0.01):
+    """
+    由 ccxt market 取得數量最小變動單位。
+    precision_mode 為 exchange.precisionMode：precision.amount 在 TICK_SIZE 模式下是變動單位 (0.01 或 1)，
+    在 DECIMAL_PLACES 模式下是小數位數 (2)；SIGNIFICANT_DIGITS 模式沒有固定的變動單位，回傳 default
+    """
+    try:
+        precision = market["precision"]["amount"]
+    except (KeyError, TypeError):
+        return default
+    if precision is None:
+        return default
+    import ccxt  # 呼叫時交易所實例已建立，ccxt 已載入；模組層級不匯入以維持冷啟動延遲載入
+
+    if precision_mode == ccxt.TICK_SIZE:
+        return float(precision)
+    if precision_mode == ccxt.DECIMAL_PLACES:
+        return 10 ** -int(precision)
+    return default
+
+
+class ExecutionReport:
+    """一次下單執行的成交結果與品質指標"""
+
+    __slots__ = (
+        "side",
+        "mode",
+        "requested_qty",
+        "reference_price",
+        "fills",
+        "order_ids",
+        "unresolved",
+        "taker_fee_rate",
+    )
+
+    def __init__(self, side, mode, requested_qty, reference_price, taker_fee_rate):
+        self.side = side
+        self.mode = mode
+        self.requested_qty = requested_qty
+        self.reference_price = reference_price
+        self.taker_fee_rate = taker_fee_rate
+        self.fills = []  # (數量, 價格, 手續費率)；價格未知時為 None
+        self.order_ids = []
+        self.unresolved = []  # 撤單失敗且查不到最終狀態的訂單 (可能仍在訂單簿上)
+
+    def add_fill(self, qty, price, fee_rate):
+        if qty > 0:
+            self.fills.append((qty, price or None, fee_rate))
+
+    @property
+    def filled_qty(self):
+        return sum(f[0] for f in self.fills)
+
+    @property
+    def avg_price(self):
+        """成交均價；任一筆成交價格未知時回傳 None"""
+        qty = self.filled_qty
+        if qty <= 0 or any(f[1] is None for f in self.fills):
+            return None
+        return sum(f[0] * f[1] for f in self.fills) / qty
+
+    @property
+    def fee(self):
+        return sum(f[0] * f[1] * f[2] for f in self.fills if f[1] is not None)
+
+    @property
+    def fees_saved(self):
+        """與全部以市價單 (taker) 成交相比節省的手續費 (只計價格已知的成交)"""
+        notional = sum(f[0] * f[1] for f in self.fills if f[1] is not None)
+        return notional * self.taker_fee_rate - self.fee
+
+    @property
+    def slippage_bps(self):
+        """相對參考價 (K線收盤價) 的滑價，單位 bps；正數代表成交價比參考價差"""
+        avg = self.avg_price
+        if avg is None or not self.reference_price:
+            return None
+        direction = 1 if self.side == "buy" else -1
+        return (avg - self.reference_price) / self.reference_price * 10000 * direction
+
+    def metrics(self):
+        return {
+            "mode": self.mode,
+            "side": self.side,
+            "requested_qty": self.requested_qty,
+            "filled_qty": self.filled_qty,
+            "avg_price": self.avg_price,
+            "reference_price": self.reference_price,
+            "slippage_bps": self.slippage_bps,
+            "fee": self.fee,
+            "fees_saved": self.fees_saved,
+            "orders": len(self.order_ids),
+            "unresolved_orders": list(self.unresolved),
+        }
+
+    def to_order(self, symbol):
+        """轉為與 _place_order 回傳值相同格式的訂單 dict，供既有的進出場流程使用"""
+        filled = self.filled_qty
+        return {
+            "id": self.order_ids[-1] if self.order_ids else None,
+            "side": self.side,
+            "amount": self.requested_qty,
+            "filled": filled,
+            "price": self.avg_price,
+            "symbol": symbol,
+            "type": self.mode,
+            "status": "closed" if filled > 0 else "canceled",
+        }
+
+
+class OrderExecutor:
+    def __init__(
+        self,
+        exchange,
+        symbol,
+        market_order,
+        taker_fee_rate=0.00055,
+        maker_fee_rate=0.0002,
+        chase_seconds=10,
+        max_chases=3,
+        twap_slices=4,
+        twap_interval_seconds=5,
+        twap_min_qty=0.0,
+        book_cache=None,
+        pending_orders=None,
+        can_trade=None,
+    ):
+        """
+        exchange: ccxt 交易所實例
+        market_order: 送出市價單的函式 (side, qty) → 訂單 dict 或 None (沿用策略既有的下單與備援流程)
+        chase_seconds: PostOnly 掛單每次等待成交的秒數
+        max_chases: 撤單追價次數上限，用完後剩餘數量改市價
+        twap_min_qty: 數量達到此值才拆單，較小的訂單直接市價
+        book_cache: 共用的 OrderBookCache (未提供時自行建立)
+        pending_orders: 待確認訂單表 (PendingOrderTable)；提供時 PostOnly 掛單也以 orderLinkId 登記，
+                        流程中斷後重啟可查詢並撤銷遺留的掛單
+        can_trade: 回傳目前是否仍可下單的函式 (HA 模式為是否仍是主節點)；每次送出訂單前與等待成交期間檢查，
+                   回傳 False 時撤銷掛單並中止執行
+        """
+        self.exchange = exchange
+        self.symbol = symbol
+        self.market_order = market_order
+        self.taker_fee_rate = taker_fee_rate
+        self.maker_fee_rate = maker_fee_rate
+        self.chase_seconds = chase_seconds
+        self.max_chases = max_chases
+        self.twap_slices = twap_slices
+        self.twap_interval_seconds = twap_interval_seconds
+        self.twap_min_qty = twap_min_qty
+        self.book_cache = book_cache or OrderBookCache(exchange, symbol)
+        self.pending_orders = pending_orders
+        self.can_trade = can_trade
+
+    def _can_continue(self):
+        if self.can_trade is None or self.can_trade():
+            return True
+        logger.error("🚫 已無下單權限 (非主節點)，中止下單執行")
+        return False
+
+    def _amount_step(self):
+        try:
+            return amount_step(self.exchange.market(self.symbol), self.exchange.precisionMode)
+        except Exception:
+            return 0.01
+
+    # --- 執行 ---
+    def execute(self, side, qty, mode="market", reference_price=None):
+        """依 mode 執行下單，回傳 ExecutionReport"""
+        if mode not in EXECUTION_MODES:
+            logger.warning(f"⚠️ 未知的執行模式 {mode}，改用市價單")
+            mode = "market"
+
+        report = ExecutionReport(side, mode, qty, reference_price, self.taker_fee_rate)
+        if mode == "post_only":
+            self._post_only(report, side, qty)
+        elif mode == "twap" and qty >= self.twap_min_qty:
+            self._twap(report, side, qty)
+        else:
+            self._market(report, side, qty)
+        return report
+
+    def _market(self, report, side, qty):
+        if not self._can_continue():
+            return False
+        order = self.market_order(side, qty)
+        if order is None:
+            return False
+        order_id = order.get("id")
+        report.order_ids.append(order_id)
+        price = order.get("average") or order.get("price")
+        filled = order.get("filled")
+        if not price and order_id:
+            # Bybit 的下單回應只有訂單編號，成交均價需另外查詢 (市價單的 price 是保護價，不是成交價)
+            fetched = self._fetch_order(order_id)
+            if fetched:
+                price = fetched.get("average")
+                filled = fetched.get("filled") or filled
+        if not price:
+            logger.warning(f"⚠️ 查詢不到市價單 {order_id} 的成交均價，本次不計滑價")
+        report.add_fill(filled or qty, price, self.taker_fee_rate)
+        return True
+
+    def _post_only(self, report, side, qty):
+        step = self._amount_step()
+        try:
+            book = self.book_cache.get()
+        except Exception as e:
+            logger.warning(f"⚠️ 取得訂單簿失敗，改用市價單: {e}")
+            self._market(report, side, qty)
+            return
+
+        remaining = qty
+        for attempt in range(self.max_chases + 1):
+            price = book.best_bid if side == "buy" else book.best_ask
+            if price is None:
+                break
+
+            filled, avg_price, settled = self._post_and_wait(report, side, remaining, price)
+            report.add_fill(filled, avg_price or price, self.maker_fee_rate)
+            if not settled:
+                # 掛單可能仍在訂單簿上，剩餘數量無法確定：停止追價與補市價單，交由重啟/對帳確認
+                logger.error(f"❌ PostOnly 掛單 {report.unresolved[-1]} 狀態不明，停止執行 (已確認成交 {report.filled_qty})")
+                return
+            remaining = round_down(remaining - filled, step)
+            if remaining < step or not self._can_continue():
+                return
+
+            if attempt < self.max_chases:
+                logger.info(f"🔁 PostOnly 未完全成交，剩餘 {remaining}，追價重掛 ({attempt + 1}/{self.max_chases})")
+                try:
+                    book = self.book_cache.refresh()
+                except Exception as e:
+                    logger.warning(f"⚠️ 追價時取得訂單簿失敗: {e}")
+                    break
+
+        if remaining >= step:
+            logger.info(f"⏩ PostOnly 逾時，剩餘 {remaining} 改市價成交")
+            self._market(report, side, remaining)
+
+    def _post_and_wait(self, report, side, qty, price):
+        """
+        掛 PostOnly 限價單並等待成交；逾時撤單。回傳 (成交數量, 成交均價, 是否確認已離開訂單簿)
+        撤單失敗且查不到最終狀態時第三個值為 False，成交數量只是最後一次看到的值
+        """
+        link_id = new_client_order_id("po")
+        params = {
+            "category": "linear",
+            "timeInForce": "PostOnly",
+            "clientOrderId": link_id,
+        }
+        self._track(link_id, side, qty, price=price)
+        try:
+            order = self.exchange.create_order(
+                symbol=self.symbol,
+                type="limit",
+                side=side,
+                amount=qty,
+                price=price,
+                params=params,
+            )
+        except Exception as e:
+            # 價格已穿越對手價時 PostOnly 會被拒絕，交由下一次追價處理
+            logger.warning(f"⚠️ PostOnly 掛單被拒: {e}")
+            import ccxt  # 延遲載入 (同 amount_step)
+
+            if isinstance(e, ccxt.NetworkError):
+                # 逾時的掛單可能已送達，不能當作未掛出繼續追價
+                self._mark(link_id, UNKNOWN, error=str(e))
+                report.unresolved.append(link_id)
+                return 0.0, None, False
+            self._mark(link_id, FAILED, error=str(e))
+            return 0.0, None, True
+
+        order_id = order.get("id")
+        report.order_ids.append(order_id)
+        deadline = time.monotonic() + self.chase_seconds
+        status = order
+        while time.monotonic() < deadline:
+            time.sleep(1)
+            status = self._fetch_order(order_id) or status
+            if status.get("status") in TERMINAL_STATUSES:
+                break
+            if self.can_trade is not None and not self.can_trade():
+                break  # 失去下單權限：立即撤單，不再等待成交
+
+        if status.get("status") not in TERMINAL_STATUSES:
+            try:
+                self.exchange.cancel_order(order_id, self.symbol, params={"category": "linear"})
+            except Exception as e:
+                logger.warning(f"⚠️ 撤銷 PostOnly 掛單失敗: {e}")
+            # 撤單前可能又有成交，以最終狀態為準
+            status = self._fetch_order(order_id) or status
+
+        filled = float(status.get("filled") or 0.0)
+        if status.get("status") not in TERMINAL_STATUSES:
+            self._mark(link_id, UNKNOWN, order_id=order_id, error="撤單後查詢不到最終狀態")
+            report.unresolved.append(order_id)
+            return filled, status.get("average") or status.get("price"), False
+        self._mark(link_id, FILLED if filled > 0 else CANCELLED, order_id=order_id, filled=filled)
+        return filled, status.get("average") or status.get("price"), True
+
+    def _track(self, link_id, side, qty, **fields):
+        if self.pending_orders is not None:
+            self.pending_orders.add(link_id, side, qty, type="post_only", **fields)
+
+    def _mark(self, link_id, status, **fields):
+        if self.pending_orders is not None:
+            self.pending_orders.mark(link_id, status, **fields)
+
+    def _fetch_order(self, order_id):
+        try:
+            return self.exchange.fetch_order(
+                order_id, self.symbol, params={"category": "linear", "acknowledged": True}
+            )
+        except Exception:
+            return None
+
+    def _twap(self, report, side, qty):
+        step = self._amount_step()
+        slices = max(1, self.twap_slices)
+        slice_qty = round_down(qty / slices, step)
+        if slice_qty < step:
+            self._market(report, side, qty)
+            return
+
+        remaining = qty
+        for i in range(slices):
+            current = remaining if i == slices - 1 else slice_qty
+            current = round_down(current, step)
+            if current < step:
+                break
+            if not self._market(report, side, current):
+                logger.error(f"❌ TWAP 第 {i + 1}/{slices} 筆下單失敗，停止拆單")
+                break
+            remaining = round_down(remaining - current, step)
+            if i < slices - 1:
+                time.sleep(self.twap_interval_seconds)
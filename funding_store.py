@@ -0,0 +1,110 @@
+"""
+💸 資金費率歷史庫
+- 永續合約每 8 小時結算一次資金費率；歷史資料以 (時間, 費率) 結構陣列保存為 .npy，
+  讀取時使用 memory map，回測不必把整段歷史載入記憶體
+- backfill 以固定時間視窗分頁補齊缺少的區間 (只請求最後一筆之後的資料)，寫入暫存檔後替換；
+  空視窗 (例如合約上市前) 直接前進到下一個視窗，直到 until_ms
+- per_bar 以累積和 + searchsorted 一次算出每根 K 線期間結算的費率合計，回測迴圈內只需查表
+
+用法: python funding_store.py [起始日期 YYYY-MM-DD]  (補齊 ETH/USDT 資金費率歷史)
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+FUNDING_DTYPE = np.dtype([("time", "<i8"), ("rate", "<f8")])
+FUNDING_INTERVAL_MS = 8 * 3_600_000
+DEFAULT_STORE_PATH = "funding_ETHUSDT.npy"
+DEFAULT_SINCE_MS = 1_546_300_800_000  # 2019-01-01 UTC
+PAGE_LIMIT = 200  # Bybit 每次最多回傳 200 筆
+
+
+class FundingStore:
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self._data = None
+
+    @property
+    def data(self):
+        """(time, rate) 結構陣列 (memory map，唯讀)；檔案不存在時為空陣列"""
+        if self._data is None:
+            if os.path.exists(self.path):
+                self._data = np.load(self.path, mmap_mode="r")
+            else:
+                self._data = np.empty(0, dtype=FUNDING_DTYPE)
+        return self._data
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def last_time(self):
+        return int(self.data["time"][-1]) if len(self.data) else None
+
+    def append(self, records):
+        """
+        加入 [(毫秒時間, 費率), ...] (可含重複或已存在的時間)，依時間排序去重後整體寫回
+        回傳新增筆數
+        """
+        if not records:
+            return 0
+        new = np.array(records, dtype=FUNDING_DTYPE)
+        combined = np.concatenate([np.asarray(self.data), new])
+        times, index = np.unique(combined["time"][::-1], return_index=True)
+        merged = combined[::-1][index]  # 相同時間以新資料為準
+        added = len(merged) - len(self.data)
+
+        tmp_path = self.path + ".tmp.npy"
+        np.save(tmp_path, merged)
+        self._data = None  # 釋放舊的 memory map 再替換檔案
+        os.replace(tmp_path, self.path)
+        return added
+
+    def backfill(self, exchange, symbol="ETH/USDT:USDT", since_ms=DEFAULT_SINCE_MS, until_ms=None, pause=0.2):
+        """由最後一筆 (或 since_ms) 開始分頁補齊資金費率歷史，回傳新增筆數"""
+        until_ms = until_ms or int(time.time() * 1000)
+        cursor = (self.last_time + 1) if self.last_time is not None else since_ms
+        records = []
+        while cursor < until_ms:
+            # 每個視窗最多 PAGE_LIMIT 次結算，一頁即可取完 (明確指定 until，不依賴 ccxt 推算的 endTime)
+            window_end = min(cursor + PAGE_LIMIT * FUNDING_INTERVAL_MS - 1, until_ms)
+            page = exchange.fetch_funding_rate_history(
+                symbol, since=cursor, limit=PAGE_LIMIT, params={"until": window_end}
+            )
+            page = [r for r in page if r.get("timestamp") and cursor <= r["timestamp"] <= window_end]
+            records.extend((int(r["timestamp"]), float(r["fundingRate"])) for r in page)
+            if len(page) >= PAGE_LIMIT:
+                cursor = max(r["timestamp"] for r in page) + 1  # 結算間隔比 8 小時短時，從最後一筆之後繼續
+            else:
+                cursor = window_end + 1
+            time.sleep(pause)
+        return self.append(records)
+
+    def per_bar(self, bar_times_ms, bar_ms):
+        """
+        每根 K 線期間 (開始時間, 開始時間 + bar_ms] 結算的資金費率合計
+        持倉跨越該根 K 線時，資金費 = 持倉量 × 價格 × 費率合計 (多單為正時支付)
+        """
+        bar_times_ms = np.asarray(bar_times_ms, dtype=np.int64)
+        data = self.data
+        if len(data) == 0:
+            return np.zeros(len(bar_times_ms))
+        times = np.asarray(data["time"])
+        cumulative = np.concatenate([[0.0], np.cumsum(data["rate"])])
+        start = np.searchsorted(times, bar_times_ms, side="right")
+        end = np.searchsorted(times, bar_times_ms + bar_ms, side="right")
+        return cumulative[end] - cumulative[start]
+
+
+if __name__ == "__main__":
+    import ccxt
+
+    since = DEFAULT_SINCE_MS
+    if len(sys.argv) > 1:
+        since = int(np.datetime64(sys.argv[1], "ms").astype(np.int64))
+    store = FundingStore()
+    added = store.backfill(ccxt.bybit({"options": {"defaultType": "linear"}}), since_ms=since)
+    print(f"新增 {added} 筆資金費率，共 {len(store)} 筆 ({store.path})")
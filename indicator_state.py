@@ -0,0 +1,226 @@
+"""
+💾 增量指標狀態
+- EMA90/EMA200/MACD 的 EMA 累積值、Wilder 平滑的 TR/+DM/-DM 與 ADX、RSI 的 14 根漲跌視窗
+- 每根新 K 線只做 O(1) 更新，數值與 calculate_indicators 由同一起點計算的結果相同
+- 狀態連同最後一根 K 線時間保存到檔案；重啟後只需補上停機期間錯過的 K 線，
+  指標延續完整歷史 (不會因為只抓 300 根 K 線而每次重新收斂 EMA200)
+"""
+
+import json
+import math
+import os
+from collections import deque
+
+STATE_VERSION = 1
+
+# 指標週期 (與 calculate_indicators 相同)；週期變更時舊的狀態檔不再適用
+PERIODS = {
+    "ema_fast": 90,
+    "ema_slow": 200,
+    "adx": 14,
+    "rsi": 14,
+    "macd_fast": 12,
+    "macd_slow": 26,
+    "macd_signal": 9,
+}
+
+
+def _ema_alpha(span):
+    return 2 / (span + 1)
+
+
+def _ema(previous, value, alpha):
+    """pandas ewm(adjust=False)：第一個值直接作為起點"""
+    if previous is None:
+        return value
+    return (1 - alpha) * previous + alpha * value
+
+
+class IndicatorState:
+    def __init__(self, periods=None):
+        self.periods = dict(periods or PERIODS)
+        self.last_time_ms = None
+        self.bars = 0  # 已累積的 K 線數
+        self.prev_high = None
+        self.prev_low = None
+        self.prev_close = None
+        self.ema_fast = None
+        self.ema_slow = None
+        self.macd_fast = None
+        self.macd_slow = None
+        self.macd_signal = None
+        # Wilder 平滑 (alpha = 1/period)
+        self.atr = None
+        self.plus_dm = None
+        self.minus_dm = None
+        self.adx = None
+        self.adx_weight = 1.0  # DX 缺值時 pandas 仍會衰減舊權重
+        self.gains = deque(maxlen=self.periods["rsi"])
+        self.losses = deque(maxlen=self.periods["rsi"])
+        self.last_values = None  # 最後一根 K 線的指標值 (重啟後不必重算即可取得)
+
+    # --- 更新 ---
+    def update(self, time_ms, high, low, close):
+        """
+        加入一根已收盤 K 線並回傳 {指標欄位: 數值} (尚未就緒的指標為 NaN)
+        時間不晚於上一根時不更新，回傳 None
+        """
+        if self.last_time_ms is not None and time_ms <= self.last_time_ms:
+            return None
+        p = self.periods
+        nan = math.nan
+
+        self.ema_fast = _ema(self.ema_fast, close, _ema_alpha(p["ema_fast"]))
+        self.ema_slow = _ema(self.ema_slow, close, _ema_alpha(p["ema_slow"]))
+        self.macd_fast = _ema(self.macd_fast, close, _ema_alpha(p["macd_fast"]))
+        self.macd_slow = _ema(self.macd_slow, close, _ema_alpha(p["macd_slow"]))
+        macd = self.macd_fast - self.macd_slow
+        self.macd_signal = _ema(self.macd_signal, macd, _ema_alpha(p["macd_signal"]))
+
+        alpha = 1 / p["adx"]
+        plus_di = minus_di = nan
+        if self.prev_close is None:
+            self.atr = high - low
+            self.gains.append(0.0)  # 第一根的漲跌視為 0 (與 calculate_rsi 相同)
+            self.losses.append(0.0)
+        else:
+            tr = max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+            self.atr = (1 - alpha) * self.atr + alpha * tr
+
+            up = max(high - self.prev_high, 0.0)
+            down = max(self.prev_low - low, 0.0)
+            if up <= down:
+                up = 0.0
+            if down <= up:
+                down = 0.0
+            self.plus_dm = _ema(self.plus_dm, up, alpha)
+            self.minus_dm = _ema(self.minus_dm, down, alpha)
+            if self.atr != 0:
+                plus_di = 100 * self.plus_dm / self.atr
+                minus_di = 100 * self.minus_dm / self.atr
+
+            delta = close - self.prev_close
+            self.gains.append(max(delta, 0.0))
+            self.losses.append(max(-delta, 0.0))
+
+        dx = nan
+        if plus_di + minus_di != 0:  # NaN 時比較結果也會讓 dx 維持 NaN
+            dx = 100 * abs(plus_di - minus_di) / (plus_di + minus_di)
+        self.adx_weight *= 1 - alpha
+        if not math.isnan(dx):
+            if self.adx is None:
+                self.adx = dx
+            else:
+                self.adx = (self.adx_weight * self.adx + alpha * dx) / (self.adx_weight + alpha)
+            self.adx_weight = 1.0
+
+        rsi = nan
+        if len(self.gains) == self.gains.maxlen:
+            gain = sum(self.gains) / len(self.gains)
+            loss = sum(self.losses) / len(self.losses)
+            if loss:
+                rsi = 100 - 100 / (1 + gain / loss)
+            elif gain:
+                rsi = 100.0
+
+        self.prev_high, self.prev_low, self.prev_close = high, low, close
+        self.last_time_ms = int(time_ms)
+        self.bars += 1
+        self.last_values = {
+            "ema90": self.ema_fast,
+            "ema200": self.ema_slow,
+            "adx": self.adx if self.adx is not None else nan,
+            "plus_di": plus_di,
+            "minus_di": minus_di,
+            "atr": self.atr,
+            "rsi": rsi,
+            "macd": macd,
+            "macd_signal": self.macd_signal,
+            "macd_histogram": macd - self.macd_signal,
+        }
+        return self.last_values
+
+    def apply_to(self, buffer, start=0):
+        """
+        依序以 buffer 中時間晚於 last_time_ms 的 K 線更新狀態，並把指標寫回 buffer 對應的列
+        (時間等於 last_time_ms 的列寫入保存的 last_values)，回傳更新的 K 線數
+        """
+        times = buffer.times
+        columns = buffer.columns
+        high, low, close = columns["high"], columns["low"], columns["close"]
+        updated = 0
+        for i in range(start, len(buffer)):
+            if self.last_time_ms is not None and times[i] == self.last_time_ms:
+                for field, value in (self.last_values or {}).items():
+                    columns[field][i] = value
+                continue
+            values = self.update(int(times[i]), float(high[i]), float(low[i]), float(close[i]))
+            if values is None:
+                continue
+            for field, value in values.items():
+                columns[field][i] = value
+            updated += 1
+        return updated
+
+    # --- 持久化 ---
+    def to_dict(self):
+        return {
+            "version": STATE_VERSION,
+            "periods": self.periods,
+            "last_time_ms": self.last_time_ms,
+            "bars": self.bars,
+            "prev_high": self.prev_high,
+            "prev_low": self.prev_low,
+            "prev_close": self.prev_close,
+            "ema_fast": self.ema_fast,
+            "ema_slow": self.ema_slow,
+            "macd_fast": self.macd_fast,
+            "macd_slow": self.macd_slow,
+            "macd_signal": self.macd_signal,
+            "atr": self.atr,
+            "plus_dm": self.plus_dm,
+            "minus_dm": self.minus_dm,
+            "adx": self.adx,
+            "adx_weight": self.adx_weight,
+            "gains": list(self.gains),
+            "losses": list(self.losses),
+            "last_values": self.last_values,
+        }
+
+    @classmethod
+    def from_dict(cls, data, periods=None):
+        """版本或指標週期不符時拋出 ValueError"""
+        periods = dict(periods or PERIODS)
+        if data.get("version") != STATE_VERSION or data.get("periods") != periods:
+            raise ValueError("指標狀態的版本或週期設定不符")
+        state = cls(periods)
+        for key, value in data.items():
+            if key in ("version", "periods", "gains", "losses"):
+                continue
+            if hasattr(state, key):
+                setattr(state, key, value)
+        state.gains.extend(data.get("gains", []))
+        state.losses.extend(data.get("losses", []))
+        return state
+
+    def save(self, path):
+        """寫入暫存檔後替換"""
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f)
+            os.replace(tmp_path, path)
+            return True
+        except OSError:
+            return False
+
+    @classmethod
+    def load(cls, path, periods=None):
+        """讀取狀態檔；不存在或無法使用時回傳 None"""
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls.from_dict(json.load(f), periods)
+        except (OSError, ValueError, TypeError, KeyError):
+            return None
@@ -0,0 +1,75 @@
+"""
+📈 技術指標計算 (pandas 版本)
+- 實盤啟動時的整段歷史計算與回測共用同一份實作
+- 本模組沒有任何匯入副作用 (不讀取 .env、不建立日誌檔或執行緒)，回測/分析工具可直接匯入
+"""
+
+import importlib
+
+from kernels import wilder_adx
+
+
+def calculate_ema(series, period):
+    """計算指數移動平均線"""
+    return series.ewm(span=period, adjust=False).mean()
+
+
+def calculate_adx(high, low, close, period=14):
+    """計算ADX指標 - 使用標準的Wilder平滑法 (數值核心見 kernels.wilder_adx，有 numba 時自動編譯)"""
+    pd = importlib.import_module("pandas")  # 呼叫時才載入，實盤冷啟動不需要 pandas
+    adx, plus_di, minus_di, atr = wilder_adx(high.to_numpy(), low.to_numpy(), close.to_numpy(), period)
+    index = close.index
+    # ATR (Wilder平滑的True Range) 一併回傳，供部位大小計算使用
+    return (
+        pd.Series(adx, index=index),
+        pd.Series(plus_di, index=index),
+        pd.Series(minus_di, index=index),
+        pd.Series(atr, index=index),
+    )
+
+
+def calculate_rsi(close, period=14):
+    """計算RSI指標"""
+    delta = close.diff()
+    gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
+    rs = gain / loss
+    rsi = 100 - (100 / (1 + rs))
+    return rsi
+
+
+def calculate_macd(close, fast=12, slow=26, signal=9):
+    """計算MACD指標"""
+    ema_fast = calculate_ema(close, fast)
+    ema_slow = calculate_ema(close, slow)
+    macd_line = ema_fast - ema_slow
+    signal_line = calculate_ema(macd_line, signal)
+    histogram = macd_line - signal_line
+    return macd_line, signal_line, histogram
+
+
+def calculate_indicators(df):
+    """計算所有技術指標"""
+    df = df.copy()
+
+    # EMA指標
+    df["ema90"] = calculate_ema(df["close"], 90)
+    df["ema200"] = calculate_ema(df["close"], 200)
+
+    # ADX指標
+    adx, plus_di, minus_di, atr = calculate_adx(df["high"], df["low"], df["close"], 14)
+    df["adx"] = adx
+    df["plus_di"] = plus_di
+    df["minus_di"] = minus_di
+    df["atr"] = atr
+
+    # RSI指標
+    df["rsi"] = calculate_rsi(df["close"], 14)
+
+    # MACD指標
+    macd_line, signal_line, histogram = calculate_macd(df["close"])
+    df["macd"] = macd_line
+    df["macd_signal"] = signal_line
+    df["macd_histogram"] = histogram
+
+    return df.dropna()
@@ -0,0 +1,371 @@
+"""
+🚀 數值核心 (ADX 與移動停損狀態機)
+- 安裝 numba 時以 JIT 編譯的單迴圈實作；未安裝時使用純 NumPy 版本，結果一致
+- wilder_adx: 一次計算 ADX / +DI / -DI / ATR，不建立中間的 pandas Series
+- trail_path: 沿著 1 分鐘價格路徑執行移動停損狀態機 (峰值/谷值 → 激活 → 停損價 → 觸發)，
+  與 check_trailing_stop_only 的逐分鐘邏輯相同
+用法: python kernels.py  (與 pandas 版本比對結果並測量多年份 1 分鐘資料的速度)
+"""
+
+import math
+import time
+
+import numpy as np
+
+try:
+    from numba import njit
+
+    NUMBA_AVAILABLE = True
+except ImportError:  # numba 為選用套件
+    NUMBA_AVAILABLE = False
+
+# NumPy 版 EWM 每次向量化處理的長度：(1 - alpha) 的次方在區塊內不會下溢
+_EWM_BLOCK = 128
+
+
+# --- Wilder EWM (等同 pandas ewm(alpha, adjust=False)，含 NaN 處理) ---
+def _ewm_loop(x, alpha):
+    out = np.empty(x.shape[0])
+    weighted = np.nan
+    old_wt = 1.0
+    for i in range(x.shape[0]):
+        value = x[i]
+        observed = value == value
+        old_wt *= 1.0 - alpha
+        if observed:
+            if weighted != weighted:
+                weighted = value
+            else:
+                weighted = (old_wt * weighted + alpha * value) / (old_wt + alpha)
+            old_wt = 1.0
+        out[i] = weighted
+    return out
+
+
+def _ewm_numpy(x, alpha):
+    """區塊向量化的 EWM；序列中間出現 NaN 時改用逐點迴圈 (與 pandas 的權重處理一致)"""
+    valid = ~np.isnan(x)
+    if not valid.any():
+        return np.full(x.shape[0], np.nan)
+    start = int(np.argmax(valid))
+    if not valid[start:].all():
+        return _ewm_loop(x, alpha)
+
+    out = np.full(x.shape[0], np.nan)
+    decay = 1.0 - alpha
+    powers = decay ** np.arange(_EWM_BLOCK)
+    inverse = 1.0 / powers
+    previous = x[start]
+    out[start] = previous
+    i = start + 1
+    n = x.shape[0]
+    while i < n:
+        block = x[i : i + _EWM_BLOCK]
+        m = block.shape[0]
+        # y_j = decay^j * (decay * y_prev + alpha * Σ_k x_k / decay^k)
+        acc = np.cumsum(block * inverse[:m]) * alpha
+        values = powers[:m] * (decay * previous + acc)
+        out[i : i + m] = values
+        previous = values[-1]
+        i += m
+    return out
+
+
+def _directional_inputs(high, low, close):
+    """True Range 與 +DM / -DM (與 calculate_adx 的 pandas 版本相同的規則)"""
+    n = high.shape[0]
+    prev_close = np.empty(n)
+    prev_close[0] = np.nan
+    prev_close[1:] = close[:-1]
+    with np.errstate(invalid="ignore"):
+        tr = np.fmax(np.fmax(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+
+    plus_dm = np.empty(n)
+    minus_dm = np.empty(n)
+    plus_dm[0] = minus_dm[0] = np.nan
+    plus_dm[1:] = np.diff(high)
+    minus_dm[1:] = -np.diff(low)
+    with np.errstate(invalid="ignore"):
+        plus_dm = np.where(plus_dm < 0, 0.0, plus_dm)
+        minus_dm = np.where(minus_dm < 0, 0.0, minus_dm)
+        # 與 pandas 版本相同的先後順序：先把 +DM 歸零，再用歸零後的 +DM 判斷 -DM
+        plus_dm = np.where(plus_dm <= minus_dm, 0.0, plus_dm)
+        minus_dm = np.where(minus_dm <= plus_dm, 0.0, minus_dm)
+    return tr, plus_dm, minus_dm
+
+
+def _wilder_adx_numpy(high, low, close, period):
+    alpha = 1.0 / period
+    tr, plus_dm, minus_dm = _directional_inputs(high, low, close)
+    atr = _ewm_numpy(tr, alpha)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        plus_di = 100 * (_ewm_numpy(plus_dm, alpha) / atr)
+        minus_di = 100 * (_ewm_numpy(minus_dm, alpha) / atr)
+        dx = 100 * np.abs(plus_di - minus_di) / (plus_di + minus_di)
+    adx = _ewm_numpy(dx, alpha)
+    return adx, plus_di, minus_di, atr
+
+
+def _wilder_adx_loop(high, low, close, period):
+    """單一迴圈版本 (numba 編譯用)：同時完成 TR/DM、平滑、DI、DX 與 ADX"""
+    n = high.shape[0]
+    alpha = 1.0 / period
+    decay = 1.0 - alpha
+    adx = np.full(n, np.nan)
+    plus_di = np.full(n, np.nan)
+    minus_di = np.full(n, np.nan)
+    atr = np.full(n, np.nan)
+    if n == 0:
+        return adx, plus_di, minus_di, atr
+
+    atr_value = high[0] - low[0]
+    atr[0] = atr_value
+    plus_smooth = np.nan
+    minus_smooth = np.nan
+    dm_wt = 1.0
+    adx_value = np.nan
+    adx_wt = 1.0
+    adx_wt *= decay  # 第0根沒有 DX，但權重仍然衰減 (與 pandas 一致)
+
+    for i in range(1, n):
+        tr = max(high[i] - low[i], abs(high[i] - close[i - 1]), abs(low[i] - close[i - 1]))
+        atr_value = (decay * atr_value + alpha * tr) / (decay + alpha)
+        atr[i] = atr_value
+
+        up = high[i] - high[i - 1]
+        down = low[i - 1] - low[i]
+        if up < 0:
+            up = 0.0
+        if down < 0:
+            down = 0.0
+        if up <= down:
+            up = 0.0
+        if down <= up:
+            down = 0.0
+
+        dm_wt *= decay
+        if plus_smooth != plus_smooth:
+            plus_smooth = up
+            minus_smooth = down
+        else:
+            plus_smooth = (dm_wt * plus_smooth + alpha * up) / (dm_wt + alpha)
+            minus_smooth = (dm_wt * minus_smooth + alpha * down) / (dm_wt + alpha)
+        dm_wt = 1.0
+
+        pdi = 100 * (plus_smooth / atr_value) if atr_value != 0 else np.nan
+        mdi = 100 * (minus_smooth / atr_value) if atr_value != 0 else np.nan
+        plus_di[i] = pdi
+        minus_di[i] = mdi
+
+        total = pdi + mdi
+        dx = 100 * abs(pdi - mdi) / total if total != 0 else np.nan
+        adx_wt *= decay
+        if dx == dx:
+            if adx_value != adx_value:
+                adx_value = dx
+            else:
+                adx_value = (adx_wt * adx_value + alpha * dx) / (adx_wt + alpha)
+            adx_wt = 1.0
+        adx[i] = adx_value
+    return adx, plus_di, minus_di, atr
+
+
+# --- 移動停損狀態機 ---
+def _trail_path_loop(high, low, close, direction, entry, activate, min_profit, pullback, extreme, trail, active):
+    """
+    逐分鐘執行移動停損，回傳 (觸發索引或 -1, 極值, 停損價, 是否激活)；
+    觸發時狀態停在觸發那一分鐘
+    """
+    protect = entry * (1 + direction * min_profit)
+    activate_price = entry * (1 + direction * activate)
+    for i in range(close.shape[0]):
+        if direction > 0:
+            extreme = high[i] if extreme != extreme else max(extreme, high[i])
+            if not active and close[i] > activate_price:
+                active = True
+                trail = protect
+            if active:
+                trail = max(trail if trail == trail else 0.0, max(extreme * (1 - pullback), protect))
+                if close[i] <= trail:
+                    return i, extreme, trail, active
+        else:
+            extreme = low[i] if extreme != extreme else min(extreme, low[i])
+            if not active and close[i] < activate_price:
+                active = True
+                trail = protect
+            if active:
+                trail = min(trail if trail == trail else np.inf, min(extreme * (1 + pullback), protect))
+                if close[i] >= trail:
+                    return i, extreme, trail, active
+    return -1, extreme, trail, active
+
+
+def _trail_path_numpy(high, low, close, direction, entry, activate, min_profit, pullback, extreme, trail, active):
+    """向量化版本：峰值/谷值單調，停損價 = 累積極值換算後與保護價、舊停損價取優"""
+    n = close.shape[0]
+    if n == 0:
+        return -1, extreme, trail, active
+    protect = entry * (1 + direction * min_profit)
+    activate_price = entry * (1 + direction * activate)
+
+    if direction > 0:
+        extremes = np.maximum.accumulate(high if extreme != extreme else np.maximum(high, extreme))
+        start = 0 if active else _first(close > activate_price)
+    else:
+        extremes = np.minimum.accumulate(low if extreme != extreme else np.minimum(low, extreme))
+        start = 0 if active else _first(close < activate_price)
+    if start < 0:
+        return -1, float(extremes[-1]), trail, active
+
+    if direction > 0:
+        base = protect if trail != trail else max(trail, protect)
+        trails = np.maximum(extremes[start:] * (1 - pullback), base)
+        hit = _first(close[start:] <= trails)
+    else:
+        base = protect if trail != trail else min(trail, protect)
+        trails = np.minimum(extremes[start:] * (1 + pullback), base)
+        hit = _first(close[start:] >= trails)
+
+    end = hit if hit >= 0 else trails.shape[0] - 1
+    index = start + hit if hit >= 0 else -1
+    return index, float(extremes[start + end]), float(trails[end]), True
+
+
+def _first(mask):
+    """第一個 True 的索引，沒有時回傳 -1"""
+    if mask.shape[0] == 0:
+        return -1
+    i = int(np.argmax(mask))
+    return i if mask[i] else -1
+
+
+if NUMBA_AVAILABLE:
+    _wilder_adx_impl = njit(cache=True)(_wilder_adx_loop)
+    _trail_path_impl = njit(cache=True)(_trail_path_loop)
+else:
+    _wilder_adx_impl = _wilder_adx_numpy
+    _trail_path_impl = _trail_path_numpy
+
+
+def wilder_adx(high, low, close, period=14):
+    """回傳 (adx, plus_di, minus_di, atr) numpy 陣列，與 pandas 版本的 calculate_adx 數值一致"""
+    return _wilder_adx_impl(
+        np.ascontiguousarray(high, dtype=np.float64),
+        np.ascontiguousarray(low, dtype=np.float64),
+        np.ascontiguousarray(close, dtype=np.float64),
+        period,
+    )
+
+
+def trail_path(high, low, close, side, entry, activate, min_profit, pullback, extreme=None, trail=None, active=False):
+    """
+    沿價格路徑執行移動停損
+    side: "long" / "short"；extreme/trail/active 為目前的峰值(谷值)/停損價/激活狀態
+    回傳 (觸發索引或 -1, 極值, 停損價, 是否激活)
+    """
+    index, extreme, trail, active = _trail_path_impl(
+        np.ascontiguousarray(high, dtype=np.float64),
+        np.ascontiguousarray(low, dtype=np.float64),
+        np.ascontiguousarray(close, dtype=np.float64),
+        1 if side == "long" else -1,
+        float(entry),
+        float(activate),
+        float(min_profit),
+        float(pullback),
+        np.nan if extreme is None else float(extreme),
+        np.nan if trail is None or not active else float(trail),
+        bool(active),
+    )
+    extreme = None if extreme != extreme else float(extreme)
+    trail = None if trail != trail else float(trail)
+    return int(index), extreme, trail, bool(active)
+
+
+# --- 比對與效能測試 ---
+def _adx_pandas(high, low, close, period=14):
+    """原本以 pandas Series 實作的 calculate_adx，作為比對基準"""
+    import pandas as pd
+
+    high, low, close = pd.Series(high), pd.Series(low), pd.Series(close)
+    tr1 = high - low
+    tr2 = abs(high - close.shift(1))
+    tr3 = abs(low - close.shift(1))
+    tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
+    plus_dm = high.diff()
+    minus_dm = -low.diff()
+    plus_dm[plus_dm < 0] = 0
+    minus_dm[minus_dm < 0] = 0
+    plus_dm[(plus_dm <= minus_dm)] = 0
+    minus_dm[(minus_dm <= plus_dm)] = 0
+    alpha = 1.0 / period
+    atr = tr.ewm(alpha=alpha, adjust=False).mean()
+    plus_di = 100 * (plus_dm.ewm(alpha=alpha, adjust=False).mean() / atr)
+    minus_di = 100 * (minus_dm.ewm(alpha=alpha, adjust=False).mean() / atr)
+    dx = 100 * abs(plus_di - minus_di) / (plus_di + minus_di)
+    adx = dx.ewm(alpha=alpha, adjust=False).mean()
+    return adx.to_numpy(), plus_di.to_numpy(), minus_di.to_numpy(), atr.to_numpy()
+
+
+def _random_walk(n, seed=7):
+    rng = np.random.default_rng(seed)
+    close = 2000 * np.exp(np.cumsum(rng.normal(0, 0.001, n)))
+    spread = np.abs(rng.normal(0, 0.0008, n))
+    return close * (1 + spread), close * (1 - spread), close
+
+
+def _check_parity(n=200_000):
+    high, low, close = _random_walk(n)
+    expected = _adx_pandas(high, low, close)
+    loop_n = 20_000  # 未編譯時純 Python 迴圈較慢，只比對前段
+    cases = (
+        ("numpy", _wilder_adx_numpy(high, low, close, 14), expected),
+        ("kernel", _wilder_adx_impl(high, low, close, 14), expected),
+        ("loop", _wilder_adx_loop(high[:loop_n], low[:loop_n], close[:loop_n], 14), [e[:loop_n] for e in expected]),
+    )
+    for name, result, reference in cases:
+        for label, a, b in zip(("adx", "+di", "-di", "atr"), result, reference):
+            if not np.allclose(a, b, rtol=1e-9, atol=1e-9, equal_nan=True):
+                raise AssertionError(f"{name} {label} 與 pandas 版本不一致")
+
+    params = (0.01, 0.005, 0.02)
+    for side in ("long", "short"):
+        entry = close[0]
+        for start in range(0, n, n // 20):
+            args = (high[start:], low[start:], close[start:], 1 if side == "long" else -1, entry, *params)
+            a = _trail_path_loop(*args, np.nan, np.nan, False)
+            b = _trail_path_numpy(*args, np.nan, np.nan, False)
+            if a[0] != b[0] or not np.allclose(a[1:3], b[1:3], equal_nan=True) or a[3] != b[3]:
+                raise AssertionError(f"{side} 移動停損狀態機不一致: {a} vs {b}")
+    print(f"✅ 比對通過 ({n} 根K線，numba={'是' if NUMBA_AVAILABLE else '否'})")
+
+
+def _benchmark(years=3):
+    n = years * 365 * 24 * 60
+    high, low, close = _random_walk(n, seed=11)
+    wilder_adx(high[:1000], low[:1000], close[:1000])  # 觸發 JIT 編譯
+
+    def timed(func, *args):
+        started = time.perf_counter()
+        func(*args)
+        return time.perf_counter() - started
+
+    pandas_seconds = timed(_adx_pandas, high, low, close)
+    kernel_seconds = timed(wilder_adx, high, low, close)
+    print(
+        f"ADX ({years} 年 1 分鐘資料, {n} 根): pandas {pandas_seconds:.3f}s | "
+        f"kernel {kernel_seconds:.3f}s | 加速 {pandas_seconds / kernel_seconds:.1f}x"
+    )
+
+    # 逐筆 Python 迴圈 (與實盤相同的逐分鐘判斷) vs 核心：移動停損不觸發的最壞情況
+    params = (0.01, 0.005, 0.5)
+    python_seconds = timed(_trail_path_loop, high, low, close, 1, close[0] * 10, *params, math.nan, math.nan, False)
+    kernel_seconds = timed(trail_path, high, low, close, "long", close[0] * 10, *params)
+    print(
+        f"移動停損路徑 ({n} 根): Python 迴圈 {python_seconds:.3f}s | "
+        f"kernel {kernel_seconds:.4f}s | 加速 {python_seconds / kernel_seconds:.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    _check_parity()
+    _benchmark()
@@ -0,0 +1,220 @@
+"""
+👑 主備 (active/standby) 領導租約
+- 兩個實例共用同一組狀態檔，只有持有租約的主節點可以下單與寫入狀態
+- 租約有效期 ttl 秒，由背景執行緒每隔幾秒續約 (主迴圈在下單等待或重試中阻塞時也不會過期)；
+  主節點停止續約後，備援節點在租約到期時接手
+- 本地判斷主節點身分時以「送出續約請求前」的單調時鐘計算到期時間，並預留安全邊際：
+  舊主節點一定比其他實例能取得租約更早認定自己失去租約；每次送出訂單前都檢查 is_leader，
+  因此不會出現兩個主節點同時下單
+- 每次換手 epoch 加一 (fencing token)，可附在日誌/訂單中辨識是哪一任主節點
+- 儲存後端可替換：FileLeaseBackend (共用檔案系統) / MemoryLeaseBackend (單一行程內的替身，供本地測試)
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger("autotrader.lease")
+
+MUTEX_STALE_SECONDS = 10  # 互斥檔超過此秒數視為持有者已崩潰
+
+
+class LeaseBackend(ABC):
+    """
+    租約儲存後端介面
+    compare_and_set(owner, ttl, now): 租約無人持有、已到期或由 owner 持有時寫入 owner 並回傳租約紀錄，
+    否則回傳目前持有者的紀錄 (呼叫端比對 owner 判斷是否取得)
+    """
+
+    @abstractmethod
+    def compare_and_set(self, owner, ttl, now):
+        ...
+
+    @abstractmethod
+    def release(self, owner):
+        ...
+
+    @abstractmethod
+    def read(self):
+        ...
+
+
+def _next_record(current, owner, ttl, now):
+    """依目前紀錄決定新紀錄；無法取得時回傳 None"""
+    if current and current.get("owner") != owner and current.get("expires_at", 0) > now:
+        return None
+    epoch = (current or {}).get("epoch", 0)
+    if not current or current.get("owner") != owner:
+        epoch += 1  # 換手
+    return {"owner": owner, "expires_at": now + ttl, "epoch": epoch}
+
+
+class MemoryLeaseBackend(LeaseBackend):
+    """行程內的租約 (本地測試或單機多執行緒使用)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._record = None
+
+    def compare_and_set(self, owner, ttl, now):
+        with self._lock:
+            record = _next_record(self._record, owner, ttl, now)
+            if record is None:
+                return dict(self._record)
+            self._record = record
+            return dict(record)
+
+    def release(self, owner):
+        with self._lock:
+            if self._record and self._record.get("owner") == owner:
+                self._record = dict(self._record, expires_at=0)
+
+    def read(self):
+        with self._lock:
+            return dict(self._record) if self._record else None
+
+
+class FileLeaseBackend(LeaseBackend):
+    """
+    以檔案保存租約 (兩個實例需共用同一個檔案系統，且系統時鐘同步)
+    讀取-比對-寫入期間以 O_EXCL 建立的互斥檔保護，租約本身寫入暫存檔後替換
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.mutex_path = path + ".mutex"
+
+    def _acquire_mutex(self, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fd = os.open(self.mutex_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.close(fd)
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.mutex_path) > MUTEX_STALE_SECONDS:
+                        os.remove(self.mutex_path)
+                        continue
+                except OSError:
+                    continue
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.01)
+
+    def _release_mutex(self):
+        try:
+            os.remove(self.mutex_path)
+        except OSError:
+            pass
+
+    def read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, record):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, self.path)
+
+    def compare_and_set(self, owner, ttl, now):
+        if not self._acquire_mutex():
+            raise TimeoutError(f"無法取得租約互斥檔: {self.mutex_path}")
+        try:
+            current = self.read()
+            record = _next_record(current, owner, ttl, now)
+            if record is None:
+                return current
+            self._write(record)
+            return record
+        finally:
+            self._release_mutex()
+
+    def release(self, owner):
+        if not self._acquire_mutex():
+            return
+        try:
+            current = self.read()
+            if current and current.get("owner") == owner:
+                self._write(dict(current, expires_at=0))
+        finally:
+            self._release_mutex()
+
+
+class LeaderLease:
+    def __init__(self, backend, owner, ttl=10.0, safety_margin=2.0, clock=time.time, monotonic=time.monotonic):
+        """
+        owner: 實例識別 (主機名稱-PID 等)
+        ttl: 租約有效秒數；續約間隔應明顯小於 ttl - safety_margin
+        safety_margin: 本地提前認定租約失效的秒數 (吸收兩台主機的時鐘誤差)
+        """
+        self.backend = backend
+        self.owner = owner
+        self.ttl = ttl
+        self.safety_margin = safety_margin
+        self.clock = clock
+        self.monotonic = monotonic
+        self.epoch = None
+        self.holder = None  # 最後一次看到的持有者
+        self._valid_until = 0.0  # 本地單調時鐘：在此之前可視為主節點
+        self._lock = threading.Lock()  # 背景續約與主執行緒的 try_acquire 不可交錯
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_leader(self):
+        return self.monotonic() < self._valid_until
+
+    def try_acquire(self):
+        """取得或續約租約，回傳目前是否為主節點 (後端錯誤時維持既有的本地期限，不延長)"""
+        with self._lock:
+            started = self.monotonic()
+            try:
+                record = self.backend.compare_and_set(self.owner, self.ttl, self.clock())
+            except Exception as e:
+                logger.warning(f"⚠️ 租約續約失敗: {e}", extra={"sample_key": "lease_error"})
+                return self.is_leader
+
+            self.holder = record.get("owner") if record else None
+            if self.holder == self.owner:
+                self.epoch = record.get("epoch")
+                self._valid_until = started + self.ttl - self.safety_margin
+            else:
+                self._valid_until = 0.0
+            return self.is_leader
+
+    def start(self, interval):
+        """啟動背景執行緒，每 interval 秒續約 (主節點) 或搶租約 (備援節點)"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._renew_loop, args=(interval,), name="lease-renewal", daemon=True)
+        self._thread.start()
+
+    def _renew_loop(self, interval):
+        while not self._stop.wait(interval):
+            self.try_acquire()
+
+    def stop(self):
+        """停止背景續約 (租約會在 ttl 後自然到期)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def release(self):
+        """主動釋放租約 (正常結束時讓備援節點立即接手)"""
+        self.stop()
+        with self._lock:
+            self._valid_until = 0.0
+        try:
+            self.backend.release(self.owner)
+        except Exception as e:
+            logger.warning(f"⚠️ 釋放租約失敗: {e}")
@@ -0,0 +1,150 @@
+"""
+📝 結構化非同步日誌設定
+- 交易執行緒只把記錄放進佇列 (QueueHandler)，實際 I/O 由背景執行緒 (QueueListener) 處理
+- 檔案輸出為 JSON 格式並自動輪替，主控台輸出維持易讀格式 (可切換為 JSON 以利 Render 收集)
+- 重複性訊息 (例如峰值更新) 可透過 sample_key 取樣，避免日誌洪水
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from datetime import datetime, timezone
+
+# 標準 LogRecord 內建欄位，輸出 JSON 時不重複列出
+_RESERVED_ATTRS = set(
+    vars(logging.LogRecord("", logging.INFO, "", 0, "", (), None)).keys()
+) | {"message", "asctime"}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """將日誌記錄輸出為單行 JSON"""
+
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        # extra={"fields": {...}} 傳入的結構化欄位
+        fields = getattr(record, "fields", None)
+        if isinstance(fields, dict):
+            payload.update(fields)
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and key not in ("fields", "sample_key"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """對帶有 sample_key 的重複訊息做取樣：同一個 key 每 interval 秒最多輸出一次"""
+
+    def __init__(self, interval_seconds=60):
+        super().__init__()
+        self.interval_seconds = interval_seconds
+        self._last_emit = {}
+        self._suppressed = {}
+
+    def filter(self, record):
+        key = getattr(record, "sample_key", None)
+        if key is None or self.interval_seconds <= 0:
+            return True
+
+        now = time.monotonic()
+        last = self._last_emit.get(key)
+        if last is not None and now - last < self.interval_seconds:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return False
+
+        self._last_emit[key] = now
+        suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+def setup_logging(
+    name="autotrader",
+    level="INFO",
+    log_file=None,
+    max_bytes=5 * 1024 * 1024,
+    backup_count=5,
+    json_console=False,
+    sample_seconds=60,
+):
+    """
+    建立非同步日誌管線並回傳 logger。
+    重複呼叫時直接回傳已設定好的 logger。
+    """
+    global _listener
+
+    logger = logging.getLogger(name)
+    if _listener is not None:
+        return logger
+
+    console_handler = logging.StreamHandler()
+    if json_console:
+        console_handler.setFormatter(JsonFormatter())
+    else:
+        console_handler.setFormatter(
+            logging.Formatter("%(asctime)s %(message)s", datefmt="%H:%M:%S")
+        )
+    handlers = [console_handler]
+
+    if log_file:
+        log_dir = os.path.dirname(log_file)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        )
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # 取樣在交易執行緒完成，被丟棄的記錄不會進入佇列
+    queue_handler.addFilter(SamplingFilter(sample_seconds))
+
+    logger.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return logger
+
+
+def ensure_listener():
+    """
+    fork 產生的子行程只繼承佇列與 handler，沒有背景執行緒；以同一組 handler 重新啟動
+    (子行程結束前需呼叫 shutdown_logging 寫出剩餘日誌)
+    """
+    global _listener
+    if _listener is None:
+        return
+    thread = getattr(_listener, "_thread", None)
+    if thread is None or not thread.is_alive():
+        _listener = logging.handlers.QueueListener(
+            _listener.queue, *_listener.handlers, respect_handler_level=True
+        )
+        _listener.start()
+
+
+def shutdown_logging():
+    """停止背景執行緒並寫出佇列中剩餘的日誌"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,221 @@
+"""
+📦 精簡資料結構
+- Bar: 單根 K 線與指標 (__slots__，屬性存取取代 pandas Series 標籤查詢)
+- PositionState: 策略持倉與移動停損狀態，序列化只需 to_dict/from_dict
+- BarBuffer: 以欄位陣列 (numpy) 保存 K 線，取單根 K 線不需建立 Series
+"""
+
+import math
+from datetime import datetime, timezone
+
+import numpy as np
+
+# K 線與指標欄位 (順序即 BarBuffer 的欄位順序)
+BAR_FIELDS = (
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "ema90",
+    "ema200",
+    "adx",
+    "plus_di",
+    "minus_di",
+    "atr",
+    "rsi",
+    "macd",
+    "macd_signal",
+    "macd_histogram",
+)
+
+# 處理 K 線前必須具備的指標
+REQUIRED_INDICATORS = ("ema90", "ema200", "adx")
+
+
+def _ms_to_datetime(ms):
+    """毫秒時間戳 → 不含時區的 UTC datetime (與 K 線 DataFrame 的索引一致)"""
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).replace(tzinfo=None)
+
+
+class Bar:
+    """單根 K 線 (含指標)，缺少的數值以 NaN 表示"""
+
+    __slots__ = ("time",) + BAR_FIELDS
+
+    def __init__(self, time, **values):
+        self.time = time
+        for field in BAR_FIELDS:
+            setattr(self, field, float(values.get(field, math.nan)))
+
+    @classmethod
+    def from_ohlcv(cls, row):
+        """由 ccxt fetch_ohlcv 的一列 [毫秒時間, open, high, low, close, volume] 建立"""
+        return cls(
+            _ms_to_datetime(row[0]),
+            open=row[1],
+            high=row[2],
+            low=row[3],
+            close=row[4],
+            volume=row[5],
+        )
+
+    @classmethod
+    def from_series(cls, row):
+        """由 DataFrame 的一列 (pandas Series，索引為時間) 建立"""
+        return cls(row.name, **{f: row[f] for f in BAR_FIELDS if f in row.index})
+
+    def has_indicators(self):
+        """進場判斷所需的指標是否都已計算出來"""
+        return not any(math.isnan(getattr(self, f)) for f in REQUIRED_INDICATORS)
+
+    def to_dict(self):
+        return {"time": self.time, **{f: getattr(self, f) for f in BAR_FIELDS}}
+
+    def __repr__(self):
+        return f"Bar(time={self.time}, close={self.close})"
+
+
+class PositionState:
+    """策略持倉、移動停損與資金狀態 (對應 strategy_state.json 的欄位)"""
+
+    __slots__ = (
+        "position_size",
+        "entry_price",
+        "long_entry_price",
+        "long_peak",
+        "long_trail_stop_price",
+        "is_long_trail_active",
+        "short_entry_price",
+        "short_trough",
+        "short_trail_stop_price",
+        "is_short_trail_active",
+        "peak_capital",
+        "max_drawdown",
+        "current_capital",
+        "equity",
+    )
+
+    # 各欄位預設值
+    DEFAULTS = {
+        "position_size": 0,
+        "entry_price": 0,
+        "long_entry_price": None,
+        "long_peak": None,
+        "long_trail_stop_price": None,
+        "is_long_trail_active": False,
+        "short_entry_price": None,
+        "short_trough": None,
+        "short_trail_stop_price": None,
+        "is_short_trail_active": False,
+        "peak_capital": None,
+        "max_drawdown": 0.0,
+        "current_capital": 0,  # 可用資金 (未使用資金，部位大小以此計算)
+        "equity": None,  # 權益 (錢包餘額 + 未實現盈虧)，由風控引擎每根K線更新
+    }
+
+    def __init__(self, **values):
+        for field in self.__slots__:
+            setattr(self, field, values.get(field, self.DEFAULTS[field]))
+
+    def reset_long(self):
+        """清空多單進場與移動停損狀態"""
+        self.long_entry_price = None
+        self.long_peak = None
+        self.long_trail_stop_price = None
+        self.is_long_trail_active = False
+
+    def reset_short(self):
+        """清空空單進場與移動停損狀態"""
+        self.short_entry_price = None
+        self.short_trough = None
+        self.short_trail_stop_price = None
+        self.is_short_trail_active = False
+
+    def reset_position(self):
+        """平倉後清空所有持倉相關欄位 (保留資金與回撤紀錄)"""
+        self.position_size = 0
+        self.entry_price = 0
+        self.reset_long()
+        self.reset_short()
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        """由 JSON 狀態建立，忽略未知欄位，缺少的欄位使用預設值"""
+        return cls(**{k: v for k, v in data.items() if k in cls.DEFAULTS})
+
+
+class BarBuffer:
+    """
+    欄位陣列式的 K 線緩衝區 (固定容量)。
+    每個欄位是一個 float64 陣列，時間以毫秒整數保存；容量滿時丟棄最舊的 K 線。
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.length = 0
+        self.times = np.zeros(capacity, dtype=np.int64)
+        self.columns = {f: np.full(capacity, np.nan) for f in BAR_FIELDS}
+
+    @classmethod
+    def from_frame(cls, df, capacity=None):
+        """由以時間為索引的 K 線 DataFrame 建立 (每個欄位只轉換一次，不逐列建立 Series)"""
+        n = len(df)
+        buffer = cls(max(capacity or n, n, 1))
+        buffer.times[:n] = df.index.values.astype("datetime64[ms]").astype(np.int64)
+        for field in BAR_FIELDS:
+            if field in df.columns:
+                buffer.columns[field][:n] = df[field].to_numpy(dtype=np.float64)
+        buffer.length = n
+        return buffer
+
+    def __len__(self):
+        return self.length
+
+    def clear(self):
+        """清空資料但保留已配置的陣列 (不重新配置記憶體)"""
+        self.length = 0
+        for column in self.columns.values():
+            column.fill(np.nan)
+
+    def append(self, time_ms, **values):
+        """追加一根 K 線；容量已滿時整體左移一格"""
+        if self.length == self.capacity:
+            self.times[:-1] = self.times[1:]
+            for column in self.columns.values():
+                column[:-1] = column[1:]
+            index = self.capacity - 1
+        else:
+            index = self.length
+            self.length += 1
+        self.times[index] = time_ms
+        for field, column in self.columns.items():
+            column[index] = values.get(field, np.nan)
+
+    def column(self, field):
+        """回傳欄位的有效資料 (陣列 view，不複製)"""
+        return self.columns[field][: self.length]
+
+    def set_column(self, field, values):
+        """將計算結果寫入既有欄位陣列 (原地複製，不建立新陣列)"""
+        self.columns[field][: self.length] = values
+
+    def time_at(self, index):
+        if index < 0:
+            index += self.length
+        return _ms_to_datetime(int(self.times[index]))
+
+    def bar(self, index):
+        """取得第 index 根 K 線 (支援負索引)"""
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("BarBuffer index out of range")
+        bar = Bar.__new__(Bar)
+        bar.time = _ms_to_datetime(int(self.times[index]))
+        for field, column in self.columns.items():
+            setattr(bar, field, float(column[index]))
+        return bar
@@ -0,0 +1,195 @@
+"""
+🎲 蒙地卡羅穩健性分析
+- 交易序列：以回測的每筆交易報酬率 (pnl / 進場時權益) 重新抽樣
+  - bootstrap: 放回抽樣，同樣筆數
+  - permute: 只打亂順序 (總報酬不變，檢驗回撤對交易順序的敏感度)
+  每一批模擬是一個 (模擬數, 交易數) 矩陣，權益曲線與最大回撤以 cumprod / maximum.accumulate 一次算完
+- 價格路徑：以區塊自助法 (block bootstrap) 重組 4 小時K線報酬，產生新的價格路徑後重新回測
+- 大量模擬時切成多批分配到多個行程 (每批使用獨立的亂數種子)，結果與批次切法無關
+- 每組參數輸出報酬與最大回撤的分位數、虧損機率
+
+用法: python monte_carlo.py <4小時K線CSV> [模擬次數]
+"""
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+METHODS = ("bootstrap", "permute")
+DEFAULT_SIMULATIONS = 5000
+BATCH_SIZE = 1000  # 每批模擬數 (控制單批矩陣大小)
+PARALLEL_MIN_CELLS = 5_000_000  # 模擬數 × 交易數超過此值才使用多行程
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def trade_returns(result):
+    """回測結果 → 每筆交易報酬率 (pnl / 進場時的已實現權益)"""
+    pnl = np.array([t["pnl"] for t in result.trades], dtype=np.float64)
+    capital_before = result.initial_capital + np.concatenate([[0.0], np.cumsum(pnl)[:-1]])
+    return pnl / capital_before
+
+
+def _simulate_batch(returns, method, size, seed):
+    """一批模擬：回傳 (總報酬率, 最大回撤) 兩個長度為 size 的陣列"""
+    rng = np.random.default_rng(seed)
+    n = returns.shape[0]
+    if method == "bootstrap":
+        samples = returns[rng.integers(0, n, size=(size, n))]
+    else:
+        samples = returns[np.argsort(rng.random((size, n)), axis=1)]
+    equity = np.cumprod(1 + samples, axis=1)
+    peaks = np.maximum.accumulate(np.maximum(equity, 1.0), axis=1)  # 起始權益 1.0 也算峰值
+    drawdowns = np.max(1 - equity / peaks, axis=1)
+    return equity[:, -1] - 1, np.maximum(drawdowns, 0.0)
+
+
+def _batches(simulations, seed):
+    sizes = [BATCH_SIZE] * (simulations // BATCH_SIZE)
+    if simulations % BATCH_SIZE:
+        sizes.append(simulations % BATCH_SIZE)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    return sizes, seeds
+
+
+class MonteCarloResult:
+    __slots__ = ("method", "returns", "max_drawdowns", "params")
+
+    def __init__(self, method, returns, max_drawdowns, params=None):
+        self.method = method
+        self.returns = returns  # 每次模擬的總報酬率
+        self.max_drawdowns = max_drawdowns  # 每次模擬的最大回撤
+        self.params = params
+
+    @property
+    def loss_probability(self):
+        return float(np.mean(self.returns < 0)) if len(self.returns) else 0.0
+
+    def drawdown_exceed_probability(self, level):
+        """最大回撤超過 level 的機率"""
+        return float(np.mean(self.max_drawdowns > level)) if len(self.max_drawdowns) else 0.0
+
+    def summary(self):
+        r = np.percentile(self.returns, PERCENTILES) if len(self.returns) else [0.0] * len(PERCENTILES)
+        d = np.percentile(self.max_drawdowns, PERCENTILES) if len(self.max_drawdowns) else [0.0] * len(PERCENTILES)
+        summary = {"方法": self.method, "模擬次數": len(self.returns)}
+        summary.update({f"報酬率P{q}": f"{v * 100:.2f}%" for q, v in zip(PERCENTILES, r)})
+        summary.update({f"最大回撤P{q}": f"{v * 100:.2f}%" for q, v in zip(PERCENTILES, d)})
+        summary["虧損機率"] = f"{self.loss_probability * 100:.2f}%"
+        return summary
+
+
+def simulate_trades(result, simulations=DEFAULT_SIMULATIONS, method="bootstrap", seed=0, workers=None):
+    """
+    對單一回測結果的交易序列做蒙地卡羅模擬
+    workers: 行程數；None 時依計算量自動決定 (小量直接在本行程計算，避免行程啟動成本)
+    """
+    if method not in METHODS:
+        raise ValueError(f"未知的模擬方法: {method}")
+    returns = trade_returns(result)
+    if len(returns) == 0:
+        return MonteCarloResult(method, np.zeros(0), np.zeros(0), result.params)
+
+    sizes, seeds = _batches(simulations, seed)
+    if workers is None:
+        workers = os.cpu_count() if simulations * len(returns) >= PARALLEL_MIN_CELLS else 1
+    if workers > 1 and len(sizes) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_simulate_batch, [returns] * len(sizes), [method] * len(sizes), sizes, seeds))
+    else:
+        parts = [_simulate_batch(returns, method, size, s) for size, s in zip(sizes, seeds)]
+    return MonteCarloResult(
+        method,
+        np.concatenate([p[0] for p in parts]),
+        np.concatenate([p[1] for p in parts]),
+        result.params,
+    )
+
+
+def analyze_sweep(results, simulations=DEFAULT_SIMULATIONS, method="bootstrap", seed=0, workers=None):
+    """
+    對參數掃描的每個候選結果做模擬 (run_sweep 的回傳值)，回傳 MonteCarloResult 列表
+    候選之間以多行程並行，每個候選內部為向量化批次
+    """
+    workers = workers or os.cpu_count()
+    if workers <= 1 or len(results) <= 1:
+        return [simulate_trades(r, simulations, method, seed, workers=1) for r in results]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(simulate_trades, r, simulations, method, seed, 1) for r in results
+        ]
+        return [f.result() for f in futures]
+
+
+# --- 價格路徑 ---
+def block_bootstrap_paths(df, paths, block=30, seed=0):
+    """
+    以區塊自助法重組 K 線：每根K線以 (開/高/低/收 相對前收盤的對數報酬) 表示，
+    隨機抽取長度為 block 的連續區段拼接，保留區段內的波動聚集
+    回傳 DataFrame 產生器 (索引與原資料相同)
+    """
+    import pandas as pd
+
+    close = df["close"].to_numpy(dtype=np.float64)
+    prev_close = np.concatenate([[close[0]], close[:-1]])
+    relative = np.log(df[["open", "high", "low", "close"]].to_numpy(dtype=np.float64) / prev_close[:, None])
+    n = len(df)
+    rng = np.random.default_rng(seed)
+    for _ in range(paths):
+        starts = rng.integers(0, max(1, n - block), size=-(-n // block))
+        index = (starts[:, None] + np.arange(block)).ravel()[:n]
+        index = np.minimum(index, n - 1)
+        sampled = relative[index]
+        closes = close[0] * np.exp(np.cumsum(sampled[:, 3]))
+        prev = np.concatenate([[close[0]], closes[:-1]])
+        ohlc = np.exp(sampled) * prev[:, None]
+        yield pd.DataFrame(
+            {
+                "open": ohlc[:, 0],
+                "high": np.max(ohlc, axis=1),
+                "low": np.min(ohlc, axis=1),
+                "close": ohlc[:, 3],
+                "volume": df["volume"].to_numpy(),
+            },
+            index=df.index,
+        )
+
+
+def _backtest_path(path, params):
+    from backtest import run_backtest
+
+    result = run_backtest(path, params)
+    return result.total_pnl / result.initial_capital, result.max_drawdown
+
+
+def simulate_price_paths(df, params=None, paths=200, block=30, seed=0, workers=None):
+    """以重組的價格路徑重新回測 (指標與信號都重新計算)，回傳 MonteCarloResult"""
+    generator = block_bootstrap_paths(df, paths, block, seed)
+    workers = workers or os.cpu_count()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            outcomes = list(pool.map(_backtest_path, generator, [params] * paths, chunksize=8))
+    else:
+        outcomes = [_backtest_path(path, params) for path in generator]
+    outcomes = np.array(outcomes, dtype=np.float64).reshape(-1, 2)
+    return MonteCarloResult("block_bootstrap", outcomes[:, 0], outcomes[:, 1], params)
+
+
+if __name__ == "__main__":
+    import time
+
+    from backtest import load_klines_csv, run_backtest
+
+    if len(sys.argv) < 2:
+        print("用法: python monte_carlo.py <4小時K線CSV> [模擬次數]")
+        sys.exit(1)
+    simulations = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_SIMULATIONS
+    df = load_klines_csv(sys.argv[1])
+    result = run_backtest(df)
+    for method in METHODS:
+        started = time.perf_counter()
+        mc = simulate_trades(result, simulations, method)
+        print(f"--- {method} ({time.perf_counter() - started:.2f} 秒) ---")
+        for key, value in mc.summary().items():
+            print(f"{key}: {value}")
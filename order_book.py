@@ -0,0 +1,147 @@
+"""
+📚 本地 L2 訂單簿快取
+- 以 REST 快照 (fetch_order_book) 整份取代，買賣兩側各以排序陣列保存 (價格由優到劣)；
+  實盤只在下單流程中查詢，短時間內重複使用同一份快照，不訂閱增量推送
+- 累積數量/累積金額在變動後第一次查詢時重建一次，之後的查詢都是二分搜尋 O(log n)
+- 提供預期成交均價、指定價格內的深度，以及在滑價預算內可下單的最大數量
+"""
+
+import time
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+
+class _BookSide:
+    """單側訂單簿：keys 為遞增排序的排序鍵 (賣方 = 價格，買方 = -價格)，最優價在最前面"""
+
+    __slots__ = ("sign", "keys", "sizes", "_cum_qty", "_cum_notional")
+
+    def __init__(self, sign):
+        self.sign = sign  # 賣方 1，買方 -1
+        self.keys = []
+        self.sizes = []
+        self._cum_qty = None
+        self._cum_notional = None
+
+    def load(self, levels):
+        levels = sorted((self.sign * float(p), float(q)) for p, q, *_ in levels if float(q) > 0)
+        self.keys = [k for k, _ in levels]
+        self.sizes = [q for _, q in levels]
+        self._cum_qty = None
+
+    def price(self, i):
+        return self.sign * self.keys[i]
+
+    @property
+    def best(self):
+        return self.price(0) if self.keys else None
+
+    def _prefix(self):
+        if self._cum_qty is None:
+            self._cum_qty = list(accumulate(self.sizes))
+            self._cum_notional = list(
+                accumulate(self.sign * k * q for k, q in zip(self.keys, self.sizes))
+            )
+        return self._cum_qty, self._cum_notional
+
+    def fill_price(self, qty):
+        """吃掉 qty 數量的成交均價；深度不足時回傳 None"""
+        if qty <= 0 or not self.keys:
+            return None
+        cum_qty, cum_notional = self._prefix()
+        i = bisect_left(cum_qty, qty)
+        if i >= len(cum_qty):
+            return None
+        prev_qty = cum_qty[i - 1] if i else 0.0
+        prev_notional = cum_notional[i - 1] if i else 0.0
+        return (prev_notional + (qty - prev_qty) * self.price(i)) / qty
+
+    def depth(self, limit_price):
+        """價格不劣於 limit_price 的總數量"""
+        if not self.keys:
+            return 0.0
+        cum_qty, _ = self._prefix()
+        i = bisect_right(self.keys, self.sign * limit_price)
+        return cum_qty[i - 1] if i else 0.0
+
+
+class OrderBook:
+    def __init__(self):
+        self.bids = _BookSide(-1)
+        self.asks = _BookSide(1)
+        self.seq = None  # 最後一份快照的序號 (nonce)
+        self.updated_at = 0.0
+
+    def apply_snapshot(self, bids, asks, seq=None):
+        """整份快照取代目前內容；bids/asks 為 [[價格, 數量], ...]"""
+        self.bids.load(bids)
+        self.asks.load(asks)
+        self.seq = seq
+        self.updated_at = time.time()
+
+    def _side(self, side):
+        """下單方向 → 要吃的那一側 (買單吃賣方，賣單吃買方)"""
+        return self.asks if side == "buy" else self.bids
+
+    @property
+    def best_bid(self):
+        return self.bids.best
+
+    @property
+    def best_ask(self):
+        return self.asks.best
+
+    @property
+    def mid(self):
+        if self.best_bid is None or self.best_ask is None:
+            return None
+        return (self.best_bid + self.best_ask) / 2
+
+    @property
+    def age(self):
+        return time.time() - self.updated_at
+
+    def expected_fill_price(self, side, qty):
+        """市價單 side/qty 的預期成交均價；深度不足時回傳 None"""
+        return self._side(side).fill_price(qty)
+
+    def depth(self, side, limit_price):
+        """市價單 side 在 limit_price 以內可成交的數量"""
+        return self._side(side).depth(limit_price)
+
+    def max_qty_within_slippage(self, side, max_slippage_bps, reference_price=None):
+        """
+        在滑價預算內可成交的最大數量 (以最差成交價相對參考價計算，較均價保守)
+        reference_price: 預設為中間價
+        """
+        reference = reference_price or self.mid
+        if reference is None:
+            return 0.0
+        direction = 1 if side == "buy" else -1
+        limit_price = reference * (1 + direction * max_slippage_bps / 10000)
+        return self.depth(side, limit_price)
+
+
+class OrderBookCache:
+    """以 REST 快照維護的訂單簿，在 max_age 秒內重複使用，避免同一次下單流程重複請求"""
+
+    def __init__(self, exchange, symbol, depth=50, max_age_seconds=2.0):
+        self.exchange = exchange
+        self.symbol = symbol
+        self.depth = depth
+        self.max_age_seconds = max_age_seconds
+        self.book = OrderBook()
+
+    def refresh(self):
+        data = self.exchange.fetch_order_book(
+            self.symbol, limit=self.depth, params={"category": "linear"}
+        )
+        self.book.apply_snapshot(data.get("bids", []), data.get("asks", []), data.get("nonce"))
+        return self.book
+
+    def get(self, max_age=None):
+        """回傳訂單簿，超過 max_age 秒才重新請求"""
+        max_age = self.max_age_seconds if max_age is None else max_age
+        if self.book.updated_at == 0 or self.book.age > max_age:
+            return self.refresh()
+        return self.book
@@ -0,0 +1,113 @@
+"""
+🧾 訂單冪等與 client order id 追蹤
+- 每筆邏輯訂單在送出前產生唯一的 orderLinkId，所有重試 (含備援下單方法) 都沿用同一個 id，
+  Bybit 會拒絕重複的 orderLinkId，因此逾時後重試不會重複進場
+- 本地待確認訂單表以 orderLinkId 為鍵 (dict，O(1) 查詢)，每次狀態變更即寫入檔案，
+  重啟後仍可得知哪些訂單結果未知，只對這些訂單向交易所查詢
+"""
+
+import itertools
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger("autotrader.orders")
+
+# Bybit orderLinkId 最長 36 字元
+MAX_CLIENT_ORDER_ID_LENGTH = 36
+
+# 訂單狀態
+PENDING = "pending"  # 已送出，尚未確認
+FILLED = "filled"
+FAILED = "failed"  # 確認未送達交易所或被拒絕，可安全放棄
+CANCELLED = "cancelled"  # 已送達但未成交即撤銷
+UNKNOWN = "unknown"  # 結果不明 (例如逾時且查詢不到)
+
+_counter = itertools.count()
+
+
+class OrderOutcomeUnknown(Exception):
+    """訂單可能已送達交易所，但查詢不到結果 (需保留為 unknown 待之後確認)"""
+
+
+def new_client_order_id(prefix="eth"):
+    """產生唯一的 orderLinkId：前綴-毫秒時間戳-行程內序號"""
+    link_id = f"{prefix}-{int(time.time() * 1000)}-{next(_counter) % 100000}"
+    return link_id[:MAX_CLIENT_ORDER_ID_LENGTH]
+
+
+class PendingOrderTable:
+    def __init__(self, path=None, max_resolved=200):
+        """
+        path: 保存檔案路徑 (None 時只保存在記憶體)
+        max_resolved: 已完成訂單最多保留筆數，超過時移除最舊的
+        """
+        self.path = path
+        self.max_resolved = max_resolved
+        self._orders = {}  # orderLinkId → 訂單紀錄 (dict 保持插入順序)
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._orders = {o["link_id"]: o for o in json.load(f)}
+        except (OSError, ValueError, KeyError):
+            self._orders = {}
+
+    def _save(self):
+        """寫入暫存檔後替換，避免寫到一半崩潰留下損毀的檔案"""
+        if not self.path:
+            return False
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(list(self._orders.values()), f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            return True
+        except (OSError, TypeError, ValueError) as e:
+            logger.error(f"❌ 寫入待確認訂單表失敗: {e}", extra={"sample_key": "pending_orders_save"})
+            return False
+
+    def _prune(self):
+        resolved = [k for k, o in self._orders.items() if o["status"] in (FILLED, FAILED, CANCELLED)]
+        for link_id in resolved[: max(0, len(resolved) - self.max_resolved)]:
+            del self._orders[link_id]
+
+    def add(self, link_id, side, qty, **fields):
+        """送出訂單前登記 (必須在送出前寫入，崩潰後才知道訂單可能已送達)"""
+        self._orders[link_id] = {
+            "link_id": link_id,
+            "side": side,
+            "qty": qty,
+            "status": PENDING,
+            "order_id": None,
+            "created": time.time(),
+            **fields,
+        }
+        self._prune()
+        self._save()
+        return self._orders[link_id]
+
+    def mark(self, link_id, status, **fields):
+        order = self._orders.get(link_id)
+        if order is None:
+            return None
+        order.update(fields, status=status, updated=time.time())
+        self._save()
+        return order
+
+    def get(self, link_id):
+        return self._orders.get(link_id)
+
+    def unresolved(self):
+        """結果未確認的訂單 (pending / unknown)"""
+        return [o for o in self._orders.values() if o["status"] in (PENDING, UNKNOWN)]
+
+    def __contains__(self, link_id):
+        return link_id in self._orders
+
+    def __len__(self):
+        return len(self._orders)
@@ -0,0 +1,422 @@
+"""
+🚀 多行程管線：行情 / 策略 / 下單分離
+- 資料行程：輪詢 1 分鐘 K 線 (LiveBarFeed) 與報價，把最新價格與 4 小時收盤 (含指標)
+  發布到共享記憶體環形緩衝區；REST 請求的阻塞不再與停損判斷串在同一個執行緒
+- 策略行程：每個參數變體一個行程，各自以游標讀取同一個緩衝區，
+  以與實盤相同的停損/進場規則 (ShadowVariant，模擬帳戶) 判斷，持倉變化時送出下單意圖 (只記錄，不下單)
+- 下單行程：唯一持有交易所連線與策略狀態的行程；--live 時也直接讀取緩衝區，
+  以 TradingStrategy 依實際持倉與狀態執行收盤判斷 (process_bar) 與每分鐘移動停損檢查，
+  與主程式的實盤流程相同 (模擬帳戶與實際帳戶可能不同步，因此實盤不依賴策略行程的意圖)
+- 每筆意圖記錄各階段時間：行情收到 → 發布 → 策略判斷 → 下單行程收到 → 下單完成
+- 讀取者從緩衝區第一筆事件開始讀，不必等游標建立；資料行程結束 (含異常終止) 後讀取者讀完剩餘事件即結束
+
+用法: python pipeline.py [--live] [--variants shadow_variants.json]
+      python pipeline.py --benchmark [秒數]   (合成行情，量測管線本身的延遲)
+"""
+
+import json
+import math
+import multiprocessing as mp
+import queue
+import random
+import signal
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+import eth_strategy_4h_autotrading as live
+from logging_config import ensure_listener, shutdown_logging
+from models import BAR_FIELDS, Bar
+from shadow import ShadowBook, ShadowVariant
+from shm_ring import EVENT_BAR_CLOSE, EVENT_STOP, EVENT_TICK, RingReader, SharedRing
+
+logger = live.logger
+
+RING_CAPACITY = 4096  # 事件槽位數 (讀取者落後超過此數量時會遺失事件)
+TICKER_POLL_SECONDS = 5  # 資料行程以報價端點更新最新價格的間隔 (0 表示停用)
+REPORT_EVERY_INTENTS = 20  # 下單行程每處理幾筆意圖輸出一次延遲統計
+PAPER_CAPITAL = 1000.0  # 策略行程模擬帳戶的起始資金 (只用於判斷意圖，不影響實盤)
+LIVE_INTENT_POLL_SECONDS = 0.002  # 實盤模式下單行程在讀取緩衝區之間等待意圖的時間
+STAGES = (
+    ("publish", "received_ns", "published_ns"),  # 行情收到 → 寫入緩衝區
+    ("decide", "published_ns", "decided_ns"),  # 寫入緩衝區 → 策略判斷完成
+    ("dispatch", "decided_ns", "dequeued_ns"),  # 策略判斷 → 下單行程收到
+    ("execute", "dequeued_ns", "done_ns"),  # 下單行程收到 → 下單完成
+    ("total", "received_ns", "done_ns"),  # 端到端
+)
+
+
+def _init_child():
+    """
+    子行程初始化：忽略 Ctrl+C (由主行程設定 stop 後依序結束，下單行程才能回報統計)，
+    並確保日誌背景執行緒在子行程中運作
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ensure_listener()
+
+
+def _bar_ms(bar):
+    return int(bar.time.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def _event_bar(event):
+    time_ = datetime.fromtimestamp(int(event["time"]) / 1000, tz=timezone.utc).replace(tzinfo=None)
+    return Bar(time_, **{f: float(event[f]) for f in BAR_FIELDS})
+
+
+def _read_until_stop(reader, producer_done):
+    """
+    逐筆產生緩衝區事件，直到讀到 EVENT_STOP；
+    資料行程未發布 EVENT_STOP 就結束 (producer_done 已設定) 時，讀完剩餘事件後結束
+    """
+    while True:
+        if not reader.wait():
+            if producer_done.is_set() and reader.ring.head <= reader.cursor:
+                logger.warning("⚠️ 資料行程已結束但未發布停止事件，讀取者結束")
+                return
+            continue
+        for event in reader.read():
+            if int(event["kind"]) == EVENT_STOP:
+                return
+            yield event
+
+
+# --- 資料行程 ---
+def data_process(ring_name, stop, poll_seconds=live.TRADE_SLEEP_SECONDS, ticker_seconds=TICKER_POLL_SECONDS):
+    """輪詢交易所並發布事件，直到 stop 被設定"""
+    _init_child()
+    ring = SharedRing(ring_name, create=False)
+    feed = live.LiveBarFeed(indicator_state_file=live.INDICATOR_STATE_FILE)
+    scheduler = live.BarCloseScheduler()
+    scheduler.schedule(time.time())
+    last_poll_time = last_ticker_time = 0
+    published_bar = False  # 與主程式相同：啟動後先以最新收盤K線判斷一次
+    try:
+        while not stop.is_set():
+            now = time.time()
+            if now - last_poll_time >= poll_seconds or scheduler.is_due(now):
+                last_poll_time = now
+                received_ns = time.time_ns()
+                closed_times = feed.poll() if feed.ready or feed.bootstrap() else None
+                scheduler.on_poll(bool(closed_times), time.time())
+                if closed_times is not None and feed.latest_1m is not None:
+                    ring.publish(EVENT_TICK, _bar_ms(feed.latest_1m), feed.latest_1m, received_ns)
+                if closed_times or (closed_times is not None and not published_bar):
+                    published_bar = True
+                    bar = feed.latest_bar()
+                    if bar is not None:
+                        ring.publish(EVENT_BAR_CLOSE, _bar_ms(bar), bar, received_ns)
+            elif ticker_seconds and now - last_ticker_time >= ticker_seconds:
+                last_ticker_time = now
+                received_ns = time.time_ns()
+                bar = live.fetch_latest_price_bar(live.SYMBOL)
+                if bar is not None:
+                    ring.publish(EVENT_TICK, _bar_ms(bar), bar, received_ns)
+            stop.wait(min(0.2, scheduler.seconds_until_due(time.time())))
+    finally:
+        ring.publish(EVENT_STOP, 0)
+        ring.close()
+        shutdown_logging()
+
+
+def synthetic_data_process(ring_name, stop, rate=200.0, bars_every=50, seed=0):
+    """
+    基準測試用的合成行情：每秒 rate 筆報價，每 bars_every 筆發布一次 4 小時收盤
+    (指標值固定為滿足多單條件，讓策略行程持續進出場)
+    """
+    _init_child()
+    ring = SharedRing(ring_name, create=False)
+    rng = random.Random(seed)
+    price = 2000.0
+    interval = 1.0 / rate
+    count = 0
+    try:
+        next_time = time.perf_counter()
+        while not stop.is_set():
+            count += 1
+            price *= math.exp(rng.gauss(0, 0.002))
+            now_ms = int(time.time() * 1000)
+            values = {"open": price, "high": price * 1.001, "low": price * 0.999, "close": price, "volume": 1.0}
+            if count % bars_every == 0:
+                values.update(
+                    ema90=price * 0.99, ema200=price * 0.98, adx=40.0, plus_di=30.0, minus_di=10.0,
+                    atr=price * 0.01, rsi=60.0, macd=1.0, macd_signal=0.5, macd_histogram=0.5,
+                )
+                ring.publish(EVENT_BAR_CLOSE, now_ms, values)
+            else:
+                ring.publish(EVENT_TICK, now_ms, values)
+            next_time += interval
+            time.sleep(max(0.0, next_time - time.perf_counter()))
+    finally:
+        ring.publish(EVENT_STOP, 0)
+        ring.close()
+        shutdown_logging()
+
+
+# --- 策略行程 ---
+def strategy_worker(ring_name, intents, producer_done, name, params, probe_every=0):
+    """
+    讀取緩衝區事件並以 ShadowVariant (模擬帳戶) 判斷，持倉變化時送出意圖 (entry / exit)
+    probe_every: 每幾筆事件額外送出一筆探測意圖 (量測管線延遲用，0 表示停用)
+    """
+    _init_child()
+    ring = SharedRing(ring_name, create=False)
+    reader = RingReader(ring, from_start=True)
+    variant = ShadowVariant(
+        name, params, PAPER_CAPITAL, live.DEFAULT_QTY_PERCENT, live.LEVER, live.TAKER_FEE_RATE
+    )
+    book = ShadowBook([variant])
+    processed = 0
+
+    def send(action, side, event, bar):
+        intents.put(
+            {
+                "worker": name,
+                "action": action,
+                "side": side,
+                "price": bar.close,
+                "atr": bar.atr,
+                "seq": int(event["seq"]),
+                "received_ns": int(event["received_ns"]),
+                "published_ns": int(event["published_ns"]),
+                "decided_ns": time.time_ns(),
+            }
+        )
+
+    try:
+        for event in _read_until_stop(reader, producer_done):
+            kind = int(event["kind"])
+            bar = _event_bar(event)
+            before = variant.state.position_size
+            if kind == EVENT_TICK:
+                book.on_minute(bar)
+            elif kind == EVENT_BAR_CLOSE:
+                book.on_bar_close(bar)
+            after = variant.state.position_size
+            processed += 1
+
+            if before != 0 and (after == 0 or after * before < 0):
+                send("exit", "sell" if before > 0 else "buy", event, bar)
+            if after != 0 and after != before:
+                send("entry", "buy" if after > 0 else "sell", event, bar)
+            if probe_every and processed % probe_every == 0:
+                send("probe", None, event, bar)
+    finally:
+        if reader.dropped:
+            logger.warning(f"⚠️ 策略行程 {name} 遺失 {reader.dropped} 筆事件 (讀取落後)")
+        ring.close()
+        shutdown_logging()
+
+
+# --- 下單行程 ---
+class LatencyStats:
+    """各階段延遲 (毫秒) 的分位數統計，只保留最近的樣本"""
+
+    def __init__(self, max_samples=10000):
+        self.max_samples = max_samples
+        self.samples = {stage: [] for stage, _, _ in STAGES}
+        self.count = 0
+
+    def add(self, intent):
+        self.count += 1
+        for stage, start, end in STAGES:
+            values = self.samples[stage]
+            values.append((intent[end] - intent[start]) / 1e6)
+            if len(values) > self.max_samples:
+                del values[: len(values) - self.max_samples]
+
+    def summary(self):
+        result = {"intents": self.count}
+        for stage, values in self.samples.items():
+            if values:
+                p50, p99 = np.percentile(values, [50, 99])
+                result[stage] = {"p50": round(float(p50), 3), "p99": round(float(p99), 3), "max": round(max(values), 3)}
+        return result
+
+
+class LiveTrader:
+    """
+    下單行程中的實盤流程：以實際持倉與策略狀態處理緩衝區事件 (與主程式 run_live_trading 相同的判斷)
+    - 4 小時收盤：process_bar (固定停損、移動停損與進場)
+    - 1 分鐘報價：有持倉時 check_trailing_stop_only
+    - 每 RECONCILE_INTERVAL_SECONDS 與交易所對帳一次
+    """
+
+    def __init__(self, ring_name, producer_done):
+        self.strategy = live.TradingStrategy()
+        self.ring = SharedRing(ring_name, create=False)
+        self.reader = RingReader(self.ring, from_start=True)
+        self.producer_done = producer_done
+        self.last_bar_time = None
+        self.last_reconcile_time = time.time()
+        self.active = True
+
+    def poll(self, stats):
+        """處理目前已發布的事件 (不等待)；資料行程結束後回傳 False"""
+        if not self.active:
+            return False
+        producer_done = self.producer_done.is_set()  # 先讀取旗標，之後讀到的事件已包含資料行程的最後一筆
+        events = self.reader.read()
+        for event in events:
+            if int(event["kind"]) == EVENT_STOP:
+                self.active = False
+                break
+            self._handle(event, stats)
+        if producer_done and not len(events):
+            logger.warning("⚠️ 資料行程已結束但未發布停止事件，實盤處理結束")
+            self.active = False
+        if time.time() - self.last_reconcile_time >= live.RECONCILE_INTERVAL_SECONDS:
+            self.last_reconcile_time = time.time()
+            self.strategy.sync_state_with_exchange(reason="定期對帳")
+        return self.active
+
+    def _handle(self, event, stats):
+        dequeued_ns = time.time_ns()
+        bar = _event_bar(event)
+        kind = int(event["kind"])
+        try:
+            if kind == EVENT_BAR_CLOSE:
+                if self.last_bar_time is not None and bar.time <= self.last_bar_time:
+                    return
+                self.last_bar_time = bar.time
+                self.strategy.process_bar(bar)
+            elif kind == EVENT_TICK and self.strategy.state.position_size != 0:
+                self.strategy.check_trailing_stop_only(bar)
+            else:
+                return
+        except Exception as e:
+            logger.error(f"❌ 管線實盤處理失敗: {e}")
+        stats.add(
+            {
+                "received_ns": int(event["received_ns"]),
+                "published_ns": int(event["published_ns"]),
+                "decided_ns": dequeued_ns,
+                "dequeued_ns": dequeued_ns,
+                "done_ns": time.time_ns(),
+            }
+        )
+
+    def close(self):
+        self.reader = None
+        self.ring.close()
+
+
+def execution_process(intents, results, ring_name=None, producer_done=None):
+    """
+    唯一持有交易所連線的行程：記錄策略行程的意圖直到收到 None，結束時把延遲統計放入 results
+    ring_name: 提供時 (--live) 以實際持倉直接處理緩衝區事件並下單
+    """
+    _init_child()
+    trader = LiveTrader(ring_name, producer_done) if ring_name else None
+    stats = LatencyStats()
+    live_stats = LatencyStats()
+    try:
+        while True:
+            if trader is not None and trader.poll(live_stats):
+                try:
+                    intent = intents.get(timeout=LIVE_INTENT_POLL_SECONDS)
+                except queue.Empty:
+                    continue
+            else:
+                intent = intents.get()
+            if intent is None:
+                break
+            intent["dequeued_ns"] = time.time_ns()
+            if intent["action"] != "probe":
+                logger.info(
+                    f"📨 {intent['worker']}: {intent['action']} {intent['side']} @ {intent['price']:.2f}",
+                    extra={"fields": {"event": "pipeline_intent", **{k: v for k, v in intent.items() if k != "atr"}}},
+                )
+            intent["done_ns"] = time.time_ns()
+            stats.add(intent)
+            if stats.count % REPORT_EVERY_INTENTS == 0:
+                summary = stats.summary()
+                logger.info(
+                    f"⏱️ 管線延遲 (毫秒) 端到端 p50 {summary['total']['p50']} / p99 {summary['total']['p99']}",
+                    extra={"fields": {"event": "pipeline_latency", **summary}},
+                )
+    finally:
+        if trader is not None:
+            trader.close()
+    summary = stats.summary()
+    if trader is not None:
+        summary["live"] = live_stats.summary()
+    results.put(summary)
+    shutdown_logging()
+
+
+# --- 啟動 ---
+def run_pipeline(variants, live_orders=False, source=data_process, source_kwargs=None, duration=None, probe_every=0):
+    """
+    variants: [{"name": ..., "params": {...}, "live": bool}, ...] (params 覆蓋 STRATEGY_PARAMS)
+    duration: 執行秒數 (None 表示直到 Ctrl+C)；回傳下單行程的延遲統計
+    """
+    ring = SharedRing(capacity=RING_CAPACITY)
+    stop = mp.Event()
+    producer_done = mp.Event()  # 資料行程已結束 (讀取者不再等待新事件)
+    intents = mp.Queue()
+    results = mp.Queue()
+    executor = mp.Process(
+        target=execution_process,
+        args=(intents, results, ring.name if live_orders else None, producer_done),
+        name="execution",
+    )
+    workers = []
+    for i, config in enumerate(variants):
+        params = dict(live.STRATEGY_PARAMS)
+        params.update(config.get("params", {}))
+        workers.append(
+            mp.Process(
+                target=strategy_worker,
+                args=(ring.name, intents, producer_done, config.get("name", f"variant_{i}"), params, probe_every),
+                name=f"strategy-{i}",
+            )
+        )
+    feeder = mp.Process(target=source, args=(ring.name, stop), kwargs=source_kwargs or {}, name="data")
+
+    executor.start()
+    for worker in workers:
+        worker.start()
+    feeder.start()
+    logger.info(f"🚀 管線已啟動: 1 個資料行程, {len(workers)} 個策略行程, 下單行程 ({'實盤' if live_orders else '乾跑'})")
+    try:
+        if duration is None:
+            feeder.join()
+        else:
+            feeder.join(duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        feeder.join()
+        producer_done.set()
+        for worker in workers:
+            worker.join()
+        intents.put(None)
+        try:
+            summary = results.get(timeout=30)
+        except queue.Empty:
+            summary = None
+        executor.join()
+        ring.close()
+        ring.unlink()
+    return summary
+
+
+if __name__ == "__main__":
+    if "--benchmark" in sys.argv:
+        index = sys.argv.index("--benchmark")
+        seconds = float(sys.argv[index + 1]) if len(sys.argv) > index + 1 else 10.0
+        variants = [{"name": f"bench_{i}", "params": {"adx_threshold": 20 + i}} for i in range(4)]
+        summary = run_pipeline(variants, source=synthetic_data_process, duration=seconds, probe_every=10)
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        sys.exit(0)
+
+    variants = [{"name": "default", "params": {}}]
+    if "--variants" in sys.argv:
+        with open(sys.argv[sys.argv.index("--variants") + 1], "r", encoding="utf-8") as f:
+            variants += json.load(f)
+    summary = run_pipeline(variants, live_orders="--live" in sys.argv)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
@@ -0,0 +1,203 @@
+"""
+🔁 交易所狀態對帳
+- 一次取得交易所快照 (持倉、未成交訂單、近期成交、錢包餘額)，四個查詢並行送出；
+  每根K線的例行對帳可略過餘額 (餘額為 None，不比對也不更新資金)
+- 查詢期間持倉有變動 (updatedTime 晚於開始查詢時間) 時重新取得，避免使用前後不一致的資料
+- 與本地狀態比對產生結構化的變更集 (ChangeSet)；沒有差異時不寫檔也不輸出日誌，因此可以頻繁執行
+- 變更先套用到狀態副本，全部完成後才替換 (不會留下只改一半的狀態)
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from models import PositionState
+
+# 本地與交易所數值視為相同的誤差
+TOLERANCE = 1e-9
+
+
+def _to_float(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _result_list(endpoint, params):
+    """Bybit v5 回應的 result.list (沒有資料時為空列表)"""
+    response = endpoint(params)
+    return response.get("result", {}).get("list", []) or []
+
+
+class ExchangeSnapshot:
+    """交易所同一時間點的帳戶狀態 (Bybit v5 原始資料)"""
+
+    __slots__ = ("taken_at", "positions", "open_orders", "executions", "free_balance", "total_balance")
+
+    def __init__(
+        self, positions, open_orders=None, executions=None, free_balance=None, total_balance=None, taken_at=None
+    ):
+        """free_balance / total_balance 為 None 表示本次快照未查詢餘額"""
+        self.taken_at = taken_at if taken_at is not None else time.time()
+        self.positions = positions or []
+        self.open_orders = open_orders or []
+        self.executions = executions or []
+        self.free_balance = _to_float(free_balance, None)
+        self.total_balance = _to_float(total_balance, None)
+
+    @property
+    def position(self):
+        """(帶正負號的持倉量, 平均進場價, 標記價格)；無持倉時為 (0.0, None, None)"""
+        for pos in self.positions:
+            size = _to_float(pos.get("size"))
+            if size > 0:
+                avg_price = _to_float(pos.get("avgPrice"), None) or None
+                mark_price = _to_float(pos.get("markPrice"), None) or None
+                return (size if pos.get("side") == "Buy" else -size), avg_price, mark_price
+        return 0.0, None, None
+
+
+def take_snapshot(exchange, market_id, currency="USDT", execution_limit=50, max_attempts=2, include_balance=True):
+    """
+    並行查詢持倉、未成交訂單、近期成交與錢包餘額，任一查詢失敗時拋出例外。
+    查詢期間持倉有更新時重新取得 (最多 max_attempts 次，之後使用最後一次的結果)。
+    include_balance=False 時不查詢錢包餘額 (快照的餘額為 None)
+    """
+    params = {"category": "linear", "symbol": market_id}
+    snapshot = None
+    for _ in range(max_attempts):
+        started_ms = int(time.time() * 1000)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            positions = pool.submit(_result_list, exchange.private_get_v5_position_list, params)
+            open_orders = pool.submit(_result_list, exchange.private_get_v5_order_realtime, params)
+            executions = pool.submit(
+                _result_list,
+                exchange.private_get_v5_execution_list,
+                {**params, "limit": execution_limit},
+            )
+            balance = pool.submit(exchange.fetch_balance).result() if include_balance else None
+            snapshot = ExchangeSnapshot(
+                positions.result(),
+                open_orders.result(),
+                executions.result(),
+                balance["free"][currency] if balance else None,
+                balance["total"][currency] if balance else None,
+                taken_at=started_ms / 1000,
+            )
+        if not any(int(_to_float(p.get("updatedTime"))) >= started_ms for p in snapshot.positions):
+            break
+    return snapshot
+
+
+class Change:
+    __slots__ = ("kind", "field", "local", "remote")
+
+    def __init__(self, kind, field, local, remote):
+        self.kind = kind  # position / balance
+        self.field = field
+        self.local = local
+        self.remote = remote
+
+    def to_dict(self):
+        return {"kind": self.kind, "field": self.field, "local": self.local, "remote": self.remote}
+
+    def __repr__(self):
+        return f"{self.field}: {self.local} → {self.remote}"
+
+
+class ChangeSet:
+    """本地狀態與交易所快照的差異"""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.changes = []
+        self.filled_orders = []  # 待確認訂單已在成交紀錄中出現: (orderLinkId, orderId)
+        self.stray_orders = []  # 交易所上有、本地沒有紀錄的未成交訂單
+
+    def add(self, kind, field, local, remote):
+        self.changes.append(Change(kind, field, local, remote))
+
+    @property
+    def position_changed(self):
+        return any(c.kind == "position" for c in self.changes)
+
+    def __bool__(self):
+        """是否有需要保存與回報的差異 (只有可用資金變動不算)"""
+        return self.position_changed or bool(self.filled_orders)
+
+    def describe(self):
+        parts = [repr(c) for c in self.changes if c.kind == "position"]
+        parts += [f"訂單 {link_id} 已成交" for link_id, _ in self.filled_orders]
+        return ", ".join(parts)
+
+    def to_dict(self):
+        return {
+            "changes": [c.to_dict() for c in self.changes],
+            "filled_orders": [link_id for link_id, _ in self.filled_orders],
+            "stray_orders": [o.get("orderLinkId") or o.get("orderId") for o in self.stray_orders],
+        }
+
+
+def diff(state, snapshot, pending_orders=None):
+    """比對本地 PositionState (與待確認訂單表) 和交易所快照，回傳 ChangeSet"""
+    changes = ChangeSet(snapshot)
+
+    if snapshot.free_balance is not None and abs((state.current_capital or 0) - snapshot.free_balance) > TOLERANCE:
+        changes.add("balance", "current_capital", state.current_capital, snapshot.free_balance)
+
+    qty, avg_price, _ = snapshot.position
+    if qty == 0:
+        if state.position_size != 0 or state.long_entry_price is not None or state.short_entry_price is not None:
+            changes.add("position", "position_size", state.position_size, 0.0)
+    else:
+        entry_field, opposite_field = (
+            ("long_entry_price", "short_entry_price") if qty > 0 else ("short_entry_price", "long_entry_price")
+        )
+        local_entry = getattr(state, entry_field)
+        if abs(state.position_size - qty) > TOLERANCE:
+            changes.add("position", "position_size", state.position_size, qty)
+        if avg_price and (not local_entry or abs(local_entry - avg_price) > TOLERANCE):
+            changes.add("position", entry_field, local_entry, avg_price)
+        if getattr(state, opposite_field) is not None:
+            changes.add("position", opposite_field, getattr(state, opposite_field), None)
+
+    if pending_orders is not None:
+        executed = {}
+        for execution in snapshot.executions:
+            link_id = execution.get("orderLinkId")
+            if link_id:
+                executed[link_id] = execution.get("orderId")
+        for record in pending_orders.unresolved():
+            if record["link_id"] in executed:
+                changes.filled_orders.append((record["link_id"], executed[record["link_id"]]))
+        changes.stray_orders = [
+            o for o in snapshot.open_orders if o.get("orderLinkId") not in pending_orders
+        ]
+    return changes
+
+
+def apply_changes(state, changes):
+    """將變更集套用到狀態副本並回傳新的 PositionState (原狀態不變)"""
+    new_state = PositionState.from_dict(state.to_dict())
+    if changes.snapshot.free_balance is not None:
+        new_state.current_capital = changes.snapshot.free_balance
+    if not changes.position_changed:
+        return new_state
+
+    qty, avg_price, _ = changes.snapshot.position
+    if qty == 0:
+        new_state.reset_position()
+        return new_state
+
+    new_state.position_size = qty
+    if avg_price:
+        new_state.entry_price = avg_price
+    if qty > 0:
+        if avg_price:
+            new_state.long_entry_price = avg_price
+        new_state.reset_short()  # 清空空單狀態避免殘留
+    else:
+        if avg_price:
+            new_state.short_entry_price = avg_price
+        new_state.reset_long()  # 清空多單狀態避免殘留
+    return new_state
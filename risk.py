@@ -0,0 +1,227 @@
+"""
+🛡️ 投資組合風控引擎
+- 權益 = 錢包餘額 + 未實現盈虧；成交時更新持倉、已實現盈虧與手續費，標記價格變動時只重算該商品的未實現盈虧
+- 峰值權益與回撤隨每次更新增量計算，不需要每根K線查詢一次餘額
+- 下單前檢查最大回撤與曝險上限 (單一商品與全部商品合計，以權益倍數表示)
+- 餘額只在啟動與定期校正時以交易所資料重新對齊 (資金費率等引擎看不到的變動)
+"""
+
+
+class RiskLimits:
+    __slots__ = ("max_drawdown", "max_gross_exposure", "max_symbol_exposure")
+
+    def __init__(self, max_drawdown=None, max_gross_exposure=None, max_symbol_exposure=None):
+        """
+        max_drawdown: 目前回撤 (相對峰值權益) 達到此比例即停止新進場，None 表示不限制
+        max_gross_exposure: 所有商品名目價值合計 / 權益 的上限
+        max_symbol_exposure: 單一商品名目價值 / 權益 的上限
+        """
+        self.max_drawdown = max_drawdown
+        self.max_gross_exposure = max_gross_exposure
+        self.max_symbol_exposure = max_symbol_exposure
+
+
+class _Position:
+    __slots__ = ("qty", "avg_price", "mark_price")
+
+    def __init__(self):
+        self.qty = 0.0  # 正數為多單，負數為空單
+        self.avg_price = 0.0
+        self.mark_price = 0.0
+
+    @property
+    def unrealized(self):
+        if self.qty == 0:
+            return 0.0
+        return (self.mark_price - self.avg_price) * self.qty
+
+    @property
+    def notional(self):
+        return abs(self.qty) * self.mark_price
+
+
+class RiskEngine:
+    def __init__(self, limits=None, balance=0.0):
+        self.limits = limits or RiskLimits()
+        self.positions = {}  # 商品 → _Position
+        self.balance = float(balance)  # 錢包餘額 (不含未實現盈虧)
+        self.realized_pnl = 0.0
+        self.fees = 0.0
+        self.peak_equity = None
+        self.max_drawdown = 0.0
+        self._unrealized = 0.0  # 所有商品未實現盈虧合計
+        self._gross_notional = 0.0  # 所有商品名目價值合計
+        self._update_equity()
+
+    # --- 狀態更新 ---
+    def restore(self, peak_equity=None, max_drawdown=None):
+        """由持久化狀態恢復峰值權益與歷史最大回撤"""
+        if peak_equity:
+            self.peak_equity = max(self.peak_equity or 0.0, float(peak_equity))
+        if max_drawdown:
+            self.max_drawdown = max(self.max_drawdown, float(max_drawdown))
+        self._update_equity()
+
+    def sync_balance(self, balance):
+        """以交易所查詢到的錢包餘額重新對齊"""
+        self.balance = float(balance)
+        self._update_equity()
+
+    def set_position(self, symbol, qty, avg_price, mark_price=None):
+        """以交易所持倉直接設定 (啟動與定期校正時使用)"""
+        position = self._position(symbol)
+        self._remove_contribution(position)
+        position.qty = float(qty or 0.0)
+        position.avg_price = float(avg_price or 0.0) if position.qty else 0.0
+        if mark_price:
+            position.mark_price = float(mark_price)
+        elif not position.mark_price:
+            position.mark_price = position.avg_price
+        self._add_contribution(position)
+        self._update_equity()
+
+    def on_fill(self, symbol, side, qty, price, fee=0.0):
+        """
+        套用一筆成交，回傳此筆成交的已實現盈虧
+        side: buy / sell
+        """
+        position = self._position(symbol)
+        self._remove_contribution(position)
+
+        signed_qty = qty if side == "buy" else -qty
+        realized = 0.0
+        if position.qty == 0 or (position.qty > 0) == (signed_qty > 0):
+            # 開倉或加倉：更新平均成本
+            new_qty = position.qty + signed_qty
+            position.avg_price = (
+                position.avg_price * position.qty + price * signed_qty
+            ) / new_qty
+            position.qty = new_qty
+        else:
+            # 減倉、平倉或反手
+            closing_qty = min(abs(signed_qty), abs(position.qty))
+            direction = 1 if position.qty > 0 else -1
+            realized = (price - position.avg_price) * closing_qty * direction
+            position.qty += signed_qty
+            if abs(position.qty) < 1e-12:
+                position.qty = 0.0
+                position.avg_price = 0.0
+            elif (position.qty > 0) != (direction > 0):
+                position.avg_price = price  # 反手後剩餘部位以成交價為成本
+
+        position.mark_price = price
+        self.realized_pnl += realized
+        self.fees += fee
+        self.balance += realized - fee
+        self._add_contribution(position)
+        self._update_equity()
+        return realized
+
+    def on_mark(self, symbol, price):
+        """更新標記價格 (O(1)：只重算該商品的貢獻)"""
+        position = self.positions.get(symbol)
+        if position is None or not price:
+            return
+        if position.qty == 0:
+            position.mark_price = price
+            return
+        self._remove_contribution(position)
+        position.mark_price = price
+        self._add_contribution(position)
+        self._update_equity()
+
+    # --- 查詢 ---
+    @property
+    def unrealized_pnl(self):
+        return self._unrealized
+
+    @property
+    def equity(self):
+        return self.balance + self._unrealized
+
+    @property
+    def drawdown(self):
+        """目前回撤 (相對峰值權益)"""
+        if not self.peak_equity:
+            return 0.0
+        return max(0.0, (self.peak_equity - self.equity) / self.peak_equity)
+
+    @property
+    def halted(self):
+        """目前回撤已達上限，停止新進場"""
+        return self.limits.max_drawdown is not None and self.drawdown >= self.limits.max_drawdown
+
+    def check_order(self, symbol, side, qty, price):
+        """
+        檢查新進場訂單是否符合風控限制，回傳 (是否允許, 原因)
+        減倉方向的訂單不受曝險限制
+        """
+        if self.halted:
+            return False, f"目前回撤 {self.drawdown:.2%} 已達上限 {self.limits.max_drawdown:.2%}"
+
+        equity = self.equity
+        if equity <= 0:
+            return False, "權益不足"
+
+        position = self.positions.get(symbol)
+        current_qty = position.qty if position else 0.0
+        current_notional = abs(current_qty) * price
+        signed_qty = qty if side == "buy" else -qty
+        new_notional = abs(current_qty + signed_qty) * price
+        if new_notional <= current_notional:
+            return True, ""
+
+        symbol_limit = self.limits.max_symbol_exposure
+        if symbol_limit is not None and new_notional / equity > symbol_limit:
+            return False, f"{symbol} 曝險 {new_notional / equity:.2f}x 超過上限 {symbol_limit:.2f}x"
+
+        gross_limit = self.limits.max_gross_exposure
+        gross = self._gross_notional - (position.notional if position else 0.0) + new_notional
+        if gross_limit is not None and gross / equity > gross_limit:
+            return False, f"總曝險 {gross / equity:.2f}x 超過上限 {gross_limit:.2f}x"
+        return True, ""
+
+    def snapshot(self):
+        """即時風控快照 (只讀取已維護的數值，不做任何查詢)"""
+        equity = self.equity
+        return {
+            "equity": equity,
+            "balance": self.balance,
+            "realized_pnl": self.realized_pnl,
+            "unrealized_pnl": self._unrealized,
+            "fees": self.fees,
+            "peak_equity": self.peak_equity,
+            "drawdown": self.drawdown,
+            "max_drawdown": self.max_drawdown,
+            "gross_exposure": self._gross_notional / equity if equity > 0 else 0.0,
+            "positions": {
+                symbol: {"qty": p.qty, "avg_price": p.avg_price, "mark_price": p.mark_price}
+                for symbol, p in self.positions.items()
+                if p.qty
+            },
+            "halted": self.halted,
+        }
+
+    # --- 內部 ---
+    def _position(self, symbol):
+        position = self.positions.get(symbol)
+        if position is None:
+            position = self.positions[symbol] = _Position()
+        return position
+
+    def _remove_contribution(self, position):
+        self._unrealized -= position.unrealized
+        self._gross_notional -= position.notional
+
+    def _add_contribution(self, position):
+        self._unrealized += position.unrealized
+        self._gross_notional += position.notional
+
+    def _update_equity(self):
+        equity = self.equity
+        if self.peak_equity is None or equity > self.peak_equity:
+            self.peak_equity = equity
+        if self.peak_equity > 0:
+            self.max_drawdown = max(
+                self.max_drawdown, (self.peak_equity - equity) / self.peak_equity
+            )
@@ -0,0 +1,278 @@
+"""
+👥 影子交易 (紙上交易)
+- 多組參數變體與實盤共用同一份 1 分鐘 / 4 小時 K 線資料，不發出任何額外請求
+- 成交在本地以收盤價模擬 (含 taker 手續費)，持倉、移動停損與同一根 K 線的進出場順序與實盤相同；
+  下單數量以交易所數量精度 (qty_step) 無條件捨去
+- 所有變體的進場信號以參數陣列一次向量化計算 (與回測參數掃描相同機制)
+- 每個變體只保留最近的交易紀錄與彙總統計，記憶體用量固定
+"""
+
+import json
+import os
+from collections import deque
+
+import numpy as np
+
+from execution import round_down
+from models import BAR_FIELDS, PositionState
+from signals import LONG_ENTRY, SHORT_ENTRY
+
+DEFAULT_QTY_STEP = 0.01  # 取不到市場資訊時的數量精度 (ETH，與 amount_step 的預設值相同)
+
+
+class ShadowVariant:
+    """單一參數變體的模擬帳戶"""
+
+    __slots__ = (
+        "name",
+        "params",
+        "state",
+        "initial_capital",
+        "capital",
+        "qty_percent",
+        "lever",
+        "fee_rate",
+        "qty_step",
+        "fees",
+        "trade_count",
+        "wins",
+        "trades",
+        "peak_equity",
+        "max_drawdown",
+        "last_price",
+    )
+
+    def __init__(
+        self, name, params, initial_capital, qty_percent, lever, fee_rate, max_trades=50, qty_step=DEFAULT_QTY_STEP
+    ):
+        self.name = name
+        self.params = params
+        self.state = PositionState()
+        self.initial_capital = initial_capital
+        self.capital = initial_capital  # 已實現權益 (不含未實現盈虧)
+        self.qty_percent = qty_percent
+        self.lever = lever
+        self.fee_rate = fee_rate
+        self.qty_step = qty_step  # 交易所數量最小變動單位 (實盤以 amount_step 取得)
+        self.fees = 0.0
+        self.trade_count = 0
+        self.wins = 0
+        self.trades = deque(maxlen=max_trades)
+        self.peak_equity = initial_capital
+        self.max_drawdown = 0.0
+        self.last_price = None
+
+    # --- 1 分鐘：移動停損 (與 check_trailing_stop_only 相同) ---
+    def on_minute(self, bar):
+        self._mark(bar.close)
+        state, p = self.state, self.params
+        if state.position_size > 0:
+            state.long_peak = bar.high if state.long_peak is None else max(state.long_peak, bar.high)
+            if not state.is_long_trail_active and bar.close > state.long_entry_price * (
+                1 + p["long_trailing_activate_profit_percent"]
+            ):
+                state.long_trail_stop_price = state.long_entry_price * (
+                    1 + p["long_trailing_min_profit_percent"]
+                )
+                state.is_long_trail_active = True
+            if state.is_long_trail_active:
+                new_trail = max(
+                    state.long_peak * (1 - p["long_trailing_pullback_percent"]),
+                    state.long_entry_price * (1 + p["long_trailing_min_profit_percent"]),
+                )
+                state.long_trail_stop_price = max(state.long_trail_stop_price or 0, new_trail)
+                if bar.close <= state.long_trail_stop_price:
+                    self._exit(bar, "TRAIL_STOP")
+
+        elif state.position_size < 0:
+            state.short_trough = (
+                bar.low if state.short_trough is None else min(state.short_trough, bar.low)
+            )
+            if not state.is_short_trail_active and bar.close < state.short_entry_price * (
+                1 - p["short_trailing_activate_profit_percent"]
+            ):
+                state.short_trail_stop_price = state.short_entry_price * (
+                    1 - p["short_trailing_min_profit_percent"]
+                )
+                state.is_short_trail_active = True
+            if state.is_short_trail_active:
+                new_trail = min(
+                    state.short_trough * (1 + p["short_trailing_pullback_percent"]),
+                    state.short_entry_price * (1 - p["short_trailing_min_profit_percent"]),
+                )
+                state.short_trail_stop_price = min(
+                    state.short_trail_stop_price or float("inf"), new_trail
+                )
+                if bar.close >= state.short_trail_stop_price:
+                    self._exit(bar, "TRAIL_STOP")
+
+    # --- 4 小時收盤：固定停損與進場 (與 process_bar 相同) ---
+    def on_bar_close(self, bar, long_ready, short_ready):
+        """
+        處理順序與 process_bar 相同 (多單進場 → 多單停損 → 空單進場)：
+        多單固定停損後同一根只可進空單，空單固定停損後同一根不再進場
+        """
+        self._mark(bar.close)
+        state, p = self.state, self.params
+        fixed_exit = 0  # 本根K線固定停損出場的方向 (1 多單 / -1 空單)
+        if state.position_size > 0:
+            state.long_peak = bar.high if state.long_peak is None else max(state.long_peak, bar.high)
+            if bar.close <= state.long_entry_price * (1 - p["long_fixed_stop_loss_percent"]):
+                self._exit(bar, "FIXED_STOP")
+                fixed_exit = 1
+        elif state.position_size < 0:
+            state.short_trough = (
+                bar.low if state.short_trough is None else min(state.short_trough, bar.low)
+            )
+            if bar.close >= state.short_entry_price * (1 + p["short_fixed_stop_loss_percent"]):
+                self._exit(bar, "FIXED_STOP")
+                fixed_exit = -1
+
+        go_long = long_ready and fixed_exit == 0
+        go_short = short_ready and fixed_exit != -1
+        if state.position_size == 0 and (go_long or go_short):
+            qty = round_down(self.capital * self.qty_percent / 100 / bar.close * self.lever, self.qty_step)
+            if qty > 0:
+                self._enter(bar, qty if go_long else -qty)
+
+    # --- 模擬成交 ---
+    def _enter(self, bar, qty):
+        state = self.state
+        fee = abs(qty) * bar.close * self.fee_rate
+        self.capital -= fee
+        self.fees += fee
+        state.position_size = qty
+        state.entry_price = bar.close
+        if qty > 0:
+            state.long_entry_price = bar.close
+            state.long_peak = bar.high
+        else:
+            state.short_entry_price = bar.close
+            state.short_trough = bar.low
+
+    def _exit(self, bar, reason):
+        state = self.state
+        qty = state.position_size
+        fee = abs(qty) * bar.close * self.fee_rate
+        pnl = (bar.close - state.entry_price) * qty - fee
+        self.capital += pnl  # pnl 已扣除出場手續費
+        self.fees += fee
+        self.trade_count += 1
+        self.wins += pnl > 0
+        self.trades.append(
+            {
+                "time": str(bar.time),
+                "side": "long" if qty > 0 else "short",
+                "entry_price": state.entry_price,
+                "exit_price": bar.close,
+                "qty": abs(qty),
+                "pnl": pnl,
+                "reason": reason,
+            }
+        )
+        state.reset_position()
+        self._mark(bar.close)
+
+    def _mark(self, price):
+        self.last_price = price
+        equity = self.equity
+        if equity > self.peak_equity:
+            self.peak_equity = equity
+        elif self.peak_equity > 0:
+            self.max_drawdown = max(self.max_drawdown, (self.peak_equity - equity) / self.peak_equity)
+
+    @property
+    def equity(self):
+        state = self.state
+        if state.position_size == 0 or self.last_price is None:
+            return self.capital
+        return self.capital + (self.last_price - state.entry_price) * state.position_size
+
+    def summary(self):
+        return {
+            "name": self.name,
+            "equity": round(self.equity, 2),
+            "pnl": round(self.equity - self.initial_capital, 2),
+            "return": round((self.equity / self.initial_capital - 1) * 100, 2),
+            "trades": self.trade_count,
+            "win_rate": round(self.wins / self.trade_count * 100, 2) if self.trade_count else 0.0,
+            "max_drawdown": round(self.max_drawdown * 100, 2),
+            "fees": round(self.fees, 4),
+            "position_size": self.state.position_size,
+            "params": self.params,
+        }
+
+
+class ShadowBook:
+    """管理所有影子變體，接收與實盤相同的 K 線事件"""
+
+    def __init__(self, variants, results_file=None):
+        self.variants = list(variants)
+        self.results_file = results_file
+        self._thresholds = np.array(
+            [v.params["adx_threshold"] for v in self.variants], dtype=np.float64
+        )
+
+    @classmethod
+    def from_config(
+        cls, configs, base_params, initial_capital, qty_percent, lever, fee_rate, qty_step=DEFAULT_QTY_STEP, **kwargs
+    ):
+        """
+        configs: [{"name": ..., "params": {...覆蓋 base_params}, "qty_percent": 可選}, ...]
+        qty_step: 交易所數量精度 (所有變體共用)
+        """
+        variants = []
+        for i, config in enumerate(configs):
+            params = dict(base_params)
+            params.update(config.get("params", {}))
+            variants.append(
+                ShadowVariant(
+                    config.get("name", f"variant_{i}"),
+                    params,
+                    initial_capital,
+                    config.get("qty_percent", qty_percent),
+                    lever,
+                    fee_rate,
+                    qty_step=qty_step,
+                )
+            )
+        return cls(variants, **kwargs)
+
+    @classmethod
+    def load(cls, path, *args, **kwargs):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_config(json.load(f), *args, **kwargs)
+
+    def __len__(self):
+        return len(self.variants)
+
+    def on_minute(self, bar):
+        for variant in self.variants:
+            if variant.state.position_size != 0:
+                variant.on_minute(bar)
+
+    def on_bar_close(self, bar):
+        # 所有變體的進場信號一次計算：(變體數, 1) 的布林矩陣
+        columns = {f: np.array([getattr(bar, f)]) for f in BAR_FIELDS}
+        signal_params = {"adx_threshold": self._thresholds}
+        long_ready = LONG_ENTRY.evaluate(columns, signal_params)[:, 0]
+        short_ready = SHORT_ENTRY.evaluate(columns, signal_params)[:, 0]
+        for i, variant in enumerate(self.variants):
+            variant.on_bar_close(bar, bool(long_ready[i]), bool(short_ready[i]))
+
+    def summary(self):
+        """各變體的績效，依權益由高到低排序"""
+        return sorted((v.summary() for v in self.variants), key=lambda s: -s["equity"])
+
+    def save(self):
+        """寫入結果檔案 (暫存檔後替換)"""
+        if not self.results_file:
+            return False
+        tmp_path = self.results_file + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.results_file)
+            return True
+        except OSError:
+            return False
@@ -0,0 +1,129 @@
+"""
+🧵 共享記憶體環形緩衝區 (單一寫入者、多個讀取者)
+- 事件是固定大小的結構陣列元素 (時間、種類、OHLCV 與指標欄位、發布時間)，
+  寫入與讀取都是直接存取 multiprocessing.shared_memory，不經過序列化或 pipe
+- 每個槽位帶序號 (seqlock)：寫入前標記為 -1，寫完才填入序號；讀取者複製前後各檢查一次序號，
+  不會讀到寫到一半的事件
+- 讀取者各自保存游標；落後超過容量 (被寫入者套圈) 時跳到最舊仍存在的事件，並回報遺失筆數
+"""
+
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from models import BAR_FIELDS
+
+# 事件種類
+EVENT_TICK = 1  # 最新價格 (1 分鐘 K 線或報價)
+EVENT_BAR_CLOSE = 2  # 4 小時 K 線收盤 (含指標)
+EVENT_STOP = 9  # 資料行程結束
+
+EVENT_DTYPE = np.dtype(
+    [("seq", "<i8"), ("kind", "<i8"), ("time", "<i8"), ("received_ns", "<i8"), ("published_ns", "<i8")]
+    + [(f, "<f8") for f in BAR_FIELDS]
+)
+HEADER_DTYPE = np.dtype([("head", "<i8"), ("capacity", "<i8")])
+
+
+class SharedRing:
+    def __init__(self, name=None, capacity=4096, create=True):
+        """
+        create=True: 建立新的共享記憶體 (name 為 None 時自動命名)
+        create=False: 以 name 連接既有的緩衝區 (容量由標頭讀取)
+        """
+        if create:
+            size = HEADER_DTYPE.itemsize + EVENT_DTYPE.itemsize * capacity
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        self.header = np.ndarray(1, dtype=HEADER_DTYPE, buffer=self._shm.buf)
+        if create:
+            self.header["head"] = 0
+            self.header["capacity"] = capacity
+        self.capacity = int(self.header["capacity"][0])
+        self.slots = np.ndarray(
+            self.capacity, dtype=EVENT_DTYPE, buffer=self._shm.buf, offset=HEADER_DTYPE.itemsize
+        )
+        if create:
+            self.slots["seq"] = -1
+        self._owner = create
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def head(self):
+        """最後一筆已發布事件的序號 (尚無事件時為 0)"""
+        return int(self.header["head"][0])
+
+    def publish(self, kind, time_ms, values=None, received_ns=None):
+        """
+        寫入一筆事件並回傳序號 (只能由單一行程呼叫)
+        values: {欄位: 數值} 或 Bar，缺少的欄位為 NaN
+        """
+        seq = self.head + 1
+        slot = self.slots[seq % self.capacity]
+        slot["seq"] = -1
+        for field in BAR_FIELDS:
+            value = values.get(field) if isinstance(values, dict) else getattr(values, field, None)
+            slot[field] = np.nan if value is None else value
+        slot["kind"] = kind
+        slot["time"] = time_ms
+        slot["received_ns"] = received_ns or time.time_ns()
+        slot["published_ns"] = time.time_ns()
+        slot["seq"] = seq
+        self.header["head"] = seq
+        return seq
+
+    def close(self):
+        # 釋放 numpy 視圖後才能關閉共享記憶體
+        self.header = None
+        self.slots = None
+        self._shm.close()
+
+    def unlink(self):
+        if self._owner:
+            self._shm.unlink()
+
+
+class RingReader:
+    """讀取者游標：每次 read 回傳新的事件 (結構陣列副本)"""
+
+    def __init__(self, ring, from_start=False):
+        self.ring = ring
+        self.cursor = 0 if from_start else ring.head
+        self.dropped = 0  # 被套圈而遺失的事件數
+
+    def read(self, max_events=256):
+        ring = self.ring
+        head = ring.head
+        if head <= self.cursor:
+            return ring.slots[:0].copy()
+        oldest = head - ring.capacity + 1
+        if self.cursor + 1 < oldest:
+            self.dropped += oldest - self.cursor - 1
+            self.cursor = oldest - 1
+
+        end = min(head, self.cursor + max_events)
+        seqs = np.arange(self.cursor + 1, end + 1)
+        events = ring.slots[seqs % ring.capacity].copy()
+        # 複製後再確認一次序號：不符表示複製期間被覆寫 (讀取太慢)，捨棄並計入遺失
+        valid = events["seq"] == seqs
+        current = ring.slots["seq"][seqs % ring.capacity] == seqs
+        valid &= current
+        if not valid.all():
+            self.dropped += int((~valid).sum())
+            events = events[valid]
+        self.cursor = end
+        return events
+
+    def wait(self, timeout=1.0, poll_interval=0.0005):
+        """等到有新事件或逾時，回傳是否有新事件"""
+        deadline = time.monotonic() + timeout
+        while self.ring.head <= self.cursor:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(poll_interval)
+        return True
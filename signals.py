@@ -0,0 +1,132 @@
+"""
+🎯 進場信號規則引擎
+- 進場條件只在這裡宣告一次 (LONG_ENTRY / SHORT_ENTRY)
+- 同一組規則可用於：實時交易 (單根 Bar)、回測 (整段欄位陣列)、參數掃描 (參數陣列 × K 線陣列)
+- 規則編譯成 numpy 向量化比較，整段歷史一次計算完成，不需逐根 K 線在 Python 中判斷
+"""
+
+import operator
+
+import numpy as np
+
+_OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+
+class Param:
+    """引用策略參數 (例如 adx_threshold)，數值在計算時由 params 提供"""
+
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"Param({self.name!r})"
+
+
+class Rule:
+    """
+    單一比較條件: left <op> right
+    left: 欄位名稱
+    right: 欄位名稱、數字常數或 Param
+    """
+
+    __slots__ = ("left", "op", "right", "label")
+
+    def __init__(self, left, op, right, label=None):
+        if op not in _OPERATORS:
+            raise ValueError(f"不支援的比較運算子: {op}")
+        self.left = left
+        self.op = op
+        self.right = right
+        self.label = label or f"{left} {op} {right.name if isinstance(right, Param) else right}"
+
+    def _operand(self, source, value, params):
+        if isinstance(value, Param):
+            param = params[value.name]
+            if np.ndim(param) >= 1:
+                # 參數陣列 (k,) 轉成 (k, 1)，與 K 線陣列 (n,) 廣播為 (k, n)
+                return np.asarray(param, dtype=np.float64).reshape(-1, 1)
+            return param
+        if isinstance(value, str):
+            return source(value)
+        return value
+
+    def evaluate(self, source, params):
+        """source: 欄位名稱 → 數值/陣列 的函式"""
+        return _OPERATORS[self.op](
+            self._operand(source, self.left, params),
+            self._operand(source, self.right, params),
+        )
+
+    def __repr__(self):
+        return f"Rule({self.label!r})"
+
+
+class SignalSet:
+    """一組以 AND 串接的規則"""
+
+    def __init__(self, name, rules):
+        self.name = name
+        self.rules = tuple(rules)
+
+    def evaluate(self, columns, params):
+        """
+        向量化計算整段 K 線的信號。
+        columns: 欄位名稱 → numpy 陣列 (dict、BarBuffer 或 DataFrame)
+        params: 參數名稱 → 數值；若為陣列 (k,)，回傳 (k, n) 的布林矩陣供參數掃描使用
+        """
+        source = _column_source(columns)
+        result = None
+        for rule in self.rules:
+            mask = rule.evaluate(source, params)
+            result = mask if result is None else np.logical_and(result, mask)
+        return result
+
+    def evaluate_bar(self, bar, params):
+        """實時交易：判斷單根 Bar 是否符合所有規則"""
+        source = bar.__getattribute__
+        return all(bool(rule.evaluate(source, params)) for rule in self.rules)
+
+    def explain(self, bar, params):
+        """回傳每條規則在此 Bar 上的結果，用於日誌顯示"""
+        source = bar.__getattribute__
+        return {rule.label: bool(rule.evaluate(source, params)) for rule in self.rules}
+
+
+def _column_source(columns):
+    """將 dict / BarBuffer / DataFrame 統一成 欄位名稱 → numpy 陣列 的函式"""
+    if hasattr(columns, "column"):  # BarBuffer
+        return columns.column
+    if hasattr(columns, "to_numpy"):  # DataFrame
+        return lambda name: columns[name].to_numpy(dtype=np.float64)
+    return columns.__getitem__
+
+
+# --- 策略進場規則 (唯一定義處) ---
+LONG_ENTRY = SignalSet(
+    "long_entry",
+    [
+        Rule("close", ">", "ema90"),
+        Rule("low", ">", "ema90"),
+        Rule("close", ">", "ema200"),
+        Rule("adx", ">", Param("adx_threshold")),
+        Rule("rsi", "<=", 70),  # RSI高於70不進場
+    ],
+)
+
+SHORT_ENTRY = SignalSet(
+    "short_entry",
+    [
+        Rule("close", "<", "ema90"),
+        Rule("high", "<", "ema90"),
+        Rule("close", "<", "ema200"),
+        Rule("adx", ">", Param("adx_threshold")),
+        Rule("rsi", ">=", 30),  # RSI低於30不進場
+    ],
+)
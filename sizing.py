@@ -0,0 +1,73 @@
+"""
+📏 部位大小計算
+- fixed_percent: 以權益固定比例 × 槓桿 (原本的 DEFAULT_QTY_PERCENT 算法)
+- fixed_fractional_risk: 每筆交易承擔固定比例的風險，停損距離 = ATR × 倍數
+- volatility_target: 依 ATR 換算年化波動度，調整部位使持倉波動度接近目標值
+- 所有公式都只用 numpy 基本運算：實盤傳入單一數值 (O(1))，回測傳入整段陣列一次算完
+- 數量上限為 權益 × max_leverage / 價格
+"""
+
+import math
+
+import numpy as np
+
+BARS_PER_YEAR_4H = 6 * 365  # 4 小時 K 線每年根數
+
+
+def fixed_percent(capital, price, atr=None, qty_percent=70, lever=1):
+    """權益的 qty_percent% × 槓桿 (不使用 ATR)"""
+    return capital * qty_percent / 100 / price * lever
+
+
+def fixed_fractional_risk(capital, price, atr, risk_per_trade=0.01, atr_multiple=2.0, max_leverage=1):
+    """每筆交易風險 = 權益 × risk_per_trade，停損距離 = atr × atr_multiple"""
+    qty = capital * risk_per_trade / (atr * atr_multiple)
+    return np.minimum(qty, capital * max_leverage / price)
+
+
+def volatility_target(
+    capital, price, atr, target_volatility=0.5, bars_per_year=BARS_PER_YEAR_4H, max_leverage=1
+):
+    """
+    以 ATR / 價格 近似單根K線波動度並年化，名目價值 = 權益 × 目標波動度 / 年化波動度
+    target_volatility: 年化目標波動度 (0.5 = 50%)
+    """
+    annual_volatility = atr / price * math.sqrt(bars_per_year)
+    notional = capital * target_volatility / annual_volatility
+    return np.minimum(notional, capital * max_leverage) / price
+
+
+POLICIES = {
+    "fixed_percent": fixed_percent,
+    "fixed_fractional_risk": fixed_fractional_risk,
+    "volatility_target": volatility_target,
+}
+
+
+class SizingPolicy:
+    """部位大小策略：名稱 + 參數，qty() 同時支援單一數值與 numpy 陣列"""
+
+    __slots__ = ("name", "params", "_func")
+
+    def __init__(self, name, **params):
+        if name not in POLICIES:
+            raise ValueError(f"未知的部位大小策略: {name}")
+        self.name = name
+        self.params = params
+        self._func = POLICIES[name]
+
+    def qty(self, capital, price, atr=None):
+        """
+        未捨去的下單數量；ATR 缺值 (NaN) 或非正數時回傳 0
+        capital/price/atr 可為數值或等長陣列
+        """
+        if self.name == "fixed_percent":
+            return self._func(capital, price, **self.params)
+        atr = np.asarray(atr, dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            qty = self._func(capital, price, atr, **self.params)
+        qty = np.where(np.isfinite(qty) & (atr > 0), qty, 0.0)
+        return float(qty) if qty.ndim == 0 else qty
+
+    def __repr__(self):
+        return f"SizingPolicy({self.name!r}, {self.params})"
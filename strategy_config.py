@@ -0,0 +1,28 @@
+"""
+🔧 策略參數 (實盤與回測共用)
+- 只有常數，沒有任何匯入副作用；API 金鑰、執行模式等實盤設定仍在 eth_strategy_4h_autotrading.py
+"""
+
+SYMBOL = "ETH/USDT"
+TIMEFRAME = "4h"
+
+# 資金管理設定
+DEFAULT_QTY_PERCENT = 70  # 每次交易使用帳戶可用餘額的百分比
+LEVER = 1 # 如果需要槓桿，從此修改，並在bybitAPP也修改為相同槓桿倍數
+
+# 🏆 最佳策略參數 (2020-2025年優化結果，穩定性評分48.38)
+STRATEGY_PARAMS = {
+    "adx_threshold": 26,  # 更嚴格的趨勢判斷
+    "long_fixed_stop_loss_percent": 0.019,  # 1.9%
+    "long_trailing_activate_profit_percent": 0.011,  # 1.1%
+    "long_trailing_pullback_percent": 0.054,  # 5.4%
+    "long_trailing_min_profit_percent": 0.011,  # 1.1%
+    "short_fixed_stop_loss_percent": 0.013,  # 1.3%
+    "short_trailing_activate_profit_percent": 0.019,  # 1.9%
+    "short_trailing_pullback_percent": 0.018,  # 1.8%
+    "short_trailing_min_profit_percent": 0.016,  # 1.6%
+}
+
+# 手續費率
+TAKER_FEE_RATE = 0.00055  # Bybit 線性合約 taker 手續費率
+MAKER_FEE_RATE = 0.0002  # Bybit 線性合約 maker 手續費率
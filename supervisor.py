@@ -0,0 +1,131 @@
+"""
+🔁 崩潰恢復監督程式
+用法: python supervisor.py
+- 以子程序執行 eth_strategy_4h_autotrading.py，異常退出或心跳逾時即自動重啟
+- 重啟採用指數退避，子程序穩定運行一段時間後重置退避時間
+- 子程序以非互動模式 + FAST_START 啟動，並從移動停損日誌 (trail_journal.jsonl) 恢復峰值/谷值
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from logging_config import setup_logging
+
+WORKER_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "eth_strategy_4h_autotrading.py"
+)
+HEARTBEAT_FILE = "worker_heartbeat"  # 子程序定期更新的心跳檔案
+HEARTBEAT_TIMEOUT_SECONDS = 300  # 超過此時間未更新心跳視為卡死 (主循環錯誤時最長等待120秒)
+RESTART_BACKOFF_INITIAL_SECONDS = 1  # 第一次重啟前等待時間
+RESTART_BACKOFF_MAX_SECONDS = 60  # 重啟等待時間上限
+STABLE_RUN_SECONDS = 600  # 運行超過10分鐘視為穩定，重置退避時間
+POLL_SECONDS = 1
+
+logger = setup_logging(
+    name="autotrader.supervisor",
+    log_file=os.getenv("SUPERVISOR_LOG_FILE", "logs/supervisor.log"),
+)
+
+
+def _terminate(proc, timeout=10):
+    """先嘗試正常結束子程序，逾時後強制終止"""
+    if proc.poll() is not None:
+        return
+    proc.terminate()
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def _heartbeat_stale(started_at):
+    """心跳檔案超過逾時未更新；子程序尚未寫入第一次心跳時以啟動時間起算"""
+    try:
+        last_beat = os.path.getmtime(HEARTBEAT_FILE)
+    except OSError:
+        last_beat = started_at
+    return time.time() - max(last_beat, started_at) > HEARTBEAT_TIMEOUT_SECONDS
+
+
+def _wait_worker(proc, should_stop):
+    """等待子程序結束，回傳退出碼；收到停止訊號時回傳 None"""
+    started_at = time.time()
+    while True:
+        exit_code = proc.poll()
+        if exit_code is not None:
+            return exit_code
+        if should_stop():
+            return None
+        if _heartbeat_stale(started_at):
+            logger.error(
+                f"❌ 子程序心跳逾時 {HEARTBEAT_TIMEOUT_SECONDS} 秒，強制重啟 (pid={proc.pid})"
+            )
+            _terminate(proc)
+            return proc.returncode if proc.returncode else -1
+        time.sleep(POLL_SECONDS)
+
+
+def run_supervisor():
+    """監督主循環：子程序正常退出 (code 0) 或收到停止訊號時結束"""
+    stopping = False
+
+    def handle_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    backoff = RESTART_BACKOFF_INITIAL_SECONDS
+    restarts = 0
+
+    while not stopping:
+        try:
+            os.remove(HEARTBEAT_FILE)
+        except OSError:
+            pass
+
+        env = dict(os.environ, FAST_START="1", HEARTBEAT_FILE=HEARTBEAT_FILE)
+        started = time.monotonic()
+        proc = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT], stdin=subprocess.DEVNULL, env=env
+        )
+        logger.info(
+            f"🚀 交易子程序已啟動 (pid={proc.pid}, 重啟次數={restarts})",
+            extra={"fields": {"event": "worker_started", "pid": proc.pid, "restarts": restarts}},
+        )
+
+        exit_code = _wait_worker(proc, lambda: stopping)
+        if exit_code is None:
+            logger.info("🛑 收到停止訊號，結束交易子程序...")
+            _terminate(proc)
+            break
+        if exit_code == 0:
+            logger.info("✅ 交易子程序正常結束，監督程式退出")
+            break
+
+        uptime = time.monotonic() - started
+        if uptime >= STABLE_RUN_SECONDS:
+            backoff = RESTART_BACKOFF_INITIAL_SECONDS
+        logger.warning(
+            f"⚠️ 交易子程序異常退出 (code={exit_code})，已運行 {uptime:.0f} 秒，{backoff} 秒後重啟",
+            extra={
+                "fields": {
+                    "event": "worker_exited",
+                    "exit_code": exit_code,
+                    "uptime_seconds": uptime,
+                    "backoff_seconds": backoff,
+                }
+            },
+        )
+        time.sleep(backoff)
+        backoff = min(backoff * 2, RESTART_BACKOFF_MAX_SECONDS)
+        restarts += 1
+
+
+if __name__ == "__main__":
+    run_supervisor()
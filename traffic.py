@@ -0,0 +1,362 @@
+"""
+📼 交易所流量錄製與重播
+- 錄製：包裝 ccxt 實例，每次網路請求 (fetch_* / create_* / cancel_* / private_* / load_markets ...)
+  的參數、回應或例外與耗時都追加寫入一個 JSON Lines 檔 (檔名以 .gz 結尾時以 gzip 壓縮)；
+  同時記錄驅動策略的事件 (4 小時收盤、每分鐘停損檢查) 與啟動時的本地狀態檔
+- 重播：ReplayExchange 依錄製順序回傳同一個方法的回應，在暫存目錄以最快速度重新執行
+  TradingStrategy 的完整決策流程 (不等待、不連網)，比對下單請求是否與錄製時相同，並回報耗時
+- 回應依 (實例, 方法) 排隊；參數完全相同的紀錄優先，其次取最早的一筆
+
+用法: TRAFFIC_RECORD_FILE=traffic.jsonl.gz python eth_strategy_4h_autotrading.py   (錄製)
+      python traffic.py traffic.jsonl.gz                                          (重播並比對)
+"""
+
+import gzip
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+
+# 會發出網路請求的方法；其他方法 (market、amount_to_precision...) 直接使用本地實作，不錄製
+NETWORK_PREFIXES = ("fetch_", "create_", "cancel_", "edit_", "private_", "public_")
+NETWORK_METHODS = ("load_markets", "load_time_difference")
+ORDER_METHODS = ("create_order", "private_post_v5_order_create")
+STARTUP_FILE_TAIL_BYTES = 64 * 1024  # 啟動狀態檔最多保存的尾端位元組 (append-only 日誌只需最後幾筆)
+
+
+def is_network_method(name):
+    return name.startswith(NETWORK_PREFIXES) or name in NETWORK_METHODS
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _bar_to_dict(bar):
+    values = bar.to_dict()
+    values["time"] = int(bar.time.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    return values
+
+
+def _bar_from_dict(values):
+    from models import Bar
+
+    values = dict(values)
+    time_ = datetime.fromtimestamp(values.pop("time") / 1000, tz=timezone.utc).replace(tzinfo=None)
+    return Bar(time_, **values)
+
+
+class TrafficRecorder:
+    """append-only 錄製檔寫入者 (多執行緒共用)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._file = None
+        self._seq = 0
+
+    def _write(self, record):
+        with self._lock:
+            self._seq += 1
+            line = json.dumps({"n": self._seq, **record}, separators=(",", ":"), ensure_ascii=False, default=str)
+            try:
+                if self._file is None:
+                    self._file = _open(self.path, "a")
+                self._file.write(line + "\n")
+                self._file.flush()
+            except OSError:
+                self.close()
+
+    def wrap(self, exchange, label):
+        """回傳錄製 exchange 網路請求的代理；label 區分同一個錄製檔中的多個實例"""
+        return RecordingExchange(exchange, label, self)
+
+    def call(self, label, method, args, kwargs, started, result=None, error=None):
+        record = {"k": "call", "x": label, "m": method, "a": args, "kw": kwargs, "t": started,
+                  "d": round(time.time() - started, 6)}
+        if error is not None:
+            record["e"] = [type(error).__name__, str(error)]
+        else:
+            record["r"] = result
+        self._write(record)
+
+    def event(self, name, bar):
+        """驅動策略的事件 (process_bar / check_trailing_stop_only)"""
+        self._write({"k": "event", "m": name, "bar": _bar_to_dict(bar) if bar is not None else None, "t": time.time()})
+
+    def startup_files(self, paths):
+        """保存啟動時的本地狀態檔 (重播時先寫回暫存目錄)"""
+        files = {}
+        for path in paths:
+            try:
+                with open(path, "rb") as f:
+                    f.seek(max(0, os.path.getsize(path) - STARTUP_FILE_TAIL_BYTES))
+                    content = f.read().decode("utf-8", errors="ignore")
+            except OSError:
+                continue
+            if os.path.getsize(path) > STARTUP_FILE_TAIL_BYTES:
+                content = content.split("\n", 1)[-1]  # 捨棄被截斷的第一行
+            files[path] = content
+        self._write({"k": "files", "files": files, "t": time.time()})
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                try:
+                    self._file.close()
+                except OSError:
+                    pass
+                self._file = None
+
+
+class RecordingExchange:
+    """ccxt 實例的代理：網路請求寫入錄製檔，其他屬性與方法直接轉給原實例"""
+
+    def __init__(self, exchange, label, recorder):
+        self._exchange = exchange
+        self._label = label
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        attr = getattr(self._exchange, name)
+        if name == "set_markets":
+            def set_markets(markets, *args, **kwargs):
+                started = time.time()
+                result = attr(markets, *args, **kwargs)
+                self._recorder.call(self._label, name, [markets], {}, started, None)
+                return result
+
+            return set_markets
+        if not callable(attr) or not is_network_method(name):
+            return attr
+
+        def recorded(*args, **kwargs):
+            started = time.time()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                self._recorder.call(self._label, name, list(args), kwargs, started, error=e)
+                raise
+            self._recorder.call(self._label, name, list(args), kwargs, started, result)
+            return result
+
+        return recorded
+
+
+# --- 重播 ---
+def load_records(path):
+    records = []
+    with _open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue  # 錄製中斷時最後一行可能不完整
+    return records
+
+
+class ReplayMiss(Exception):
+    """錄製檔中沒有對應的回應"""
+
+
+def _args_key(args, kwargs):
+    return json.dumps([args, kwargs], sort_keys=True, default=str)
+
+
+class ReplayExchange:
+    """
+    以錄製的回應取代網路請求；本地方法 (market、精度換算...) 使用 local (未連線的 ccxt 實例)
+    下單請求另外記錄在 orders，供與錄製時比對
+    """
+
+    def __init__(self, records, label, local=None):
+        self._label = label
+        self._local = local
+        self._queues = defaultdict(deque)
+        self._lock = threading.Lock()
+        self.orders = []
+        self.served = 0
+        self.misses = []
+        for record in records:
+            if record.get("k") == "call" and record.get("x") == label:
+                if record["m"] == "set_markets":
+                    if local is not None and not local.markets:
+                        local.set_markets(record["a"][0])
+                    continue
+                if record["m"] == "load_markets" and local is not None and not local.markets and "r" in record:
+                    local.set_markets(list(record["r"].values()))
+                self._queues[record["m"]].append(record)
+
+    def __getattr__(self, name):
+        if not is_network_method(name):
+            if self._local is None:
+                raise AttributeError(name)
+            return getattr(self._local, name)
+
+        def replayed(*args, **kwargs):
+            if name in ORDER_METHODS:
+                self.orders.append(_order_key(name, list(args), kwargs))
+            record = self._pop(name, list(args), kwargs)
+            if record is None:
+                self.misses.append(name)
+                raise ReplayMiss(f"錄製檔沒有 {self._label}.{name} 的回應")
+            self.served += 1
+            if "e" in record:
+                raise _error_class(record["e"][0])(record["e"][1])
+            if name == "load_markets" and self._local is not None:
+                return self._local.markets
+            return record.get("r")
+
+        return replayed
+
+    def _pop(self, name, args, kwargs):
+        with self._lock:
+            queue = self._queues.get(name)
+            if not queue:
+                return None
+            key = _args_key(args, kwargs)
+            for i, record in enumerate(queue):
+                if _args_key(record.get("a", []), record.get("kw", {})) == key:
+                    del queue[i]
+                    return record
+            return queue.popleft()
+
+    @property
+    def unused(self):
+        return sum(len(q) for q in self._queues.values())
+
+
+def _order_key(method, args, kwargs):
+    """下單請求中與決策有關的部分 (orderLinkId 等含時間的欄位不比較)"""
+    if method == "create_order":
+        params = dict(zip(("symbol", "type", "side", "amount", "price"), args))
+        params.update({k: v for k, v in kwargs.items() if k != "params"})
+        return (params.get("side"), params.get("type"), float(params.get("amount") or 0))
+    request = args[0] if args else kwargs.get("params", {})
+    return (str(request.get("side", "")).lower(), str(request.get("orderType", "")).lower(), float(request.get("qty") or 0))
+
+
+def _error_class(name):
+    try:
+        import ccxt
+
+        cls = getattr(ccxt, name, None)
+        if isinstance(cls, type) and issubclass(cls, Exception):
+            return cls
+    except ImportError:
+        pass
+    return Exception
+
+
+@contextmanager
+def _patched(obj, name, value):
+    """暫時替換 obj.name，離開時還原 (原本不在 obj 自身屬性中的則刪除，例如延遲載入代理轉發的屬性)"""
+    own = vars(obj)
+    had = name in own
+    original = own.get(name)
+    setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        if had:
+            setattr(obj, name, original)
+        else:
+            delattr(obj, name)
+
+
+def replay(path, workdir=None, verbose=False):
+    """
+    在 workdir (預設為新的暫存目錄) 以錄製檔重新執行策略的完整決策流程，回傳報告 dict
+    重播期間替換的全域狀態 (工作目錄、time.sleep、交易所建構函式、日誌等級) 在結束時全部還原
+    """
+    records = load_records(path)
+    path = os.path.abspath(path)
+    workdir = workdir or tempfile.mkdtemp(prefix="replay_")
+    with ExitStack() as stack:
+        stack.callback(os.chdir, os.getcwd())
+        os.chdir(workdir)
+        for record in records:
+            if record.get("k") == "files":
+                for name, content in record["files"].items():
+                    with open(name, "w", encoding="utf-8") as f:
+                        f.write(content)
+                break
+
+        import eth_strategy_4h_autotrading as live
+
+        if not verbose:
+            stack.callback(live.logger.setLevel, live.logger.level)
+            live.logger.setLevel(logging.CRITICAL)  # 子 logger (autotrader.*) 也一併靜音
+
+        local = live.ccxt.bybit({"options": {"defaultType": "linear"}})
+        private = ReplayExchange(records, "private", local)
+        public = ReplayExchange(records, "public", local)
+        stack.enter_context(_patched(live, "TRAFFIC_RECORDER", None))
+        stack.enter_context(_patched(time, "sleep", lambda seconds: None))  # 下單確認等固定等待在重播時略過
+        stack.enter_context(_patched(live.ccxt, "bybit", lambda config=None: private))
+        stack.enter_context(_patched(live, "_public_exchange", public))
+        return _run_replay(live, records, private, public, workdir)
+
+
+def _run_replay(live, records, private, public, workdir):
+    """依錄製的事件驅動 TradingStrategy，回傳報告 dict (由 replay 在替換好的環境中呼叫)"""
+    started = time.perf_counter()
+    strategy = live.TradingStrategy()
+    init_seconds = time.perf_counter() - started
+
+    latencies = []
+    for record in records:
+        if record.get("k") != "event":
+            continue
+        bar = _bar_from_dict(record["bar"]) if record.get("bar") else None
+        event_start = time.perf_counter()
+        if record["m"] == "process_bar":
+            strategy.process_bar(bar)
+        else:
+            strategy.check_trailing_stop_only(bar)
+        latencies.append(time.perf_counter() - event_start)
+    elapsed = time.perf_counter() - started
+
+    recorded_orders = [
+        _order_key(r["m"], r.get("a", []), r.get("kw", {}))
+        for r in records
+        if r.get("k") == "call" and r.get("x") == "private" and r["m"] in ORDER_METHODS
+    ]
+    decision_seconds = sum(latencies)
+    latencies.sort()
+    return {
+        "events": len(latencies),
+        "exchange_calls": private.served + public.served,
+        "misses": private.misses + public.misses,
+        "unused_responses": private.unused + public.unused,
+        "orders": private.orders,
+        "recorded_orders": recorded_orders,
+        "orders_match": private.orders == recorded_orders,
+        "init_seconds": round(init_seconds, 4),
+        "elapsed_seconds": round(elapsed, 4),
+        "events_per_second": round(len(latencies) / decision_seconds, 1) if decision_seconds else None,
+        "event_p50_ms": round(latencies[len(latencies) // 2] * 1000, 3) if latencies else None,
+        "event_max_ms": round(latencies[-1] * 1000, 3) if latencies else None,
+        "final_position": strategy.state.position_size,
+        "workdir": workdir,
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python traffic.py <錄製檔> [--verbose]")
+        sys.exit(1)
+    report = replay(sys.argv[1], verbose="--verbose" in sys.argv)
+    print(json.dumps(report, ensure_ascii=False, indent=2, default=str))
+    sys.exit(0 if report["orders_match"] and not report["misses"] else 1)
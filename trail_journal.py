@@ -0,0 +1,100 @@
+"""
+🛡️ 移動停損狀態日誌 (append-only)
+- 每次峰值/谷值或移動停損價變動時追加一行 JSON 並 fsync，崩潰重啟後可精確恢復
+- 只追加不重寫，比每次覆寫整份 strategy_state.json 便宜，也不會在寫入中途損毀舊紀錄
+- 紀錄數超過上限時壓縮為最後一筆
+"""
+
+import json
+import os
+import time
+
+# 讀取最後一筆紀錄時，從檔尾往前讀取的位元組數 (單筆紀錄約200位元組)
+_TAIL_BYTES = 8192
+
+
+class TrailJournal:
+    def __init__(self, path, fsync=True, max_records=5000):
+        """
+        path: 日誌檔案路徑
+        fsync: 每次寫入後是否 fsync (確保斷電/崩潰後資料仍在)
+        max_records: 超過此筆數時壓縮日誌
+        """
+        self.path = path
+        self.fsync = fsync
+        self.max_records = max_records
+        self._file = None
+        self._records = 0
+        self._last_key = None
+
+    def append(self, record):
+        """追加一筆紀錄；內容與上一筆相同時略過 (只比較狀態欄位，不比較時間)"""
+        key = tuple(sorted(record.items()))
+        if key == self._last_key:
+            return False
+
+        payload = dict(record, ts=time.time())
+        line = json.dumps(payload, separators=(",", ":")) + "\n"
+        try:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+                if self._file.tell() > 0 and not self._ends_with_newline():
+                    # 上次崩潰留下寫到一半的行，先換行避免與新紀錄黏在一起
+                    self._file.write("\n")
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        except OSError:
+            self.close()
+            raise
+
+        self._last_key = key
+        self._records += 1
+        if self._records >= self.max_records:
+            self.compact(payload)
+        return True
+
+    def _ends_with_newline(self):
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def load_last(self):
+        """讀取最後一筆完整紀錄，檔案不存在或無有效紀錄時回傳 None"""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - _TAIL_BYTES))
+            tail = f.read().decode("utf-8", errors="ignore")
+
+        # 由後往前解析，跳過崩潰時寫到一半的最後一行
+        for line in reversed(tail.splitlines()):
+            try:
+                return json.loads(line)
+            except ValueError:
+                continue
+        return None
+
+    def compact(self, last_record=None):
+        """將日誌壓縮成只剩最後一筆紀錄 (寫入暫存檔後原子替換)"""
+        if last_record is None:
+            last_record = self.load_last()
+        self.close()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            if last_record is not None:
+                f.write(json.dumps(last_record, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._records = 1 if last_record is not None else 0
+
+    def close(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            finally:
+                self._file = None